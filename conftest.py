@@ -0,0 +1,24 @@
+"""pytest fixtures shared by tests/: the repository root on sys.path and the sample capture."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SAMPLE = os.path.join(ROOT, 'tsip10.bin')
+
+
+@pytest.fixture
+def sample():
+    """Path of tsip10.bin, the capture shipped with the repository."""
+    return SAMPLE
+
+
+@pytest.fixture
+def run():
+    """run(script, *args, stdin=None) runs a script of the repository; returns the CompletedProcess."""
+    def run(script, *args, stdin=None, timeout=60):
+        return subprocess.run([sys.executable, os.path.join(ROOT, script), *map(str, args)], cwd=ROOT,
+                              stdin=stdin, capture_output=True, text=True, timeout=timeout)
+    return run
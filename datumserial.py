@@ -5,12 +5,20 @@
 #   - Error handling
 #   - Comment Documentation assistance
 
-import serial
-import struct
-from datetime import datetime, timedelta
 import argparse
 import sys
 import math
+import os
+import re
+import stat
+import time
+from collections import Counter, deque
+from functools import partial
+from tsip.capture import COMPRESSIONS, available_compressions, open_reader
+from tsip.command import CommandScheduler, frame_command, parse_command, parse_poll
+from tsip.decode import TSIPDeframer
+from tsip.output import FORMATS, BatchWriter, binary_record, changes_line, csv_line, ndjson_line, signal_stats_line
+from tsip.schema import REPORTS, MalformedPacket, UnknownPacket, decode_packet, id_filter, parse_ids, skipped_summary
 # Color codes for console output
 WHITE = "\033[97m"
 GREEN = "\033[92m"
@@ -18,396 +26,448 @@ RED = "\033[91m"
 BLUE = "\033[94m"
 YELLOW = "\033[93m"
 RESET = "\033[0m"
+COLORS = (WHITE, GREEN, RED, BLUE, YELLOW, RESET)
+
+def set_color(enabled):
+    """Turns the ANSI color codes above on or off (off for plain text output)."""
+    global WHITE, GREEN, RED, BLUE, YELLOW, RESET
+    WHITE, GREEN, RED, BLUE, YELLOW, RESET = COLORS if enabled else ("",) * len(COLORS)
 
 # Constants for TSIP framing
 DLE = 0x10  # Data Link Escape
 ETX = 0x03  # End of Text
 
+# Largest read from a file or stdin
+READ_SIZE = 65536
+
 # Global debug flag
 DEBUG = False
 
+# Full GPS week the data cannot be later than, for the 10-bit week rollover
+# (None: the current week; main() uses a capture file's modification time)
+REFERENCE_WEEK = None
+
+def is_serial(source):
+    """True for an open serial port.
+
+    pyserial is imported only when a port is opened, so until then nothing is one.
+    """
+    serial = sys.modules.get('serial')
+    return serial is not None and isinstance(source, serial.Serial)
+
+def serial_errors():
+    """pyserial's SerialException once a port has been opened, else () to catch nothing."""
+    serial = sys.modules.get('serial')
+    return serial.SerialException if serial is not None else ()
+
 def send_tsip_packet(output, packet_id, data=b''):
     """Sends a TSIP command packet with proper DLE stuffing (serial only)."""
-    if not isinstance(output, serial.Serial):
+    if not is_serial(output):
         print(f"{YELLOW}Warning: Sending packets is only supported for serial ports, not files{RESET}")
         return
-    packet = bytearray([packet_id]) + bytearray(data)
-    framed_packet = bytearray([DLE])
-    for byte in packet:
-        framed_packet.append(byte)
-        if byte == DLE:
-            framed_packet.append(DLE)  # Stuff an extra DLE
-    framed_packet.extend([DLE, ETX])
+    framed_packet = frame_command(packet_id, data)  # DLE-stuffed
     if DEBUG:
         print(f"{WHITE}Debug: Sending packet, ID=0x{packet_id:02X}, data={data.hex()}, framed={framed_packet.hex()}{RESET}")
     output.write(framed_packet)
 
-def read_tsip_packet(input_source, buffer_queue=None):
-    """Reads a single TSIP packet, ignoring bytes until a valid <DLE>...<DLE><ETX> pair is found."""
-    if buffer_queue is None:
-        buffer_queue = bytearray()
-    packet_buffer = bytearray()
-    raw_buffer = bytearray()
-    state = 0  # 0: Looking for DLE, 1: Reading ID, 2: Reading data until DLE ETX
+class ChunkQueue:
+    """Bounded FIFO of raw chunks between the reader thread and the decoder.
 
-    while True:
-        if buffer_queue:  # Process buffered data first
-            byte = bytes([buffer_queue.pop(0)])
-        else:
-            if isinstance(input_source, serial.Serial):
-                byte = input_source.read(1)
-            else:  # File input
-                byte = input_source.read(1)
-                if not byte:  # End of file
-                    if packet_buffer:
-                        print(f"{YELLOW}Reached EOF with incomplete packet{RESET}")
-                    return None
-            if not byte:
-                print(f"{YELLOW}Timeout or no data received{RESET}")
-                return None
-
-        b = byte[0]
-        raw_buffer.append(b)
-
-        if state == 0:  # Looking for start of packet (DLE)
-            if b == DLE:
-                state = 1  # Found potential start
-            else:
-                if DEBUG:
-                    print(f"{WHITE}Debug: Skipping non-DLE byte: 0x{b:02X}{RESET}")
-                continue  # Skip until DLE
-        elif state == 1:  # Expecting packet ID after DLE
-            if b == DLE:  # Double DLE, stay in state 1
-                continue
-            packet_buffer.append(b)  # Packet ID
-            state = 2  # Move to reading data
-        elif state == 2:  # Reading packet data
-            if b == DLE:
-                next_byte = input_source.read(1) if not buffer_queue else bytes([buffer_queue.pop(0)])
-                if not next_byte:
-                    print(f"{RED}Unexpected end of packet{RESET}")
-                    return None
-                next_byte = next_byte[0]
-                raw_buffer.append(next_byte)
-                if next_byte == ETX:  # End of packet
-                    excess = raw_buffer[len(raw_buffer) - raw_buffer[::-1].index(DLE) - 1:]
-                    if len(excess) > 2:
-                        buffer_queue.extend(excess[2:])
-                    if DEBUG:
-                        print(f"{WHITE}Debug: Packet read, length={len(packet_buffer)}, data={packet_buffer.hex()}, raw={raw_buffer.hex()}, buffered={buffer_queue.hex()}{RESET}")
-                    return bytes(packet_buffer)
-                elif next_byte == DLE:  # DLE stuffing
-                    packet_buffer.append(DLE)
-                else:  # Treat as data
-                    packet_buffer.append(DLE)
-                    packet_buffer.append(next_byte)
-            else:
-                packet_buffer.append(b)
+    Holds at most capacity bytes.  When a put() would exceed that, policy says
+    what gives: 'block' waits for the decoder (and so throttles the reader),
+    'drop-oldest' throws away the oldest chunks, and 'spill' appends to a
+    temporary file that get() drains, in order, once memory is empty.  depth,
+    max_depth, dropped_bytes and spilled_bytes count what happened.
+    """
+    POLICIES = ('block', 'drop-oldest', 'spill')
+
+    def __init__(self, capacity=1 << 20, policy='spill', spill_dir=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown queue policy {policy!r}")
+        self.capacity = capacity
+        self.policy = policy
+        self._spill_dir = spill_dir
+        import threading
+        self._chunks = deque()
+        self._ready = threading.Condition()
+        self._spill = None
+        self._spill_read = 0
+        self._spill_write = 0
+        self.closed = False
+        self.depth = 0
+        self.max_depth = 0
+        self.dropped_bytes = 0
+        self.spilled_bytes = 0
+
+    def put(self, chunk):
+        """Queues chunk from the reader; only the 'block' policy ever waits."""
+        with self._ready:
+            if self.policy == 'block':
+                while self.depth and self.depth + len(chunk) > self.capacity and not self.closed:
+                    self._ready.wait()
+            elif self.policy == 'drop-oldest':
+                while self._chunks and self.depth + len(chunk) > self.capacity:
+                    dropped = self._chunks.popleft()
+                    self.depth -= len(dropped)
+                    self.dropped_bytes += len(dropped)
+            elif self._spill_write > self._spill_read or self.depth + len(chunk) > self.capacity:
+                if self._spill is None:
+                    import tempfile
+                    self._spill = tempfile.TemporaryFile(dir=self._spill_dir)
+                self._spill.seek(self._spill_write)
+                self._spill.write(chunk)
+                self._spill_write += len(chunk)
+                self.spilled_bytes += len(chunk)
+                self._ready.notify()
+                return
+            self._chunks.append(chunk)
+            self.depth += len(chunk)
+            self.max_depth = max(self.max_depth, self.depth)
+            self._ready.notify()
 
-def parse_packet_40(packet_id, data):
-    """Parses Almanac Data Packet (Packet ID: 0x40)."""
+    def get(self, timeout=None):
+        """Next chunk for the decoder; b'' on timeout or once closed and drained."""
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._chunks or self._spill_write > self._spill_read or self.closed, timeout):
+                return b''
+            if self._chunks:
+                chunk = self._chunks.popleft()
+                self.depth -= len(chunk)
+                self._ready.notify()
+                return chunk
+            if self._spill_write > self._spill_read:
+                self._spill.seek(self._spill_read)
+                chunk = self._spill.read(min(READ_SIZE, self._spill_write - self._spill_read))
+                self._spill_read += len(chunk)
+                if self._spill_read == self._spill_write:  # caught up, back to memory
+                    self._spill.truncate(0)
+                    self._spill_read = self._spill_write = 0
+                return chunk
+            return b''
+
+    def close(self):
+        """Marks the end of input; get() returns b'' once the queue is drained."""
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+        if self._spill is not None and self._spill_write == self._spill_read:
+            self._spill.close()
+
+def read_loop(input_source, queue, stop):
+    """Reader thread: moves chunks from input_source into queue until EOF or stop is set.
+
+    It does nothing else, so a stalled terminal or log pipe never holds up the
+    serial port.
+    """
     try:
-        if len(data) < 35:
-            print(f"{RED}{datetime.now()} - Error: Insufficient data for Packet ID: 0x{packet_id:X}{RESET}")
-            return
-        print(f"{datetime.now()} - Report Packet: {BLUE}0x{packet_id:X}{RESET} - Almanac Data")
-        offset = 0
-        while offset + 35 <= len(data):
-            prn = data[offset]
-            gps_week = struct.unpack('>H', data[offset + 1:offset + 3])[0]
-            sv_health = data[offset + 3]
-            eccentricity = struct.unpack('>H', data[offset + 4:offset + 6])[0]
-            ref_time = struct.unpack('>H', data[offset + 6:offset + 8])[0]
-            inclination = struct.unpack('>H', data[offset + 8:offset + 10])[0]
-            rate_of_ra = struct.unpack('>f', data[offset + 10:offset + 14])[0]
-            semi_major_axis_root = struct.unpack('>f', data[offset + 14:offset + 18])[0]
-            omega = struct.unpack('>f', data[offset + 18:offset + 22])[0]
-            asc_node_longitude = struct.unpack('>f', data[offset + 22:offset + 26])[0]
-            mean_anomaly = struct.unpack('>f', data[offset + 26:offset + 30])[0]
-            af0 = struct.unpack('>f', data[offset + 30:offset + 34])[0]
-            print(f" Satellite PRN={GREEN}{prn}{RESET}, GPS Week={GREEN}{gps_week}{RESET}, SV Health={GREEN}{sv_health}{RESET}")
-            print(f" Eccentricity={GREEN}{eccentricity}{RESET}, Reference Time={GREEN}{ref_time}{RESET}, Inclination={GREEN}{inclination}{RESET}")
-            print(f" Rate of Right Ascension={GREEN}{rate_of_ra:.6f}{RESET}, Semi-Major Axis Root={GREEN}{semi_major_axis_root:.6f}{RESET}")
-            print(f" Omega={GREEN}{omega:.6f}{RESET}, Longitude of Ascension Node={GREEN}{asc_node_longitude:.6f}{RESET}")
-            print(f" Mean Anomaly={GREEN}{mean_anomaly:.6f}{RESET}, Clock Parameter af0={GREEN}{af0:.6f}{RESET}")
-            offset += 35
-    except Exception as e:
-        print(f"{RED}Error parsing Almanac Data packet 0x{packet_id:X}: {e}, data={data.hex()}{RESET}")
-
-def parse_packet_41(packet_id, data):
-    if len(data) < 10:
-        print(f"Report Packet: 0x{packet_id:02X}: Insufficient data for GPS Time")
-        return
+        while not stop.is_set():
+            chunk = read_chunk(input_source)
+            if chunk:
+                queue.put(chunk)
+            elif not is_serial(input_source):
+                break
+    except OSError as e:  # SerialException is an OSError too
+        print(f"{RED}Error reading input: {e}{RESET}")
+    finally:
+        queue.close()
+
+def read_chunk(input_source):
+    """Reads whatever input_source has ready instead of a single byte.
 
+    A serial port returns everything in its receive buffer (blocking for at least
+    one byte, b'' on timeout); files and stdin return up to READ_SIZE bytes.
+    """
+    if is_serial(input_source):
+        return input_source.read(input_source.in_waiting or 1)
+    read = getattr(input_source, 'read1', input_source.read)  # don't wait to fill a pipe
+    return read(READ_SIZE)
+
+async def port_chunks(ser):
+    """Chunks from an open serial port (or pty), read when the event loop sees data ready."""
+    import asyncio
+    import serial
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    loop.add_reader(ser.fileno(), ready.set)
     try:
-        time_of_week, extended_gps_week, utc_offset = struct.unpack('>fHf', data[:10])
-        gps_week = extended_gps_week
-        current_gps_week = 2357  # Approximate as of March 2025
-        if gps_week < (current_gps_week - 1024):
-            gps_week += 2048  # Adjust for rollovers
-        
-        print(f"Report Packet: {GREEN}0x{packet_id:02X}{RESET}: GPS Time")
-        print(f"  Time of Week: {GREEN}{time_of_week:.3f}{RESET} seconds")
-        print(f"  Extended GPS Week:{GREEN}{gps_week}{RESET}")
-        print(f"  UTC Offset: {GREEN}{utc_offset}{RESET} seconds")
-        
-        if time_of_week < 0 or time_of_week > 604800:
-            print(f"Warning: Invalid Time of Week value: {time_of_week}")
-            return
-        
-        gps_epoch = datetime(1980, 1, 6)
-        current_gps_time = gps_epoch + timedelta(weeks=gps_week, seconds=time_of_week)
-
-        # Sanity check UTC offset, typically small (e.g., < 100 seconds)
-        if not (0 <= utc_offset < 1000):
-            print(f"Warning: UTC offset out of range {RED}({utc_offset}){RESET}, skipping UTC calculation.")
-            print(f"  Current GPS Time (no UTC offset applied): {GREEN}{current_gps_time}{RESET}")
-        else:
-            current_utc_time = current_gps_time - timedelta(seconds=int(utc_offset))
-            print(f"  Current UTC Time: {GREEN}{current_utc_time}{RESET}")
+        while True:
+            await ready.wait()
+            ready.clear()
+            try:
+                chunk = ser.read(ser.in_waiting or 1)
+            except (serial.SerialException, OSError):  # port unplugged or pty closed (EIO)
+                return
+            if chunk:
+                yield chunk
+    finally:
+        loop.remove_reader(ser.fileno())
+        ser.close()
+
+async def file_chunks(capture):
+    """Chunks of an open capture file, yielding to the event loop between reads."""
+    import asyncio
+    try:
+        while chunk := capture.read(READ_SIZE):
+            yield chunk
+            await asyncio.sleep(0)
+    finally:
+        capture.close()
 
-    except struct.error as e:
-        print(f"{RED}Error parsing GPS Time packet: {e}{RESET}")
+async def stream_chunks(reader, writer=None):
+    """Chunks from an asyncio StreamReader (stdin pipe or TCP connection)."""
+    try:
+        while chunk := await reader.read(READ_SIZE):
+            yield chunk
+    except ConnectionError:  # peer reset: treat like end of stream
+        return
+    finally:
+        if writer is not None:
+            writer.close()
 
-def parse_packet_42(packet_id, data):
-    """Parse Trimble TSIP Packet 0x42 (Single-Precision XYZ ECEF Position Fix)"""
-    EXPECTED_LENGTH = 16
-    MIN_LENGTH = 12
+async def open_source(kind, target, baudrate=9600):
+    """Async iterator of raw chunks for one source: 'port', 'file', 'stdin' or 'tcp' (host:port).
 
-    if len(data) < MIN_LENGTH:
-        print(f"{WHITE}Packet 0x{packet_id:02X}: {RED}ERROR{RESET} - "
-              f"Need {MIN_LENGTH} bytes, got {len(data)}{RESET}")
-        return None
+    The port, file or connection is opened here, so a source that cannot be
+    opened raises OSError (SerialException included) before any reading starts.
+    """
+    import asyncio
+    if kind == 'port':
+        import serial
+        return port_chunks(serial.Serial(target, baudrate, timeout=0))
+    if kind == 'file':
+        return file_chunks(open_reader(target))
+    if kind == 'stdin' and stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+        # Redirected from a file: the event loop cannot watch it as a pipe
+        return file_chunks(os.fdopen(sys.stdin.fileno(), 'rb', closefd=False))
+    reader = asyncio.StreamReader()
+    if kind == 'stdin':
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+        return stream_chunks(reader)
+    host, _, port = target.rpartition(':')
+    reader, writer = await asyncio.open_connection(host, int(port))
+    return stream_chunks(reader, writer)
 
+async def ingest_source(kind, target, emit, baudrate=9600, metrics=None, keep=None, record=None):
+    """Deframes and decodes one source, calling emit(tag, record) for every packet.
+
+    Returns the source's TSIPDeframer for its counters.  With a tsip.metrics
+    Metrics, packets are decoded through it and the deframer is watched.  keep
+    is the deframer's packet ID filter (tsip.schema.id_filter).  record(tag)
+    returns a tsip.capture.CaptureRecorder for the source's raw bytes, or None.
+    """
+    tag = f"tcp://{target}" if kind == 'tcp' else target
+    recorder = record(tag) if record else None
+    deframer = TSIPDeframer(keep=keep)
+    decode = parse_tsip_packet
+    if metrics is not None:
+        metrics.watch(tag, deframer)
+        decode = metrics.decode
     try:
-        x, y, z = struct.unpack('>fff', data[:12])
-        time_of_fix = struct.unpack('>f', data[12:16])[0] if len(data) >= EXPECTED_LENGTH else float('nan')
-    except struct.error as e:
-        print(f"{WHITE}Packet 0x{packet_id:02X}: {RED}DECODE ERROR{RESET} - {str(e)}")
-        return None
+        chunks = await open_source(kind, target, baudrate)
+    except OSError as e:  # SerialException included
+        print(f"{RED}Error: could not open {tag}: {e}{RESET}")
+        return deframer
+    async for chunk in chunks:
+        if recorder:
+            recorder.write(chunk)
+        for packet in deframer.feed(chunk):
+            emit(tag, decode(packet))
+    return deframer
 
-    # Debug: Print raw data
-    if DEBUG:
-        print(f"{WHITE}Debug: Raw data={data.hex()}{RESET}")
+async def ingest(sources, emit, baudrate=9600, metrics=None, keep=None, record=None):
+    """Reads every (kind, target) source concurrently on one event loop.
+
+    Records are handed to emit(tag, record) as they complete, tagged with the
+    port, file name, 'stdin' or tcp://host:port they came from.
+    """
+    import asyncio
+    return await asyncio.gather(*(ingest_source(kind, target, emit, baudrate, metrics, keep, record) for kind, target in sources))
+
+def print_tagged(tag, record):
+    """Console sink for several sources: print_record() behind a [source] tag."""
+    print(f"{WHITE}[{tag}]{RESET} ", end='')
+    print_record(record)
+
+def print_packet_40(record):
+    """Prints Almanac Data Packet (Packet ID: 0x40)."""
+    from datetime import datetime
+    if not record.almanacs:
+        print(f"{RED}{datetime.now()} - Error: Insufficient data for Packet ID: 0x{record.packet_id:X}{RESET}")
+        return
+    print(f"{datetime.now()} - Report Packet: {BLUE}0x{record.packet_id:X}{RESET} - Almanac Data")
+    for almanac in record.almanacs:
+        print(f" Satellite PRN={GREEN}{almanac.prn}{RESET}, GPS Week={GREEN}{almanac.gps_week}{RESET}, SV Health={GREEN}{almanac.sv_health}{RESET}")
+        print(f" Eccentricity={GREEN}{almanac.eccentricity}{RESET}, Reference Time={GREEN}{almanac.ref_time}{RESET}, Inclination={GREEN}{almanac.inclination}{RESET}")
+        print(f" Rate of Right Ascension={GREEN}{almanac.rate_of_ra:.6f}{RESET}, Semi-Major Axis Root={GREEN}{almanac.semi_major_axis_root:.6f}{RESET}")
+        print(f" Omega={GREEN}{almanac.omega:.6f}{RESET}, Longitude of Ascension Node={GREEN}{almanac.asc_node_longitude:.6f}{RESET}")
+        print(f" Mean Anomaly={GREEN}{almanac.mean_anomaly:.6f}{RESET}, Clock Parameter af0={GREEN}{almanac.af0:.6f}{RESET}")
+
+def print_packet_41(record):
+    """Prints GPS Time (Packet ID 0x41)."""
+    from datetime import datetime, timedelta
+    from tsip.geo import resolve_week
+    time_of_week, gps_week, utc_offset = record
+    gps_week = resolve_week(gps_week, REFERENCE_WEEK)  # Adjust for rollovers
+
+    print(f"Report Packet: {GREEN}0x{record.packet_id:02X}{RESET}: GPS Time")
+    print(f"  Time of Week: {GREEN}{time_of_week:.3f}{RESET} seconds")
+    print(f"  Extended GPS Week:{GREEN}{gps_week}{RESET}")
+    print(f"  UTC Offset: {GREEN}{utc_offset}{RESET} seconds")
+
+    if time_of_week < 0 or time_of_week > 604800:
+        print(f"Warning: Invalid Time of Week value: {time_of_week}")
+        return
+
+    gps_epoch = datetime(1980, 1, 6)
+    current_gps_time = gps_epoch + timedelta(weeks=gps_week, seconds=time_of_week)
+
+    # Sanity check UTC offset, typically small (e.g., < 100 seconds)
+    if not (0 <= utc_offset < 1000):
+        print(f"Warning: UTC offset out of range {RED}({utc_offset}){RESET}, skipping UTC calculation.")
+        print(f"  Current GPS Time (no UTC offset applied): {GREEN}{current_gps_time}{RESET}")
+    else:
+        current_utc_time = current_gps_time - timedelta(seconds=int(utc_offset))
+        print(f"  Current UTC Time: {GREEN}{current_utc_time}{RESET}")
+
+def print_packet_42(record):
+    """Prints Trimble TSIP Packet 0x42 (Single-Precision XYZ ECEF Position Fix)"""
+    time_of_fix = record.time_of_fix
 
     # Validate GPS time
-    if not math.isnan(time_of_fix):
+    if time_of_fix is not None and not math.isnan(time_of_fix):
         if time_of_fix < 0 or time_of_fix > 604800:
             print(f"{YELLOW}Warning: Invalid GPS Time: {time_of_fix:.3f} seconds (expected 0 to 604800){RESET}")
-            time_value = None
         else:
             print(f"{WHITE} GPS Time: {GREEN}{time_of_fix:.3f} seconds{RESET}")
-            time_value = time_of_fix
     else:
         print(f"{WHITE} GPS Time: {RED}Not Available{RESET}")
-        time_value = None
 
     # Format console output
-    print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}:")
-    print(f"{WHITE} X ECEF: {GREEN}{x:12.3f} meters{RESET}")
-    print(f"{WHITE} Y ECEF: {GREEN}{y:12.3f} meters{RESET}")
-    print(f"{WHITE} Z ECEF: {GREEN}{z:12.3f} meters{RESET}")
-
-    return {
-        'packet_id': packet_id,
-        'x_ecef': x,
-        'y_ecef': y,
-        'z_ecef': z,
-        'gps_time': time_value
-    }
-def parse_packet_43(packet_id, data):
-    """Parses Velocity Fix (XYZ ECEF) (Packet ID 0x43)."""
-    if len(data) < 12:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Velocity Fix{RESET}")
-        return
-    try:
-        x_velocity, y_velocity, z_velocity = struct.unpack('>fff', data[:12])
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Velocity Fix (XYZ ECEF){RESET}")
-        print(f"{WHITE} X Velocity:{RESET} {GREEN}{x_velocity:.3f} m/s{RESET}")
-        print(f"{WHITE} Y Velocity:{RESET} {GREEN}{y_velocity:.3f} m/s{RESET}")
-        print(f"{WHITE} Z Velocity:{RESET} {GREEN}{z_velocity:.3f} m/s{RESET}")
-    except struct.error as e:
-        print(f"{RED}Error parsing Velocity Fix packet: {e}{RESET}")
-
-def parse_packet_44(packet_id, data):
-    """Parses Non-Overdetermined Satellite Selection Report (Packet ID 0x44)."""
-    expected_length = 21
-    if len(data) < expected_length:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data, got {len(data)} bytes{RESET}")
-        return
-    if len(data) > expected_length:
-        print(f"{YELLOW}Warning: Packet 0x44 length {len(data)} exceeds expected {expected_length} bytes, trimming excess{RESET}")
-        data = data[:expected_length]
-    if DEBUG:
-        print(f"{WHITE}Debug: Raw data length={len(data)}, data={data.hex()}{RESET}")
-        print(f"{WHITE}Debug: DOP bytes={data[5:21].hex()}{RESET}")
-    MODE_MEANINGS = {
-        1: "Auto, 1-satellite, 0D",
-        3: "Auto, 3-satellite, 2D",
-        4: "Auto, 4-satellite, 3D",
-        11: "Manual, 1-satellite, 0D",
-        13: "Manual, 3-satellite, 2D",
-        14: "Manual, 4-satellite, 3D"
-    }
-    try:
-        mode = data[0]
-        sv1, sv2, sv3, sv4 = data[1:5]
-        pdop, hdop, vdop, tdop = struct.unpack('>ffff', data[5:21])
-        dop_display = lambda x: f"{x:.2e}" if abs(x) > 1000 or abs(x) < 0.01 else f"{x:.2f}"
-        pdop_str = dop_display(pdop)
-        hdop_str = dop_display(hdop)
-        vdop_str = dop_display(vdop)
-        tdop_str = dop_display(tdop)
-        if any(abs(dop) > 1000 for dop in [pdop, hdop, vdop, tdop]):
-            print(f"{YELLOW}Warning: Invalid DOP value detected: PDOP={pdop}, HDOP={hdop}, VDOP={vdop}, TDOP={tdop}{RESET}")
-        active_sats = sum(1 for sv in [sv1, sv2, sv3, sv4] if sv != 0)
-        if mode == 4 and active_sats < 4:
-            print(f"{YELLOW}Warning: Mode indicates 4-satellite fix, but only {active_sats} satellites reported{RESET}")
-        mode_description = MODE_MEANINGS.get(mode, "Unknown mode")
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Satellite Selection Report{RESET}")
-        print(f"{WHITE} Mode:{RESET} {GREEN}{mode_description} ({mode:#02X}){RESET}")
-        print(f"{WHITE} Satellites:{RESET} {GREEN}SV1={sv1}, SV2={sv2}, SV3={sv3}, SV4={sv4}{RESET}")
-        print(f"{WHITE} PDOP:{RESET} {GREEN}{pdop_str}{RESET}")
-        print(f"{WHITE} HDOP:{RESET} {GREEN}{hdop_str}{RESET}")
-        print(f"{WHITE} VDOP:{RESET} {GREEN}{vdop_str}{RESET}")
-        print(f"{WHITE} TDOP:{RESET} {GREEN}{tdop_str}{RESET}")
-    except struct.error as e:
-        print(f"{RED}Error parsing Satellite Selection packet: {e}, data={data.hex()}{RESET}")
-
-def parse_packet_45(packet_id, data):
-    """Parses Receiver Firmware Information (Packet ID 0x45)."""
-    if len(data) < 10:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Firmware Information{RESET}")
-        return
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}:")
+    print(f"{WHITE} X ECEF: {GREEN}{record.x:12.3f} meters{RESET}")
+    print(f"{WHITE} Y ECEF: {GREEN}{record.y:12.3f} meters{RESET}")
+    print(f"{WHITE} Z ECEF: {GREEN}{record.z:12.3f} meters{RESET}")
 
-    nav_major = data[0]
-    nav_minor = data[1]
-    nav_month = data[2]
-    nav_day = data[3]
-    nav_year = data[4] + 1900  # Year is stored as year - 1900
-    sig_major = data[5]
-    sig_minor = data[6]
-    sig_month = data[7]
-    sig_day = data[8]
-    sig_year = data[9] + 1900  # Year is stored as year - 1900
+def print_packet_43(record):
+    """Prints Velocity Fix (XYZ ECEF) (Packet ID 0x43)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Velocity Fix (XYZ ECEF){RESET}")
+    print(f"{WHITE} X Velocity:{RESET} {GREEN}{record.x_velocity:.3f} m/s{RESET}")
+    print(f"{WHITE} Y Velocity:{RESET} {GREEN}{record.y_velocity:.3f} m/s{RESET}")
+    print(f"{WHITE} Z Velocity:{RESET} {GREEN}{record.z_velocity:.3f} m/s{RESET}")
 
+SELECTION_MODES = {
+    1: "Auto, 1-satellite, 0D",
+    3: "Auto, 3-satellite, 2D",
+    4: "Auto, 4-satellite, 3D",
+    11: "Manual, 1-satellite, 0D",
+    13: "Manual, 3-satellite, 2D",
+    14: "Manual, 4-satellite, 3D"
+}
 
-    print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Receiver Firmware Information{RESET}")
-    print(f"{WHITE} NAV Proc:{RESET} {GREEN}{nav_major}.{nav_minor}{RESET}")
-    print(f"{WHITE} NAV Proc Date:{RESET} {GREEN}{nav_month}-{nav_day}-{nav_year}{RESET}")
-    print(f"{WHITE} SIG Proc:{RESET} {GREEN}{sig_major}.{sig_minor}{RESET}")
-    print(f"{WHITE} SIG Proc Date:{RESET} {GREEN}{sig_month}-{sig_day}-{sig_year}{RESET}")
+def print_packet_44(record):
+    """Prints Non-Overdetermined Satellite Selection Report (Packet ID 0x44)."""
+    mode, sv1, sv2, sv3, sv4, pdop, hdop, vdop, tdop = record
+    dop_display = lambda x: f"{x:.2e}" if abs(x) > 1000 or abs(x) < 0.01 else f"{x:.2f}"
+    pdop_str = dop_display(pdop)
+    hdop_str = dop_display(hdop)
+    vdop_str = dop_display(vdop)
+    tdop_str = dop_display(tdop)
+    if any(abs(dop) > 1000 for dop in [pdop, hdop, vdop, tdop]):
+        print(f"{YELLOW}Warning: Invalid DOP value detected: PDOP={pdop}, HDOP={hdop}, VDOP={vdop}, TDOP={tdop}{RESET}")
+    active_sats = sum(1 for sv in [sv1, sv2, sv3, sv4] if sv != 0)
+    if mode == 4 and active_sats < 4:
+        print(f"{YELLOW}Warning: Mode indicates 4-satellite fix, but only {active_sats} satellites reported{RESET}")
+    mode_description = SELECTION_MODES.get(mode, "Unknown mode")
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Satellite Selection Report{RESET}")
+    print(f"{WHITE} Mode:{RESET} {GREEN}{mode_description} ({mode:#02X}){RESET}")
+    print(f"{WHITE} Satellites:{RESET} {GREEN}SV1={sv1}, SV2={sv2}, SV3={sv3}, SV4={sv4}{RESET}")
+    print(f"{WHITE} PDOP:{RESET} {GREEN}{pdop_str}{RESET}")
+    print(f"{WHITE} HDOP:{RESET} {GREEN}{hdop_str}{RESET}")
+    print(f"{WHITE} VDOP:{RESET} {GREEN}{vdop_str}{RESET}")
+    print(f"{WHITE} TDOP:{RESET} {GREEN}{tdop_str}{RESET}")
 
+def print_packet_45(record):
+    """Prints Receiver Firmware Information (Packet ID 0x45)."""
+    nav_year = record.nav_year + 1900  # Year is stored as year - 1900
+    sig_year = record.sig_year + 1900  # Year is stored as year - 1900
 
-def parse_packet_46(packet_id, data):
-    """Parses Health (Packet ID 0x46)."""
-    try:
-        status_code = data[0]
-        codes = {
-            0x00: 'Doing position fixes',
-            0x01: 'Do not have GPS time yet',
-            0x03: 'PDOP is too high',
-            0x08: 'No usable satellites',
-            0x09: 'Only 1 usable satellite',
-            0x0A: 'Only 2 usable satellites',
-            0x0B: 'Only 3 usable satellites',
-            0x0C: 'The chosen satellite is unusable'
-        }
-        desc = codes.get(status_code, "Unknown status code")
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Health Packet: Status Code={status_code:#02x}, Description={desc}{RESET}")
-    except IndexError as e:
-        print(f"{RED}Error parsing Health packet: {e}{RESET}")
-
-def parse_packet_47(packet_id, data):
-    """Parses Signal Levels (Packet ID 0x47)."""
-    if DEBUG:
-        print(f"{WHITE}Debug: Raw data length={len(data)}, data={data.hex()}{RESET}")
-    try:
-        count = data[0]
-        expected_length = 1 + count * 5
-        if len(data) < expected_length:
-            print(f"{RED}Incomplete signal level data, expected {expected_length} bytes, got {len(data)}{RESET}")
-            return
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Signal Levels Packet: Number of Satellites={count}{RESET}")
-        index = 1
-        for i in range(count):
-            prn, signal_level = struct.unpack(">Bf", data[index:index + 5])
-            print(f"{WHITE} SV PRN={GREEN}{prn}{RESET}, Signal Level={GREEN}{signal_level:.2f}{RESET}")
-            index += 5
-    except struct.error as e:
-        print(f"{RED}Error parsing Signal Levels packet: {e}{RESET}")
-
-def parse_packet_48(packet_id, data):
-    """Parses GPS System Message Report (Packet ID 0x48)."""
-    if len(data) < 22:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for GPS System Message Report{RESET}")
-        return
-    try:
-        message = data[:22].decode('ascii', errors='replace')
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: GPS System Message Report{RESET}")
-        print(f"{WHITE} Message:{RESET} {GREEN}{message.strip()}{RESET}")
-    except Exception as e:
-        print(f"{RED}Error parsing GPS System Message packet: {e}{RESET}")
-
-def parse_packet_49(packet_id, data):
-    """Parses Almanac Health Page Report (Packet ID 0x49)."""
-    if len(data) < 32:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Almanac Health Report{RESET}")
-        return
-    try:
-        health_status = {}
-        healthy_count = 0
-        unhealthy_count = 0
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Almanac Health Page Report{RESET}")
-        print(f"{WHITE} Satellite | Status{RESET}")
-        print(f"{WHITE}-------------------{RESET}")
-        for sat_num in range(32):
-            status_byte = data[sat_num]
-            is_healthy = status_byte == 0
-            health_status[sat_num + 1] = "Healthy" if is_healthy else "Unhealthy"
-            if is_healthy:
-                healthy_count += 1
-            else:
-                unhealthy_count += 1
-            health_str = f"{GREEN}✅ Healthy{RESET}" if is_healthy else f"{RED}❌ Unhealthy (0x{status_byte:02X}){RESET}"
-            print(f"{WHITE} SV{sat_num + 1:3} |{RESET} {health_str}")
-        print(f"\n{WHITE}Summary:{RESET}")
-        print(f"{WHITE} Healthy Satellites:{RESET} {GREEN}{healthy_count}{RESET}")
-        print(f"{WHITE} Unhealthy Satellites:{RESET} {RED}{unhealthy_count}{RESET}")
-    except IndexError as e:
-        print(f"{RED}Error parsing Almanac Health Report: {e}{RESET}")
-
-def parse_packet_4A(packet_id, data):
-    data_length = len(data)
-    if data_length == 20 or data_length == 24:
-        try:
-            latitude, longitude, altitude, clock_bias, time_of_fix = struct.unpack('>fffff', data[:20])
-            print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Single Precision LLA Position Fix Report{RESET}")
-            print(f"{WHITE} Latitude:{RESET} {GREEN}{latitude:.6f} radians ({latitude * (180 / 3.141592653589793):.10f} degrees){RESET}")
-            print(f"{WHITE} Longitude:{RESET} {GREEN}{longitude:.6f} radians ({longitude * (180 / 3.141592653589793):.10f} degrees){RESET}")
-            print(f"{WHITE} Altitude:{RESET} {GREEN}{altitude:.2f} meters{RESET}")
-            print(f"{WHITE} Clock Bias:{RESET} {GREEN}{clock_bias:.2f} meters{RESET}")
-            if time_of_fix < 0 or time_of_fix > 604800:
-                print(f"{YELLOW}Warning: Invalid Time of Fix: {time_of_fix:.3f} seconds (expected 0 to 604800){RESET}")
-            else:
-                print(f"{WHITE} Time of Fix:{RESET} {GREEN}{time_of_fix:.3f} seconds{RESET}")
-        except struct.error as e:
-            print(f"{RED}Error parsing Single Precision LLA Position Fix Report: {e}{RESET}")
-def parse_packet_4B(packet_id, data):
-    """Parses Machine/Code ID and Additional Status Report (Packet ID 0x4B)."""
-    if len(data) < 3:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Additional Status Report{RESET}")
-        return
-    machine_id = data[0]
-    status_flags_1 = data[1]
-    status_flags_2 = data[2]
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Receiver Firmware Information{RESET}")
+    print(f"{WHITE} NAV Proc:{RESET} {GREEN}{record.nav_major}.{record.nav_minor}{RESET}")
+    print(f"{WHITE} NAV Proc Date:{RESET} {GREEN}{record.nav_month}-{record.nav_day}-{nav_year}{RESET}")
+    print(f"{WHITE} SIG Proc:{RESET} {GREEN}{record.sig_major}.{record.sig_minor}{RESET}")
+    print(f"{WHITE} SIG Proc Date:{RESET} {GREEN}{record.sig_month}-{record.sig_day}-{sig_year}{RESET}")
+
+HEALTH_CODES = {
+    0x00: 'Doing position fixes',
+    0x01: 'Do not have GPS time yet',
+    0x03: 'PDOP is too high',
+    0x08: 'No usable satellites',
+    0x09: 'Only 1 usable satellite',
+    0x0A: 'Only 2 usable satellites',
+    0x0B: 'Only 3 usable satellites',
+    0x0C: 'The chosen satellite is unusable'
+}
+
+def print_packet_46(record):
+    """Prints Health (Packet ID 0x46)."""
+    desc = HEALTH_CODES.get(record.status_code, "Unknown status code")
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Health Packet: Status Code={record.status_code:#02x}, Description={desc}{RESET}")
+
+def print_packet_47(record):
+    """Prints Signal Levels (Packet ID 0x47)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Signal Levels Packet: Number of Satellites={record.count}{RESET}")
+    for prn, signal_level in record.signals:
+        print(f"{WHITE} SV PRN={GREEN}{prn}{RESET}, Signal Level={GREEN}{signal_level:.2f}{RESET}")
+
+def print_packet_48(record):
+    """Prints GPS System Message Report (Packet ID 0x48)."""
+    message = record.message.decode('ascii', errors='replace')
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: GPS System Message Report{RESET}")
+    print(f"{WHITE} Message:{RESET} {GREEN}{message.strip()}{RESET}")
+
+def print_packet_49(record):
+    """Prints Almanac Health Page Report (Packet ID 0x49)."""
+    healthy_count = 0
+    unhealthy_count = 0
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Almanac Health Page Report{RESET}")
+    print(f"{WHITE} Satellite | Status{RESET}")
+    print(f"{WHITE}-------------------{RESET}")
+    for sat_num, status_byte in enumerate(record.health):
+        is_healthy = status_byte == 0
+        if is_healthy:
+            healthy_count += 1
+        else:
+            unhealthy_count += 1
+        health_str = f"{GREEN}✅ Healthy{RESET}" if is_healthy else f"{RED}❌ Unhealthy (0x{status_byte:02X}){RESET}"
+        print(f"{WHITE} SV{sat_num + 1:3} |{RESET} {health_str}")
+    print(f"\n{WHITE}Summary:{RESET}")
+    print(f"{WHITE} Healthy Satellites:{RESET} {GREEN}{healthy_count}{RESET}")
+    print(f"{WHITE} Unhealthy Satellites:{RESET} {RED}{unhealthy_count}{RESET}")
+
+def print_packet_4A(record):
+    """Prints Single Precision LLA Position Fix Report (Packet ID 0x4A)."""
+    latitude, longitude, altitude, clock_bias, time_of_fix = record
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Single Precision LLA Position Fix Report{RESET}")
+    print(f"{WHITE} Latitude:{RESET} {GREEN}{latitude:.6f} radians ({latitude * (180 / 3.141592653589793):.10f} degrees){RESET}")
+    print(f"{WHITE} Longitude:{RESET} {GREEN}{longitude:.6f} radians ({longitude * (180 / 3.141592653589793):.10f} degrees){RESET}")
+    print(f"{WHITE} Altitude:{RESET} {GREEN}{altitude:.2f} meters{RESET}")
+    print(f"{WHITE} Clock Bias:{RESET} {GREEN}{clock_bias:.2f} meters{RESET}")
+    if time_of_fix < 0 or time_of_fix > 604800:
+        print(f"{YELLOW}Warning: Invalid Time of Fix: {time_of_fix:.3f} seconds (expected 0 to 604800){RESET}")
+    else:
+        print(f"{WHITE} Time of Fix:{RESET} {GREEN}{time_of_fix:.3f} seconds{RESET}")
+
+def print_packet_4B(record):
+    """Prints Machine/Code ID and Additional Status Report (Packet ID 0x4B)."""
+    machine_id, status_flags_1, status_flags_2 = record
     battery_fault = (status_flags_1 >> 1) & 0x01
     acknowledged_status = (status_flags_1 >> 3) & 0x01
     tsip_superpackets_fault = status_flags_2 & 0x01
     receiver_reset_fault = (status_flags_2 >> 1) & 0x01
     almanac_fault = (status_flags_2 >> 2) & 0x01
     adc_fault = (status_flags_2 >> 3) & 0x01
-    print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Machine/Code ID and Additional Status Report{RESET}")
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Machine/Code ID and Additional Status Report{RESET}")
     print(f"{WHITE} Machine ID:{RESET} {GREEN}{machine_id:#02X}{RESET}")
     print(f"{WHITE} Status Flags:{RESET}")
     battery_fault_str = f"{RED}Yes{RESET}" if battery_fault else f"{GREEN}No{RESET}"
@@ -423,162 +483,582 @@ def parse_packet_4B(packet_id, data):
     adc_fault_str = f"{RED}Yes{RESET}" if adc_fault else f"{GREEN}No{RESET}"
     print(f"{WHITE} ADC fault:{RESET} {adc_fault_str}")
 
-def parse_packet_54(packet_id, data):
-    """Parses Altitude Hold Enable (Packet ID 0x54)."""
-    if len(data) < 1:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Altitude Hold Enable{RESET}")
-        return
-    try:
-        altitude_hold = data[0]
-        status = "Enabled" if altitude_hold else "Disabled"
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Altitude Hold Enable{RESET}")
-        print(f"{WHITE} Altitude Hold:{RESET} {GREEN}{status}{RESET}")
-    except IndexError as e:
-        print(f"{RED}Error parsing Altitude Hold Enable packet: {e}{RESET}")
-
-def parse_packet_55(packet_id, data):
-    """Parses Throttle Percentage (Packet ID 0x55)."""
-    if len(data) < 1:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Throttle Percentage{RESET}")
-        return
+def print_packet_54(record):
+    """Prints One Satellite Bias and Bias Rate Report (Packet ID 0x54)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: One Satellite Bias and Bias Rate Report{RESET}")
+    print(f"{WHITE} Bias:{RESET} {GREEN}{record.bias:.3f} meters{RESET}")
+    print(f"{WHITE} Bias Rate:{RESET} {GREEN}{record.bias_rate:.3f} m/s{RESET}")
+    print(f"{WHITE} Time of Fix:{RESET} {GREEN}{record.time_of_fix:.3f} seconds{RESET}")
+
+def print_packet_55(record):
+    """Prints Throttle Percentage (Packet ID 0x55)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Throttle Percentage{RESET}")
+    print(f"{WHITE} Throttle Percentage:{RESET} {GREEN}{record.throttle}%{RESET}")
+
+def print_packet_5B(record):
+    """Prints Satellite Ephemeris Status Report (Packet ID 0x5B)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Satellite Ephemeris Status Report{RESET}")
+    print(f" SV PRN #: {GREEN}{record.sv_prn}{RESET}")
+    print(f" Collection Time: {GREEN}{record.collection_time:.2f}{RESET} seconds")
+    print(f" Health: {GREEN}{record.health}{RESET}")
+    print(f" IODE: {GREEN}{record.iode}{RESET}")
+    print(f" toe: {GREEN}{record.toe:.2f}{RESET} seconds")
+    print(f" Fit Interval Flag: {GREEN}{record.fit_interval_flag}{RESET}")
+    print(f" URA: {GREEN}{record.ura:.2f}{RESET} meters")
+
+def print_packet_70(record):
+    """Prints Navigation Filter Configuration (Packet ID 0x70)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Navigation Filter Configuration{RESET}")
+    print(f"{WHITE} Nav 1:{RESET} {GREEN}{record.nav1}{RESET}")
+    print(f"{WHITE} Nav 2:{RESET} {GREEN}{record.nav2}{RESET}")
+
+def print_packet_82(record):
+    """Prints Output Rate Control (Packet ID 0x82)."""
+    print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Output Rate Control{RESET}")
+    print(f"{WHITE} Rate Control 1:{RESET} {GREEN}{record.rate_control1}{RESET}")
+    print(f"{WHITE} Rate Control 2:{RESET} {GREEN}{record.rate_control2}{RESET}")
+
+RENDERERS = {
+    0x40: print_packet_40,
+    0x41: print_packet_41,
+    0x42: print_packet_42,
+    0x43: print_packet_43,
+    0x44: print_packet_44,
+    0x45: print_packet_45,
+    0x46: print_packet_46,
+    0x47: print_packet_47,
+    0x48: print_packet_48,
+    0x49: print_packet_49,
+    0x4A: print_packet_4A,
+    0x4B: print_packet_4B,
+    0x54: print_packet_54,
+    0x55: print_packet_55,
+    0x5B: print_packet_5B,
+    0x70: print_packet_70,
+    0x82: print_packet_82,
+}
+
+def parse_tsip_packet(packet):
+    """Decodes a deframed TSIP packet to a record (see tsip.schema); prints nothing."""
+    return decode_packet(packet)
+
+def print_record(record):
+    """Console sink: prints one decoded record in colour."""
+    if isinstance(record, MalformedPacket):
+        print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: {RED}Insufficient data for {REPORTS[record.packet_id].title}: {record.error}{RESET}")
+    elif isinstance(record, UnknownPacket):
+        print(f"{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: Unknown packet, Data: {record.data.hex()}{RESET}")
+    else:
+        RENDERERS[record.packet_id](record)
+
+def print_changes(record, changes, source=None):
+    """Console sink for --changes: one line with what a report changed."""
+    from tsip.state import describe_changes
+    tag = f"{WHITE}[{source}]{RESET} " if source else ""
+    print(f"{tag}{WHITE}Report Packet: {BLUE}0x{record.packet_id:02X}{RESET}: {record.report.title}: {GREEN}{describe_changes(changes)}{RESET}")
+
+def make_sink(output_format, out, changes=False):
+    """Record sink for --format: sink(record, source=None) writes one record to out.
+
+    The console formats print through the renderers above (sys.stdout is the
+    BatchWriter); csv, ndjson and binary write a line or record each.  With
+    changes, a tsip.state.ReceiverState per source lets only the first report
+    of each kind through whole and afterwards just the fields that changed.
+    """
+    if changes:
+        from tsip.state import ReceiverState
+        sink = make_sink(output_format, out)
+        states = {}
+        def changed(record, source=None):
+            state = states.get(source)
+            if state is None:
+                state = states[source] = ReceiverState()
+            first, fields = state.update(record)
+            if first:
+                sink(record, source)
+            elif fields and output_format == 'ndjson':
+                out.write(changes_line(record, fields, source))
+            elif fields:
+                print_changes(record, fields, source)
+        return changed
+    if output_format == 'csv':
+        return lambda record, source=None: out.write(csv_line(record, source))
+    if output_format == 'ndjson':
+        return lambda record, source=None: out.write(ndjson_line(record, source))
+    if output_format == 'binary':
+        return lambda record, source=None: out.write(binary_record(record))
+    return lambda record, source=None: print_tagged(source, record) if source else print_record(record)
+
+def open_output(output_format):
+    """Puts a BatchWriter in front of stdout and returns it.
+
+    Everything printed goes through it on the console formats; csv, ndjson and
+    binary get stdout to themselves, so it stays machine-readable, and messages
+    go to stderr instead.  Color is dropped unless the format is color.
+    """
+    set_color(output_format == 'color')
+    if output_format in ('csv', 'ndjson', 'binary'):
+        out = BatchWriter(sys.stdout.buffer if output_format == 'binary' else sys.stdout)
+        sys.stdout = sys.stderr
+    else:
+        out = sys.stdout = BatchWriter(sys.stdout)
+    return out
+
+def close_output(out):
+    """Flushes the BatchWriter and gives stdout back."""
+    sys.stdout = sys.__stdout__
     try:
-        throttle = data[0]
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Throttle Percentage{RESET}")
-        print(f"{WHITE} Throttle Percentage:{RESET} {GREEN}{throttle}%{RESET}")
-    except IndexError as e:
-        print(f"{RED}Error parsing Throttle Percentage packet: {e}{RESET}")
-
-def parse_packet_5B(packet_id, data):
-    """Parses Satellite Ephemeris Status Report (Packet ID 0x5B)."""
+        out.flush()
+    except BrokenPipeError:  # reader went away, e.g. piped into head
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.__stdout__.fileno())
+
+async def flush_periodically(out):
+    """Flushes out every interval while the ingest loop runs."""
+    import asyncio
+    while True:
+        await asyncio.sleep(out.interval)
+        out.tick()
+
+async def ingest_with_flush(sources, emit, baudrate, out, metrics=None, keep=None, record=None):
+    import asyncio
+    flusher = asyncio.ensure_future(flush_periodically(out))
     try:
-        if len(data) < 16:
-            print(f"{RED}Insufficient data for Satellite Ephemeris Status Report (Packet ID: 0x{packet_id:X}){RESET}")
-            return
-        sv_prn = data[0]
-        collection_time = struct.unpack('>f', data[1:5])[0]
-        health = data[5]
-        iode = data[6]
-        toe = struct.unpack('>f', data[7:11])[0]
-        fit_interval_flag = data[11]
-        ura = struct.unpack('>f', data[12:16])[0]
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Satellite Ephemeris Status Report{RESET}")
-        print(f" SV PRN #: {GREEN}{sv_prn}{RESET}")
-        print(f" Collection Time: {GREEN}{collection_time:.2f}{RESET} seconds")
-        print(f" Health: {GREEN}{health}{RESET}")
-        print(f" IODE: {GREEN}{iode}{RESET}")
-        print(f" toe: {GREEN}{toe:.2f}{RESET} seconds")
-        print(f" Fit Interval Flag: {GREEN}{fit_interval_flag}{RESET}")
-        print(f" URA: {GREEN}{ura:.2f}{RESET} meters")
-    except Exception as e:
-        print(f"{RED}Error parsing Satellite Ephemeris Status packet: {e}{RESET}")
-
-def parse_packet_70(packet_id, data):
-    """Parses Navigation Filter Configuration (Packet ID 0x70)."""
-    if len(data) < 4:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Navigation Filter Configuration{RESET}")
-        return
+        return await ingest(sources, emit, baudrate, metrics, keep, record)
+    finally:
+        flusher.cancel()
+
+def open_metrics(args):
+    """tsip.metrics.Metrics for --stats/--metrics-port, serving it if asked; else None."""
+    if not (args.stats or args.metrics_port):
+        return None
+    from tsip.metrics import Metrics, serve
+    metrics = Metrics()
+    if args.metrics_port:
+        try:
+            serve(metrics, args.metrics_port, args.metrics_host)
+        except OSError as e:  # port in use, address not local
+            print(f"{RED}Error: could not serve metrics on {args.metrics_host}:{args.metrics_port}: {e}{RESET}")
+            sys.exit(1)
+        print(f"{WHITE}Serving metrics at http://{args.metrics_host}:{args.metrics_port}/metrics{RESET}")
+    return metrics
+
+def open_signal_stats(args, out, clock):
+    """SignalReporter for --signal-stats, or None."""
+    if args.signal_stats is None:
+        return None
+    return SignalReporter(args.signal_stats, args.format, out, clock)
+
+def open_recorder(args, tag):
+    """tsip.capture.CaptureRecorder for --record, saving one source's raw bytes; else None."""
+    if not args.record:
+        return None
+    from tsip.capture import CaptureRecorder
+    prefix = re.sub(r'[^A-Za-z0-9_.]+', '-', tag.removeprefix('/dev/').removeprefix('tcp://')).strip('-.') or 'tsip'
+    recorder = CaptureRecorder(args.record, prefix, args.record_compression, args.rotate_seconds, args.rotate_bytes)
+    print(f"{WHITE}Recording {tag} to {args.record} ({args.record_compression}){RESET}")
+    return recorder
+
+def open_commands(args, port):
+    """tsip.command.CommandScheduler for --send/--poll on an open serial port, or None."""
+    if not args.send and not args.poll:
+        return None
+    commands = CommandScheduler(partial(send_tsip_packet, port), args.baudrate / 10, args.command_timeout,
+                                args.command_retries, log=lambda text: print(f"{YELLOW}Warning: {text}{RESET}"))
+    for packet_id, data in args.send or []:
+        commands.send(packet_id, data)
+    for seconds, packet_id, data in args.poll or []:
+        commands.every(seconds, packet_id, data)
+    return commands
+
+def print_commands(commands):
+    """Per-command counts and reply latency at exit."""
+    for line in commands.lines():
+        print(f"{WHITE}{line}{RESET}")
+
+def close_recorders(recorders):
+    """Finishes the recorders' last segments and reports what they wrote."""
+    for recorder in recorders:
+        recorder.close()
+        print(f"{WHITE}Recorded {recorder.written_bytes} bytes in {len(recorder.segments)} segments to {recorder.directory}{RESET}")
+        if recorder.dropped_bytes:
+            print(f"{YELLOW}Warning: recorder fell behind, dropped {recorder.dropped_bytes} bytes{RESET}")
+        if recorder.error:
+            print(f"{RED}Error: recording stopped: {recorder.error}{RESET}")
+
+def print_stats(metrics):
+    """The --stats report at exit."""
+    for line in metrics.summary():
+        print(f"{WHITE}{line}{RESET}")
+
+class SignalReporter:
+    """--signal-stats: rolling per-PRN signal statistics (tsip.signals), one set per source.
+
+    The statistics are printed every interval seconds of their clock (0: never
+    on a schedule), whenever the process gets SIGUSR1 and at exit: as a
+    {"signal_stats": ...} line with ndjson, a table on the console formats and
+    on stderr with csv and binary, which keep stdout to themselves.
+    """
+
+    def __init__(self, interval, output_format, out, clock='wall'):
+        self.interval = interval
+        self.format = output_format
+        self.out = out
+        self.clock = clock
+        self.stats = {}  # source -> SignalStats
+        self.reported = {}  # source -> clock time of its last scheduled report
+        import signal
+        import threading
+        self.requested = threading.Event()
+        if hasattr(signal, 'SIGUSR1'):  # not on Windows
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.requested.set())
+
+    def update(self, record, source=None):
+        stats = self.stats.get(source)
+        if stats is None:
+            from tsip.signals import SignalStats
+            stats = self.stats[source] = SignalStats(clock=self.clock)
+        if stats.update(record) and self.interval:
+            last = self.reported.setdefault(source, stats.now)
+            if stats.now - last >= self.interval:
+                self.reported[source] = stats.now
+                self.report(source)
+        self.poll()
+
+    def poll(self):
+        """Prints every source's statistics if SIGUSR1 asked for them since the last call."""
+        if self.requested.is_set():
+            self.requested.clear()
+            self.report()
+
+    def report(self, source=None):
+        """Prints the statistics of one source, or of all of them."""
+        for tag in [source] if source is not None or not self.stats else sorted(self.stats, key=str):
+            stats = self.stats.get(tag)
+            if stats is None:
+                continue
+            if self.format == 'ndjson':
+                self.out.write(signal_stats_line(stats.snapshot(), tag))
+                continue
+            target = sys.stdout if self.format in ('color', 'text') else sys.stderr
+            title = f"Signal levels [{tag}]" if tag is not None else "Signal levels"
+            print(f"{WHITE}{title}:{RESET}", file=target)
+            for line in stats.lines():
+                print(f"{GREEN}{line}{RESET}", file=target)
+
+async def serve_source(kind, target, addresses, baudrate=9600, queue_bytes=1 << 20, metrics=None, state=None, keep=None, recorder=None):
+    """Server mode: deframes one source once and broadcasts it to socket clients.
+
+    See tsip.fanout for the subscription protocol; with a ReceiverState the
+    changes and snapshot subscriptions are offered too.  Returns when the source
+    ends, after the clients have been given a moment to drain their queues, or
+    None without serving when the source cannot be opened.
+    """
+    from tsip.fanout import FanOut
+    tag = f"tcp://{target}" if kind == 'tcp' else target
     try:
-        nav1, nav2 = struct.unpack(">HH", data[:4])
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Navigation Filter Configuration{RESET}")
-        print(f"{WHITE} Nav 1:{RESET} {GREEN}{nav1}{RESET}")
-        print(f"{WHITE} Nav 2:{RESET} {GREEN}{nav2}{RESET}")
-    except struct.error as e:
-        print(f"{RED}Error parsing Navigation Filter Configuration packet: {e}{RESET}")
-
-def parse_packet_82(packet_id, data):
-    """Parses Output Rate Control (Packet ID 0x82)."""
-    if len(data) < 2:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Insufficient data for Output Rate Control{RESET}")
-        return
+        chunks = await open_source(kind, target, baudrate)
+    except OSError as e:  # SerialException included
+        print(f"{RED}Error: could not open {tag}: {e}{RESET}")
+        return None
+    fanout = FanOut(queue_bytes, metrics.decode if metrics else parse_tsip_packet,
+                    log=lambda text: print(f"{WHITE}{text}{RESET}", flush=True), state=state)
+    for address in addresses:
+        await fanout.listen(address)
+        print(f"{WHITE}Serving TSIP on {address}{RESET}", flush=True)
+    deframer = TSIPDeframer(raw=True, keep=keep)
+    if metrics is not None:
+        metrics.watch(tag, deframer)
     try:
-        rate_control1, rate_control2 = struct.unpack(">BB", data[:2])
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Output Rate Control{RESET}")
-        print(f"{WHITE} Rate Control 1:{RESET} {GREEN}{rate_control1}{RESET}")
-        print(f"{WHITE} Rate Control 2:{RESET} {GREEN}{rate_control2}{RESET}")
-    except struct.error as e:
-        print(f"{RED}Error parsing Output Rate Control packet: {e}{RESET}")
+        async for chunk in chunks:
+            if recorder:
+                recorder.write(chunk)
+            fanout.publish(deframer.feed(chunk))
+    finally:
+        await fanout.close()
+    return deframer
 
-def parse_tsip_packet(packet):
-    """Parses a TSIP packet based on its ID."""
-    if len(packet) < 1:
-        print(f"{RED}Invalid packet: too short{RESET}")
-        return
+def run_serve(source, args):
+    """--serve: owns the one source and hands its packets to every client."""
+    import asyncio
+    set_color(args.format == 'color')
+    metrics = open_metrics(args)
+    state = None
+    if args.changes:
+        from tsip.state import ReceiverState
+        state = ReceiverState()
+    kind, target = source
+    recorder = open_recorder(args, f"tcp://{target}" if kind == 'tcp' else target)
+    opened = True
+    try:
+        opened = asyncio.run(serve_source(kind, target, args.serve, args.baudrate, args.client_queue, metrics, state, args.keep, recorder)) is not None
+    except KeyboardInterrupt:
+        print(f"{WHITE}Exiting program{RESET}")
+    finally:
+        if recorder:
+            close_recorders([recorder])
+        if args.stats:
+            print_stats(metrics)
+    if not opened:
+        sys.exit(1)
 
-    packet_id = packet[0]
-    data = packet[1:]
-
-    parsers = {
-        0x40: parse_packet_40,
-        0x41: parse_packet_41,
-        0x42: parse_packet_42,
-        0x43: parse_packet_43,
-        0x44: parse_packet_44,
-        0x45: parse_packet_45,
-        0x46: parse_packet_46,
-        0x47: parse_packet_47,
-        0x48: parse_packet_48,
-        0x49: parse_packet_49,
-        0x4A: parse_packet_4A,
-        0x4B: parse_packet_4B,
-        0x54: parse_packet_54,
-        0x55: parse_packet_55,
-        0x5B: parse_packet_5B,
-        0x70: parse_packet_70,
-        0x82: parse_packet_82,
-    }
-
-    parser_function = parsers.get(packet_id)
-    if parser_function:
-        parser_function(packet_id, data)
-    else:
-        print(f"{WHITE}Report Packet: {BLUE}0x{packet_id:02X}{RESET}: Unknown packet, Data: {data.hex()}{RESET}")
+def run_ingest(sources, args):
+    """Decodes several sources at once on one asyncio event loop."""
+    import asyncio
+    counts = Counter()
+    metrics = open_metrics(args)
+    out = open_output(args.format)
+    sink = make_sink(args.format, out, args.changes)
+    signals = open_signal_stats(args, out, 'gps' if all(kind == 'file' for kind, _ in sources) else 'wall')
+    def emit(tag, record):
+        counts[tag, type(record).__name__] += 1
+        if signals:
+            signals.update(record, tag)
+        if not args.quiet:
+            sink(record, tag)
+    recorders = []
+    def record(tag):
+        recorder = open_recorder(args, tag)
+        if recorder:
+            recorders.append(recorder)
+        return recorder
+    print(f"{WHITE}Reading TSIP packets from {len(sources)} sources{RESET}")
+    deframers = []
+    try:
+        deframers = asyncio.run(ingest_with_flush(sources, emit, args.baudrate, out, metrics, args.keep, record))
+    except KeyboardInterrupt:
+        print(f"{WHITE}Exiting program{RESET}")
+    except BrokenPipeError:
+        pass
+    finally:
+        if args.quiet:
+            for (tag, name), count in sorted(counts.items()):
+                print(f"{WHITE}[{tag}] {name}:{RESET} {GREEN}{count}{RESET}")
+            if args.keep and deframers:
+                print(f"{WHITE}Skipped frames:{RESET} {skipped_summary(map(sum, zip(*(d.skipped for d in deframers))))}")
+        if signals:
+            signals.report()
+        close_recorders(recorders)
+        if args.stats:
+            print_stats(metrics)
+        close_output(out)
 
 def main():
     """Main function to read and parse TSIP packets from either serial port or file."""
     parser = argparse.ArgumentParser(description="Read and parse TSIP packets from a serial port or binary file.")
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("-p", "--port", help="Serial port to connect to (e.g., COM3 or /dev/ttyUSB0)")
-    group.add_argument("-f", "--file", help="Binary file containing TSIP packets (use '-' for stdin)")
+    parser.add_argument("-p", "--port", action="append", help="Serial port to connect to (e.g., COM3 or /dev/ttyUSB0); repeat for several receivers")
+    parser.add_argument("-f", "--file", action="append", help="Binary file containing TSIP packets (use '-' for stdin); may be repeated")
+    parser.add_argument("--tcp", action="append", metavar="HOST:PORT", help="Read TSIP from a TCP server, e.g. a serial-to-network bridge; may be repeated")
     parser.add_argument("-b", "--baudrate", type=int, default=9600, help="Baud rate for serial communication (default: 9600, ignored for file input)")
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug output")
+    parser.add_argument("--start-offset", type=lambda x: int(x, 0), default=0, help="First byte of the file to decode (default: 0, file input only)")
+    parser.add_argument("--end-offset", type=lambda x: int(x, 0), default=None, help="Stop decoding at this byte (default: end of file, file input only)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Decode without printing packets, only a count per packet type at exit")
+    parser.add_argument("--queue-size", type=int, default=1 << 20, help="Bytes buffered between the reader thread and the decoder (default: 1 MiB, serial and stdin only)")
+    parser.add_argument("--queue-policy", choices=ChunkQueue.POLICIES, default='spill', help="What to do when the queue is full: block the reader, drop the oldest data or spill to a temporary file (default: spill)")
+    parser.add_argument("--spill-dir", default=None, help="Directory for the spill file (default: system temporary directory)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Output format (default: color on a terminal, text otherwise)")
+    parser.add_argument("--changes", action="store_true", help="Print each report type in full once, then only the fields that changed (color, text and ndjson); with --serve, keep receiver state for 'changes' and 'snapshot' clients")
+    parser.add_argument("--ids", type=parse_ids, default=None, help="Only decode these packet IDs, e.g. 0x42,0x47 (files are read through the index)")
+    parser.add_argument("--only", type=parse_ids, default=None, help="Only deframe these packet IDs, e.g. 0x42,0x47; other frames are skipped unread (any input)")
+    parser.add_argument("--exclude", type=parse_ids, default=None, help="Skip frames with these packet IDs at the deframer")
+    parser.add_argument("--from-tow", type=float, default=None, help="Only packets at or after this GPS time of week (file input, uses the index)")
+    parser.add_argument("--to-tow", type=float, default=None, help="Only packets at or before this GPS time of week (file input, uses the index)")
+    parser.add_argument("--serve", action="append", metavar="ADDRESS", help="Server mode: broadcast the source to clients connecting to [HOST:]PORT or unix:PATH; may be repeated")
+    parser.add_argument("--client-queue", type=int, default=1 << 20, help="Bytes queued per --serve client before its data is dropped (default: 1 MiB)")
+    parser.add_argument("--stats", action="store_true", help="Print packet counts, bytes, decode times and resync/garbage counters at exit")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve the same counters as Prometheus text at http://HOST:PORT/metrics")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address for --metrics-port (default: 127.0.0.1)")
+    parser.add_argument("--record", metavar="DIR", default=None, help="Save the raw input to compressed, rotating capture segments in DIR while decoding")
+    parser.add_argument("--record-compression", choices=COMPRESSIONS, default='gzip', help="Compression of --record segments (default: gzip; zstd needs the zstandard package)")
+    parser.add_argument("--rotate-seconds", type=float, default=3600, help="Start a new --record segment on every multiple of this many seconds, 0 for never (default: 3600)")
+    parser.add_argument("--rotate-bytes", type=int, default=None, help="Start a new --record segment after this many raw bytes (default: no limit)")
+    parser.add_argument("--signal-stats", type=float, default=None, metavar="SECONDS",
+                        help="Keep per-PRN signal level statistics over 1 min, 1 h and 24 h from 0x47 and print them every SECONDS (0: only at exit and on SIGUSR1)")
+    parser.add_argument("--send", type=parse_command, action="append", metavar="ID[:HEXDATA]",
+                        help="Send this command to the receiver once at start, e.g. 0x1F or 0x20:05; may be repeated (single serial port)")
+    parser.add_argument("--poll", type=parse_poll, action="append", metavar="SECONDS:ID[:HEXDATA]",
+                        help="Send this command every SECONDS, e.g. 10:0x26 for the receiver health; may be repeated (single serial port)")
+    parser.add_argument("--command-timeout", type=float, default=2.0, help="Seconds to wait for a command's reply before sending it again (default: 2)")
+    parser.add_argument("--command-retries", type=int, default=2, help="Times a command is sent again before it fails (default: 2)")
     args = parser.parse_args()
 
-    global DEBUG
+    global DEBUG, REFERENCE_WEEK
     DEBUG = args.debug
+    if args.format is None:
+        args.format = 'color' if sys.stdout.isatty() else 'text'
+    if args.changes and args.format in ('csv', 'binary'):
+        parser.error("--changes works with the color, text and ndjson formats")
+    args.keep = id_filter(args.only, args.exclude)
+    if args.record and args.record_compression not in available_compressions():
+        parser.error(f"--record-compression {args.record_compression} needs the zstandard package")
+
+    sources = ([('port', port) for port in args.port or []] +
+               [('stdin', 'stdin') if path == '-' else ('file', path) for path in args.file or []] +
+               [('tcp', address) for address in args.tcp or []])
+    if not sources:
+        parser.error("one of the arguments -p/--port -f/--file --tcp is required")
+    if (args.send or args.poll) and (len(sources) > 1 or sources[0][0] != 'port' or args.serve):
+        parser.error("--send/--poll need a single serial port (-p) and no --serve")
+    if args.serve or len(sources) > 1 or args.tcp:
+        # Several sources or a server read each source whole, with no index to seek with
+        if args.start_offset or args.end_offset is not None or args.from_tow is not None or args.to_tow is not None:
+            parser.error("--start-offset/--end-offset/--from-tow/--to-tow need a single file (-f) and no --serve")
+        if args.ids:  # filter at the deframer like --only
+            args.keep = id_filter(args.ids if args.only is None else args.ids & args.only, args.exclude)
+    if args.serve:
+        if len(sources) > 1:
+            parser.error("--serve takes a single source")
+        run_serve(sources[0], args)
+        return
+    if len(sources) > 1 or args.tcp:
+        run_ingest(sources, args)
+        return
+    args.port = args.port[0] if args.port else None
+    args.file = args.file[0] if args.file else None
+    from tsip.capture import compression_of
+    seekable = bool(args.file and args.file != '-' and not compression_of(args.file))
+    indexed = seekable and bool(args.ids or args.from_tow is not None or args.to_tow is not None)
+    if (args.from_tow is not None or args.to_tow is not None) and not indexed:
+        parser.error("--from-tow/--to-tow need an uncompressed capture file")
 
     input_source = None
-    buffer_queue = bytearray()
+    keep = args.keep
+    if args.ids and not indexed:  # no index to seek with: --ids filters at the deframer like --only
+        keep = id_filter(args.ids if args.only is None else args.ids & args.only, args.exclude)
+    deframer = TSIPDeframer(synced=not (args.file and args.start_offset), keep=keep)
+    out = open_output(args.format)
+    sink = None if args.quiet else make_sink(args.format, out, args.changes)
+    counts = Counter()
+    queue = None
+    stop = None
+    metrics = open_metrics(args)
+    decode = metrics.decode if metrics else parse_tsip_packet
+    signals = open_signal_stats(args, out, 'gps' if args.file else 'wall')
+    recorder = None
+    commands = None
+
+    def handle(packet):
+        record = decode(packet)
+        counts[type(record).__name__] += 1
+        if signals:
+            signals.update(record)
+        if commands:
+            commands.feed(record)
+        if sink:
+            sink(record)
 
     try:
-        if args.port:
+        if args.file and args.file != '-':  # a missing file is reported below
+            from tsip.geo import gps_week_at
+            REFERENCE_WEEK = gps_week_at(os.path.getmtime(args.file))
+        if indexed:
+            # Seek straight to the matching frames through the sidecar index
+            from tsip.index import open_index, query, read_packets
+            records = query(open_index(args.file), args.ids, args.from_tow, args.to_tow)
+            records = records[(records['offset'] >= args.start_offset) &
+                              (records['offset'] < (args.end_offset if args.end_offset is not None else float('inf')))]
+            if args.keep:
+                records = records[[bool(args.keep[packet_id]) for packet_id in records['id'].tolist()]]
+            print(f"{WHITE}Reading {len(records)} indexed TSIP packets from file {args.file}{RESET}")
+            for _, packet in read_packets(args.file, records):
+                handle(packet)
+        elif args.port:
+            import serial
             input_source = serial.Serial(args.port, args.baudrate, timeout=5)
             print(f"{WHITE}Connected to serial port {args.port} at {args.baudrate} baud{RESET}")
+            commands = open_commands(args, input_source)
         elif args.file:
             if args.file == '-':
                 input_source = sys.stdin.buffer  # Read binary from stdin
                 print(f"{WHITE}Reading TSIP packets from stdin{RESET}")
             else:
-                input_source = open(args.file, 'rb')
+                input_source = open_reader(args.file, args.start_offset, args.end_offset)
                 print(f"{WHITE}Reading TSIP packets from file {args.file}{RESET}")
 
-        while True:
-            packet = read_tsip_packet(input_source, buffer_queue)
-            if packet:
-                parse_tsip_packet(packet)
-            elif args.file and not args.port:  # EOF for file input
+        if not indexed and (args.port or args.file == '-'):
+            # Live input: a reader thread keeps draining the port into the queue
+            # however long decoding and printing take.
+            import threading
+            queue = ChunkQueue(args.queue_size, args.queue_policy, args.spill_dir)
+            stop = threading.Event()
+            threading.Thread(target=read_loop, args=(input_source, queue, stop), name="tsip-reader", daemon=True).start()
+        if metrics and not indexed:
+            metrics.watch(args.port or ('stdin' if args.file == '-' else args.file), deframer, queue)
+        if not indexed:
+            recorder = open_recorder(args, args.port or ('stdin' if args.file == '-' else args.file))
+        dropped = 0
+        heard = time.monotonic()  # when data last came in
+
+        while not indexed:
+            if queue:
+                # The command scheduler runs between reads; it says how long it can wait
+                due = commands.tick() if commands else None
+                chunk = queue.get(timeout=5 if due is None else min(due, 5))
+                if queue.dropped_bytes != dropped:
+                    print(f"{YELLOW}Warning: decoder fell behind, dropped {queue.dropped_bytes - dropped} bytes{RESET}")
+                    dropped = queue.dropped_bytes
+                    deframer.resync()
+                if chunk:
+                    heard = time.monotonic()
+                elif not queue.closed:
+                    if time.monotonic() - heard < 5:  # woken for a command, not a timeout
+                        continue
+                    heard = time.monotonic()
+                    print(f"{YELLOW}Timeout or no data received{RESET}")
+                    if signals:
+                        signals.poll()
+                    out.flush()
+                    continue
+            else:
+                chunk = read_chunk(input_source)
+            if chunk:
+                if recorder:
+                    recorder.write(chunk)
+                packets = deframer.feed(chunk)
+            else:  # EOF for file input
+                packets = []
+            for packet in packets:
+                if DEBUG:
+                    queued = f", queued={queue.depth}" if queue else ""
+                    print(f"{WHITE}Debug: Packet read, length={len(packet)}, data={packet.hex()}, buffered={deframer.pending}{queued}{RESET}")
+                handle(packet)
+            out.tick()
+            if not chunk:
+                if deframer.pending:
+                    print(f"{YELLOW}Reached EOF with incomplete packet{RESET}")
                 break
 
-    except serial.SerialException as e:
+    except serial_errors() as e:
         print(f"{RED}Error: Could not open serial port: {e}{RESET}")
     except FileNotFoundError as e:
         print(f"{RED}Error: Could not open file: {e}{RESET}")
     except KeyboardInterrupt:
         print(f"{WHITE}Exiting program{RESET}")
+    except BrokenPipeError:
+        pass
     finally:
-        if args.port and input_source and isinstance(input_source, serial.Serial):
+        if stop:
+            stop.set()
+        if args.quiet:
+            for name, count in sorted(counts.items()):
+                print(f"{WHITE}{name}:{RESET} {GREEN}{count}{RESET}")
+            if keep and not indexed:
+                print(f"{WHITE}Skipped frames:{RESET} {skipped_summary(deframer.skipped)}")
+        if signals:
+            signals.report()
+        if commands and (args.quiet or args.stats):
+            print_commands(commands)
+        if recorder:
+            close_recorders([recorder])
+        if queue and (args.quiet or DEBUG or queue.dropped_bytes or queue.spilled_bytes):
+            print(f"{WHITE}Queue: max depth={queue.max_depth} bytes, dropped={queue.dropped_bytes} bytes, spilled={queue.spilled_bytes} bytes{RESET}")
+        if args.stats:
+            print_stats(metrics)
+        if args.port and input_source and is_serial(input_source):
             input_source.close()
         elif args.file and args.file != '-' and input_source and hasattr(input_source, 'close'):
             input_source.close()
+        close_output(out)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,29 @@
+"""load_capture() through the on-disk cache equals a fresh decode, also for a grown capture."""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from synth_tsip import generate
+from tsip.cache import CaptureCache
+from tsipdecode import COLUMNS_VERSION, decode_dataframes, load_capture
+
+
+def assert_same(tables, expected):
+    assert list(tables) == list(expected)
+    for packet_id, frame in expected.items():
+        pd.testing.assert_frame_equal(tables[packet_id], frame, check_dtype=True)
+
+
+def test_grown_capture_decodes_like_a_full_decode(tmp_path):
+    data = generate(400_000, seed=4, noise=0.01)[0]
+    path = tmp_path / 'capture.bin'
+    cache = CaptureCache(str(tmp_path / 'cache'), version=str(COLUMNS_VERSION))
+    path.write_bytes(data[:150_001])  # cut mid-frame, as a recording is
+    assert_same(load_capture(str(path), cache, reference_week=2290), decode_dataframes(str(path), reference_week=2290))
+    path.write_bytes(data)
+    assert cache.identify(str(path)).previous  # decoded on from the cached part
+    tables = load_capture(str(path), cache, reference_week=2290)
+    assert_same(tables, decode_dataframes(str(path), reference_week=2290))
+    assert_same(load_capture(str(path), cache, reference_week=2290), tables)  # now a cache hit
@@ -0,0 +1,119 @@
+"""CommandScheduler against tools/fake_receiver.py on a pseudo-terminal."""
+import os
+import select
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from fake_receiver import serve
+from replay_pty import open_pty
+from synth_tsip import Receiver
+from tsip.command import CommandScheduler, frame_command
+from tsip.decode import TSIPDeframer
+from tsip.schema import decode_packet
+
+
+@contextmanager
+def fake_receiver(seconds, silent=True, latency=0.05, drop=0.0):
+    """(port fd, dict getting the receiver's counts) of a fake receiver running for seconds."""
+    master, slave, _ = open_pty()
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        counts=serve(master, Receiver(0), seconds, silent, latency, drop, 0)))
+    thread.start()
+    try:
+        yield slave, result
+    finally:
+        thread.join()
+        os.close(master)
+        os.close(slave)
+
+
+def scheduler(port, sent=None, **options):
+    """A CommandScheduler writing to port; sent, if given, gets (time, command ID) of each write."""
+    def send(packet_id, data):
+        if sent is not None:
+            sent.append((time.monotonic(), packet_id))
+        os.write(port, frame_command(packet_id, data))
+    return CommandScheduler(send, **options)
+
+
+def drive(commands, port, seconds):
+    """The decode loop of datumserial.py for seconds: read, feed, tick; returns the records."""
+    deframer = TSIPDeframer()
+    records = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        due = commands.tick()
+        wait = min(due if due is not None else 0.05, 0.05, max(end - time.monotonic(), 0))
+        if select.select([port], [], [], wait)[0]:
+            for packet in deframer.feed(os.read(port, 4096)):
+                record = decode_packet(packet)
+                records.append(record)
+                commands.feed(record)
+    return records
+
+
+def test_replies_are_matched_to_their_commands():
+    with fake_receiver(1.0, latency=0.1) as (port, receiver):
+        commands = scheduler(port)
+        almanac = commands.send(0x20, b'\x05')
+        health = commands.send(0x26)
+        drive(commands, port, 0.9)
+    assert almanac.state == health.state == 'done'
+    assert [entry.prn for entry in almanac.reply.almanacs] == [5]
+    assert health.reply.packet_id in (0x46, 0x4B)
+    assert 0.1 <= almanac.latency < 0.5
+    assert commands.counts[0x20, 'answered'] == commands.counts[0x26, 'answered'] == 1
+    assert receiver['counts'][0x20, 'answered'] == 1
+
+
+def test_unanswered_command_is_retried_then_fails():
+    with fake_receiver(1.5, drop=1.0) as (port, receiver):
+        commands = scheduler(port, timeout=0.3, retries=2)
+        request = commands.send(0x1F)
+        drive(commands, port, 1.4)
+    assert request.state == 'failed'
+    assert request.attempts == 3
+    assert commands.counts[0x1F, 'retried'] == 2 and commands.counts[0x1F, 'failed'] == 1
+    assert receiver['counts'][0x1F, 'received'] == receiver['counts'][0x1F, 'dropped'] == 3
+
+
+def test_commands_are_paced_to_the_rate():
+    sent = []
+    with fake_receiver(1.2) as (port, receiver):
+        commands = scheduler(port, sent, rate=1000.0)  # a 100 byte burst, then 1000 bytes/s
+        for _ in range(10):
+            commands.send(0x25, bytes(100))  # 104 byte frames, no reply expected
+        drive(commands, port, 1.1)
+    assert len(sent) == 10
+    gaps = [later - earlier for (earlier, _), (later, _) in zip(sent, sent[1:])]
+    assert min(gaps) > 0.08  # each frame waits for the credit it uses
+    assert sent[-1][0] - sent[0][0] > 0.85
+    assert receiver['counts'][0x25, 'received'] == 10
+
+
+def test_periodic_poll():
+    with fake_receiver(1.7) as (port, receiver):
+        commands = scheduler(port)
+        poll = commands.every(0.4, 0x27)
+        drive(commands, port, 1.65)
+    assert commands.counts[0x27, 'sent'] == 5  # at 0, 0.4, 0.8, 1.2 and 1.6 s
+    assert commands.counts[0x27, 'answered'] >= 4
+    assert commands.counts[0x27, 'skipped'] == 0
+    assert poll.request.packet_id == 0x27
+
+
+def test_unprompted_report_is_not_taken_for_a_reply():
+    with fake_receiver(3.5, silent=False, latency=0.5) as (port, receiver):
+        commands = scheduler(port)
+        drive(commands, port, 2.2)  # the receiver's own 0x41 arrives every second
+        request = commands.send(0x21)
+        drive(commands, port, 1.2)
+    assert commands.unprompted[0x41] >= 2
+    assert request.state == 'done'
+    assert request.latency is None
+    assert commands.counts[0x21, 'unconfirmed'] == 1
+    assert commands.counts[0x21, 'answered'] == 0 and commands.latency[0x21] == 0
@@ -0,0 +1,41 @@
+"""datumserial.py on a single capture file, and its start-up errors."""
+import csv
+import io
+import json
+import socket
+
+import pytest
+
+
+def test_missing_file(run):
+    done = run('datumserial.py', '-f', 'missing.bin')
+    assert 'Traceback' not in done.stderr
+    assert 'Error: Could not open file' in done.stdout
+
+
+def test_ndjson_stdout_is_only_records(run, sample):
+    done = run('datumserial.py', '-f', sample, '--format', 'ndjson', '--stats')
+    lines = done.stdout.splitlines()
+    assert len(lines) == 5200
+    assert all('id' in json.loads(line) for line in lines)
+    assert 'Reading TSIP packets' in done.stderr
+
+
+def test_csv_stdout_is_only_records(run, sample):
+    done = run('datumserial.py', '-f', sample, '--format', 'csv', '-q')
+    assert done.stdout == ''
+    assert 'GPSTime' in done.stderr
+    rows = list(csv.reader(io.StringIO(run('datumserial.py', '-f', sample, '--format', 'csv').stdout)))
+    assert len(rows) == 5200
+    assert all(row[0].startswith('0x') for row in rows)
+
+
+@pytest.mark.parametrize('extra', [[], ['-f', 'tsip10.bin'], ['--serve', '127.0.0.1:0']])
+def test_metrics_port_in_use(run, sample, extra):
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        done = run('datumserial.py', '-f', sample, *extra, '-q', '--metrics-port', taken.getsockname()[1])
+    assert done.returncode == 1
+    assert 'Traceback' not in done.stderr
+    assert 'could not serve metrics on 127.0.0.1:' in done.stdout
@@ -0,0 +1,82 @@
+"""The incremental deframer against the capture scanners, on synthetic noisy streams."""
+import os
+import random
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from synth_tsip import generate
+from tsip.decode import TSIPDeframer
+from tsip.frame import find_frames, find_frames_plain
+from tsip.schema import id_filter, skipped_summary
+
+DLE_PAIR = bytes([0x10, 0x10])
+
+
+def scanned(data, index, ids, begin, end):
+    return [bytes([packet_id]) + data[b:e].replace(DLE_PAIR, b'\x10') for packet_id, b, e in zip(ids, begin, end)]
+
+
+def fed(data, sizes, synced=True):
+    deframer = TSIPDeframer(synced)
+    packets = []
+    position = 0
+    for size in sizes:
+        packets += deframer.feed(data[position:position + size])
+        position += size
+    return packets + deframer.feed(data[position:])
+
+
+def test_deframer_matches_find_frames():
+    data = generate(300_000, seed=5, dle_share=0.3, noise=0.02)[0]
+    array = np.frombuffer(data, np.uint8)
+    for synced, skip in ((True, 0), (False, 1000)):
+        piece = data[skip:]
+        expected = scanned(piece, *find_frames(array[skip:], synced)[:4])
+        assert len(expected) > 1000
+        assert scanned(piece, *find_frames_plain(piece, synced)[:4]) == expected
+        assert fed(piece, [len(piece)], synced) == expected
+        r = random.Random(skip)
+        assert fed(piece, [r.randint(1, 40) for _ in range(len(piece) // 20)], synced) == expected
+
+
+def test_unclosed_frame_is_dropped_in_bounded_memory():
+    frames = generate(20_000, seed=2, dle_share=0.3)[0]
+    expected = fed(frames, [len(frames)])
+    r = random.Random(0)
+    garbage = bytes([0x10, 0x47]) + bytes(r.choice([b for b in range(256) if b != 0x10]) for _ in range(5000))
+    data = garbage + frames
+    deframer = TSIPDeframer(max_frame=1024)
+    packets = []
+    for position in range(0, len(data), 256):
+        packets += deframer.feed(data[position:position + 256])
+        assert deframer.pending <= 1024 + 2 + 256
+    assert deframer.overruns == 1
+    assert packets == expected[1:]  # the frame found right after the overrun is dropped
+
+
+def test_id_filter_skips_and_counts():
+    data = generate(100_000, seed=7, dle_share=0.3)[0]
+    packets = fed(data, [len(data)])
+    counts = Counter(packet[0] for packet in packets)
+    assert len(counts) > 3
+    for only, exclude in (({0x41, 0x47}, None), (None, {0x41, 0x47}), ({0x41, 0x47}, {0x47})):
+        deframer = TSIPDeframer(keep=id_filter(only, exclude))
+        kept = deframer.feed(data)
+        wanted = [packet_id for packet_id in range(256)
+                  if (only is None or packet_id in only) and packet_id not in (exclude or ())]
+        assert kept == [packet for packet in packets if packet[0] in wanted]
+        assert deframer.skipped == [0 if packet_id in wanted else counts[packet_id] for packet_id in range(256)]
+        assert deframer.packets == len(kept)
+
+
+def test_only_and_exclude_report_skipped_frames(run, sample):
+    every = Counter(packet[0] for packet in fed(open(sample, 'rb').read(), [1 << 30]))
+    only = run('tsipdecode.py', sample, '--only', '0x41,0x47')
+    assert only.returncode == 0
+    assert only.stderr.splitlines()[-1] == 'Skipped frames: ' + skipped_summary(
+        [0 if packet_id in (0x41, 0x47) else every[packet_id] for packet_id in range(256)])
+    exclude = run('tsipdecode.py', sample, '--exclude', '0x41')
+    assert exclude.stderr.splitlines()[-1] == 'Skipped frames: 0x41=%d' % every[0x41]
@@ -0,0 +1,26 @@
+"""Index queries when the sidecar index cannot be written next to the capture."""
+import shutil
+
+
+def unwritable_index(sample, tmp_path):
+    path = tmp_path / 'capture.bin'
+    shutil.copy(sample, path)
+    (tmp_path / 'capture.bin.idx').mkdir()  # opening it for writing fails, even as root
+    return path
+
+
+def test_query_without_sidecar(run, sample, tmp_path):
+    path = unwritable_index(sample, tmp_path)
+    for script in ('tsipdecode.py', 'datumserial.py'):
+        flag = [] if script == 'tsipdecode.py' else ['-f']
+        done = run(script, *flag, path, '--ids', '0x41')
+        assert done.returncode == 0, done.stderr
+        assert 'Traceback' not in done.stderr
+        shutil.copy(sample, tmp_path / 'indexed.bin')
+        assert done.stdout.replace('capture.bin', 'indexed.bin') == run(script, *flag, tmp_path / 'indexed.bin', '--ids', '0x41').stdout
+
+
+def test_build_index_reports_unwritable_sidecar(run, sample, tmp_path):
+    done = run('tsipdecode.py', unwritable_index(sample, tmp_path), '--build-index')
+    assert done.returncode == 1
+    assert 'capture.bin.idx: could not be written' in done.stderr
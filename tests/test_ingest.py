@@ -0,0 +1,84 @@
+"""datumserial.py with several sources: one bad source must not stop the others."""
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from fake_receiver import serve
+from replay_pty import open_pty
+from synth_tsip import Receiver
+
+
+def counts(stdout):
+    """{(tag, type name): count} from the -q summary of a multi-source run."""
+    out = {}
+    for line in stdout.splitlines():
+        if line.startswith('[') and ':' in line:
+            name, _, count = line.rpartition(':')
+            tag, _, kind = name.partition('] ')
+            out[tag[1:], kind] = int(count)
+    return out
+
+
+def test_missing_file_next_to_good_one(run, sample):
+    done = run('datumserial.py', '-f', 'missing.bin', '-f', sample, '-q')
+    assert done.returncode == 0, done.stderr
+    assert 'Traceback' not in done.stderr
+    assert 'could not open missing.bin' in done.stdout
+    assert counts(done.stdout)[sample, 'GPSTime'] > 0
+
+
+def test_missing_port_next_to_good_file(run, sample):
+    done = run('datumserial.py', '-p', '/dev/does-not-exist', '-f', sample, '-q')
+    assert 'Traceback' not in done.stderr
+    assert 'could not open /dev/does-not-exist' in done.stdout
+    assert counts(done.stdout)[sample, 'GPSTime'] > 0
+
+
+def test_stdin_redirected_from_file(run, sample):
+    with open(sample, 'rb') as f:
+        done = run('datumserial.py', '-f', '-', '-f', sample, '-q', stdin=f)
+    assert 'Traceback' not in done.stderr
+    found = counts(done.stdout)
+    assert found['stdin', 'GPSTime'] == found[sample, 'GPSTime'] > 0
+
+
+def test_offsets_rejected_with_several_sources(run, sample):
+    done = run('datumserial.py', '-f', sample, '-f', sample, '--start-offset', '100', '-q')
+    assert done.returncode == 2
+    assert '--start-offset' in done.stderr
+
+
+def test_ids_filter_several_sources(run, sample):
+    found = counts(run('datumserial.py', '-f', sample, '-f', sample, '--ids', '0x41', '-q').stdout)
+    assert {kind for _, kind in found} == {'GPSTime'}
+
+
+def test_two_live_receivers(run):
+    receivers = []
+    for seconds in (3.0, 5.0):
+        master, slave, path = open_pty()
+
+        def receive(master=master, seconds=seconds):
+            serve(master, Receiver(0), seconds, False, 0.05, 0.0, 0)
+            os.close(master)  # the port goes away, as when a receiver is unplugged
+
+        thread = threading.Thread(target=receive)
+        thread.start()
+        receivers.append((thread, slave, path))
+    try:
+        done = run('datumserial.py', '-p', receivers[0][2], '-p', receivers[1][2], '--format', 'ndjson', timeout=20)
+    finally:
+        for thread, slave, _ in receivers:
+            thread.join()
+            os.close(slave)
+    assert 'Traceback' not in done.stderr
+    sources = [json.loads(line).get('source') for line in done.stdout.splitlines()]
+    short, long = receivers[0][2], receivers[1][2]
+    assert set(sources) == {short, long}
+    # Interleaved: the second receiver's records come between the first's, not after them
+    assert sources.index(long) < len(sources) - 1 - sources[::-1].index(short)
+    # Closing the first pty ends only its source: the second goes on for two more epochs
+    assert sources.count(long) > sources.count(short) + 10
+    assert sources[-10:] == [long] * 10
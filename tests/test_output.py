@@ -0,0 +1,24 @@
+"""Output formats: the binary stream reads back as the records written, CSV quotes text."""
+import csv
+import io
+import json
+
+from tsip.decode import read_records
+from tsip.output import binary_record, csv_line, iter_binary, ndjson_line
+from tsip.schema import REPORTS, decode_packet, encode
+
+
+def test_binary_round_trip(sample):
+    records = list(read_records(sample))
+    assert len(records) > 5000
+    back = [decode_packet(packet) for packet in iter_binary(b''.join(map(binary_record, records)))]
+    assert [type(record) for record in back] == [type(record) for record in records]
+    assert list(map(encode, back)) == list(map(encode, records))  # NaN fields compare unequal as records
+
+
+def test_csv_quotes_a_message_with_a_comma():
+    record = REPORTS[0x48].record(b'Almanac, week 652'.ljust(22, b'\0'))
+    line = csv_line(record, source='/dev/ttyUSB0')
+    assert line == '0x48,SystemMessage,/dev/ttyUSB0,"Almanac, week 652"\n'
+    assert next(csv.reader(io.StringIO(line))) == ['0x48', 'SystemMessage', '/dev/ttyUSB0', 'Almanac, week 652']
+    assert json.loads(ndjson_line(record))['message'] == 'Almanac, week 652'
@@ -0,0 +1,65 @@
+"""datumserial.ChunkQueue policies when the decoder falls behind the reader."""
+import os
+import re
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from datumserial import ChunkQueue
+from synth_tsip import generate
+
+
+def drain(queue):
+    queue.close()
+    chunks = []
+    while chunk := queue.get(timeout=1):
+        chunks.append(chunk)
+    return chunks
+
+
+def test_drop_oldest_keeps_the_newest_chunks():
+    queue = ChunkQueue(10, 'drop-oldest')
+    for chunk in (b'aaaa', b'bbbb', b'cccc', b'dd'):
+        queue.put(chunk)
+    assert drain(queue) == [b'bbbb', b'cccc', b'dd']
+    assert queue.dropped_bytes == 4
+    assert queue.max_depth == 10
+    assert queue.spilled_bytes == 0
+
+
+def test_spill_keeps_every_chunk_in_order(tmp_path):
+    queue = ChunkQueue(10, 'spill', spill_dir=tmp_path)
+    for chunk in (b'aaaa', b'bbbb', b'cccc', b'dd'):
+        queue.put(chunk)
+    assert queue.depth == 8
+    assert queue.spilled_bytes == 6  # once spilling, later chunks follow on disk
+    assert b''.join(drain(queue)) == b'aaaabbbbccccdd'
+    assert queue.dropped_bytes == 0
+
+
+def test_block_waits_for_the_decoder():
+    queue = ChunkQueue(10, 'block')
+    queue.put(b'aaaa')
+    queue.put(b'bbbb')
+    writer = threading.Thread(target=queue.put, args=(b'cccc',))
+    writer.start()
+    writer.join(0.2)
+    assert writer.is_alive()  # 12 bytes would not fit
+    assert queue.get() == b'aaaa'
+    writer.join(1)
+    assert not writer.is_alive()
+    assert drain(queue) == [b'bbbb', b'cccc']
+    assert queue.dropped_bytes == queue.spilled_bytes == 0
+    assert queue.max_depth == 8
+
+
+def test_drop_resyncs_the_deframer(run, tmp_path):
+    path = tmp_path / 'synth.bin'
+    path.write_bytes(generate(3_000_000, seed=1)[0])
+    with open(path, 'rb') as f:
+        done = run('datumserial.py', '-f', '-', '--queue-policy', 'drop-oldest', '--queue-size', 64, '--stats', '-q', stdin=f)
+    assert done.returncode == 0, done.stderr
+    drops = done.stdout.count('decoder fell behind')
+    stats = re.search(r'resyncs=(\d+).*dropped bytes=(\d+)', done.stdout)
+    assert drops and int(stats[2]) > 0
+    assert int(stats[1]) >= drops
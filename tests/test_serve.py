@@ -0,0 +1,9 @@
+"""datumserial.py --serve: the source is opened before any client is served."""
+
+
+def test_missing_source(run):
+    done = run('datumserial.py', '-f', 'missing.bin', '--serve', '127.0.0.1:0')
+    assert done.returncode == 1
+    assert 'Traceback' not in done.stderr
+    assert 'could not open missing.bin' in done.stdout
+    assert 'Serving TSIP' not in done.stdout
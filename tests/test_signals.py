@@ -0,0 +1,60 @@
+"""SignalStats windows on hand-made 0x47 reports at chosen times."""
+import struct
+
+from tsip.schema import decode_packet
+from tsip.signals import SignalStats
+
+
+def levels(*pairs):
+    """Decoded 0x47 report of (PRN, level) pairs."""
+    return decode_packet(bytes([0x47, len(pairs)]) + b''.join(struct.pack('>Bf', *pair) for pair in pairs))
+
+
+def gps_time(time_of_week, week=2200):
+    return decode_packet(bytes([0x41]) + struct.pack('>fhf', time_of_week, week, 18.0))
+
+
+def test_window_rolls_over_and_old_buckets_expire():
+    stats = SignalStats(windows=(60,), buckets=6)  # 10 s buckets
+    stats.update(levels((3, 40.0)), now=5)
+    stats.update(levels((3, 20.0), (5, 30.0)), now=35)
+    window = stats.snapshot()['1m']
+    assert window[3]['samples'] == 2 and window[3]['mean'] == 30.0
+    assert (window[3]['min'], window[3]['max'], window[3]['stddev']) == (20.0, 40.0, 10.0)
+    # At 65 s the bucket of 5 s has left the window; the one of 35 s is still in
+    window = stats.snapshot(now=65)['1m']
+    assert window[3]['samples'] == 1 and window[3]['mean'] == 20.0
+    # A report at 65 s takes over the ring slot of the 0 s bucket
+    stats.update(levels((3, 60.0)), now=65)
+    window = stats.snapshot()['1m']
+    assert window[3]['samples'] == 2 and window[3]['mean'] == 40.0
+    assert window[5]['samples'] == 1 and window[5]['dropouts'] == 1  # PRN 5 missing from the 65 s report
+    # A report older than the ring reaches back is dropped, not merged into the reused slot
+    stats.windows[0].add(5, {3: [1, 99.0, 99.0 ** 2, 99.0, 99.0, 0]})
+    assert stats.snapshot()['1m'][3]['samples'] == 2
+    # Once every bucket is older than the window, nothing is left
+    assert stats.snapshot(now=200) == {'1m': {}}
+
+
+def test_windows_share_reports_and_expire_independently():
+    stats = SignalStats(windows=(60, 3600), buckets=6)
+    for second in range(0, 600, 10):
+        stats.update(levels((7, 45.0)), now=second)
+    snapshot = stats.snapshot()
+    assert snapshot['1m'][7]['samples'] == 6
+    assert snapshot['1h'][7]['samples'] == 60
+    later = stats.snapshot(now=2000)
+    assert later['1m'] == {} and later['1h'][7]['samples'] == 60
+
+
+def test_gps_clock_waits_for_confirmed_time():
+    stats = SignalStats(windows=(60,), buckets=6, clock='gps')
+    assert not stats.update(levels((3, 40.0)))
+    assert stats.untimed == 1
+    for second in range(10):
+        stats.update(gps_time(1000.0 + second))
+    assert stats.now == 2200 * 604800 + 1009
+    assert stats.update(levels((3, 40.0)))
+    stats.update(gps_time(500_000.0))  # a lone jump does not move the clock
+    assert stats.now == 2200 * 604800 + 1009
+    assert stats.snapshot()['1m'][3]['samples'] == 1
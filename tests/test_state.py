@@ -0,0 +1,58 @@
+"""ReceiverState.update(): only what changed, and the satellites that dropped out."""
+import math
+
+from tsip.schema import REPORTS, UnknownPacket
+from tsip.state import ReceiverState
+
+HEALTH = REPORTS[0x46].record
+SIGNALS = REPORTS[0x47].record
+LEVEL = REPORTS[0x47].entry
+EPHEMERIS = REPORTS[0x5B].record
+ALMANAC = REPORTS[0x40].record
+ALMANAC_ENTRY = REPORTS[0x40].entry
+
+
+def signals(*levels):
+    return SIGNALS(len(levels), [LEVEL(prn, level) for prn, level in levels])
+
+
+def test_only_changed_fields():
+    state = ReceiverState()
+    assert state.update(HEALTH(0, 0)) == (True, {'status_code': 0, 'error_code': 0})
+    assert state.update(HEALTH(0, 0)) == (False, {})
+    assert state.update(HEALTH(1, 0)) == (False, {'status_code': 1})
+    assert state.packets == 3 and state.changed == 2
+    assert state.get(0x46) == HEALTH(1, 0)
+
+
+def test_nan_is_not_a_change():
+    state = ReceiverState()
+    state.update(EPHEMERIS(5, math.nan, 0, 1, 100.0, 0, 2.0))
+    assert state.update(EPHEMERIS(5, math.nan, 0, 1, 100.0, 0, 2.0)) == (False, {})
+    assert state.update(EPHEMERIS(5, math.nan, 0, 2, 100.0, 0, 2.0)) == (False, {'sv_prn': 5, 'iode': 2})
+    assert state.update(EPHEMERIS(9, 1.0, 0, 2, 100.0, 0, 2.0))[0]  # another satellite is new
+
+
+def test_signal_levels_report_removed_satellites():
+    state = ReceiverState()
+    state.update(signals((3, 10.0), (5, 12.5), (9, 7.0)))
+    first, changes = state.update(signals((3, 10.0), (5, 13.0)))
+    assert not first
+    assert changes == {'count': 2, 'signals': {5: LEVEL(5, 13.0), 9: None}}
+    assert state.update(signals((3, 10.0), (5, 13.0))) == (False, {})
+    assert sorted(state.snapshot()['SignalLevels']['signals']) == [3, 5]
+
+
+def test_almanac_entries_accumulate():
+    state = ReceiverState()
+    entry = ALMANAC_ENTRY(3, 652, 0, 100, 98, 3000, -8e-9, 5153.6, 0.1, 0.2, 0.3, 1e-5)
+    state.update(ALMANAC([entry]))
+    _, changes = state.update(ALMANAC([entry._replace(prn=7)]))
+    assert changes == {'almanacs': {7: entry._replace(prn=7)}}  # PRN 3 is not gone
+    assert sorted(state.groups[0x40, None]) == [3, 7]
+
+
+def test_unknown_packets_are_not_kept():
+    state = ReceiverState()
+    assert state.update(UnknownPacket(0x99, b'\x01')) == (True, {})
+    assert state.latest == {}
@@ -0,0 +1,64 @@
+"""tsipdecode.py on capture directories, on several processes and on synthetic streams."""
+import os
+import shutil
+import struct
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from synth_tsip import frame, generate
+from tsip.almanac import AlmanacStore, check_visibility
+from tsipdecode import LEGACY_41, TIME_41, convert_columns, decode_columns
+
+
+def test_directory_with_one_capture(run, sample, tmp_path):
+    shutil.copy(sample, tmp_path / 'only.bin')
+    done = run('tsipdecode.py', tmp_path)
+    assert done.returncode == 0, done.stderr
+    assert done.stdout == run('tsipdecode.py', sample).stdout
+
+
+def test_directory_without_captures(run, tmp_path):
+    done = run('tsipdecode.py', tmp_path)
+    assert done.returncode == 2
+    assert 'no captures in' in done.stderr
+
+
+def test_jobs_output_identical(run, tmp_path):
+    path = tmp_path / 'synth.bin'
+    path.write_bytes(generate(2_000_000, seed=7, noise=0.01)[0])
+    single = run('tsipdecode.py', path, '-j', 1)
+    assert single.returncode == 0, single.stderr
+    for jobs in (2, 5):
+        assert run('tsipdecode.py', path, '-j', jobs).stdout == single.stdout
+
+
+def test_legacy_reads_utc_offset_like_the_original(run, sample):
+    done = run('tsipdecode.py', '--legacy', sample)
+    line = next(line for line in done.stdout.splitlines() if line.startswith('0x41'))
+    index = int(line.split(',')[1], 16)
+    with open(sample, 'rb') as f:
+        data = f.read()
+    assert line.endswith('Offset_Sec:,%s' % LEGACY_41.unpack_from(data, index + 2)[2])
+    assert LEGACY_41.unpack_from(data, index + 2)[:2] == TIME_41.unpack_from(data, index + 2)[:2]
+
+
+def test_legacy_reads_dops_like_the_original(run, tmp_path):
+    path = tmp_path / 'dops.bin'
+    path.write_bytes(frame(0x44, struct.pack('>5B4f', 4, 1, 2, 3, 4, 1.5, 2.5, 3.5, 4.5)))
+    done = run('tsipdecode.py', '--legacy', path)
+    assert done.stdout == ('0x44, 0 , Mode 0x4 ,Auto 4-satellite, 3D,SV1: 1 ,SV2: 2 ,SV3: 3 ,SV4: 4,'
+                           'PDOP: 2.2540104177017363e-36 ,HDOP:5.888951191131186e-39 ,VDOP:5.911910065170684e-39 ,TDOP:4.5\n')
+
+
+def test_synthetic_receiver_tracks_satellites_in_view(tmp_path):
+    path = tmp_path / 'synth.bin'
+    path.write_bytes(generate(500_000, seed=3, dle_share=0.0)[0])
+    tables = decode_columns(str(path))
+    store = AlmanacStore()
+    store.update_tables(tables)
+    elevation = check_visibility(convert_columns(tables), store)['tracked']['elevation']
+    elevation = elevation[~np.isnan(elevation)]
+    assert elevation.size > 10000
+    assert (elevation > 4.0).all()  # the set is rechecked every 30 s
@@ -0,0 +1,221 @@
+"""Decode speed and memory of datumserial.py and tsipdecode.py on synthetic captures.
+
+A stream from tools/synth_tsip.py is written to a temporary capture and each
+decoder runs over it:
+
+    datumserial         TSIPDeframer + decode_packet, READ_SIZE chunks
+    datumserial-text    the same, rendered as --format text into a null stream
+    tsipdecode          vectorized scan with the text formatters
+    tsipdecode-columns  decode_columns, one structured array per report type
+
+For each the best of --repeat runs gives packets/s and MB/s, and a separate run
+under tracemalloc the peak Python/NumPy allocation.  Then every report type is
+timed on its own as microseconds per packet.
+
+Results are compared with a saved baseline (tools/bench_baseline.json by
+default); a throughput or per-type cost more than --tolerance worse than the
+baseline, or a larger memory peak, is reported as a regression and the exit
+status is 1.  --save writes the current results as the new baseline.  Timings
+depend on the machine, so save the baseline on the one you compare on.
+Run from the repository root:
+
+    python tools/bench_decode.py
+    python tools/bench_decode.py --bytes 20000000 --save
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datumserial
+import tsipdecode
+from synth_tsip import generate
+from tsip.capture import MappedCapture
+from tsip.decode import TSIPDeframer
+from tsip.output import BatchWriter
+from tsip.schema import REPORTS, decode_packet
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+
+def run_datumserial(path):
+    deframer = TSIPDeframer()
+    capture = MappedCapture(path)
+    try:
+        while True:
+            chunk = capture.read(datumserial.READ_SIZE)
+            if not chunk:
+                break
+            for packet in deframer.feed(chunk):
+                decode_packet(packet)
+    finally:
+        capture.close()
+
+
+def run_datumserial_text(path):
+    datumserial.set_color(False)
+    deframer = TSIPDeframer()
+    capture = MappedCapture(path)
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as null:
+        sys.stdout = out = BatchWriter(null)
+        try:
+            while True:
+                chunk = capture.read(datumserial.READ_SIZE)
+                if not chunk:
+                    break
+                for packet in deframer.feed(chunk):
+                    datumserial.print_record(decode_packet(packet))
+            out.flush()
+        finally:
+            sys.stdout = stdout
+            capture.close()
+
+
+def run_tsipdecode(path):
+    tsipdecode.scan_file(path, scan=lambda data, base, synced: tsipdecode.format_frames(data, base, synced)[1])
+
+
+def run_tsipdecode_columns(path):
+    tsipdecode.decode_columns(path)
+
+
+DECODERS = {
+    'datumserial': run_datumserial,
+    'datumserial-text': run_datumserial_text,
+    'tsipdecode': run_tsipdecode,
+    'tsipdecode-columns': run_tsipdecode_columns,
+}
+
+
+def best_time(run, path, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(run, path):
+    """Peak bytes allocated while run decodes path, per tracemalloc."""
+    tracemalloc.start()
+    try:
+        run(path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def write_capture(directory, name, data):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def measure(args, directory):
+    data, counts = generate(args.bytes, args.seed, args.dle_share, args.noise)
+    path = write_capture(directory, 'synth.bin', data)
+    packets = sum(counts.values())
+    print(f"{len(data)} bytes, {packets} packets, dle share {args.dle_share}, noise {args.noise}")
+    results = {'throughput': {}, 'per_type': {}}
+    for name, run in DECODERS.items():
+        seconds = best_time(run, path, args.repeat)
+        results['throughput'][name] = {
+            'packets_per_s': packets / seconds,
+            'mb_per_s': len(data) / seconds / 1e6,
+            'peak_mb': peak_memory(run, path) / 1e6,
+        }
+    for packet_id in sorted(REPORTS):
+        data, counts = generate(args.type_bytes, args.seed, args.dle_share, 0.0, {packet_id})
+        path = write_capture(directory, f'synth_{packet_id:02X}.bin', data)
+        for name, run in DECODERS.items():
+            seconds = best_time(run, path, args.repeat)
+            results['per_type'].setdefault(name, {})[f'0x{packet_id:02X}'] = seconds / counts[packet_id] * 1e6
+    return results
+
+
+def change(value, base, higher_is_better):
+    """Relative change, positive when worse."""
+    return (base - value) / base if higher_is_better else (value - base) / base
+
+
+def report(results, baseline, tolerance):
+    """Prints the results next to the baseline; returns the regressions found."""
+    regressions = []
+
+    def cell(value, base, higher_is_better, label):
+        if base is None:
+            return f"{value:>10.2f} {'':>8}"
+        worse = change(value, base, higher_is_better)
+        if worse > tolerance:
+            regressions.append(f"{label}: {value:.2f} vs baseline {base:.2f}")
+        return f"{value:>10.2f} {-worse if higher_is_better else worse:>+8.1%}"
+
+    base = baseline.get('throughput', {}) if baseline else {}
+    print(f"\n{'decoder':<20} {'packets/s':>10} {'change':>8} {'MB/s':>10} {'change':>8} {'peak MB':>10} {'change':>8}")
+    for name, row in results['throughput'].items():
+        old = base.get(name, {})
+        print(f"{name:<20} "
+              f"{cell(row['packets_per_s'], old.get('packets_per_s'), True, f'{name} packets/s')} "
+              f"{cell(row['mb_per_s'], old.get('mb_per_s'), True, f'{name} MB/s')} "
+              f"{cell(row['peak_mb'], old.get('peak_mb'), False, f'{name} peak MB')}")
+
+    base = baseline.get('per_type', {}) if baseline else {}
+    names = list(results['per_type'])
+    print(f"\nmicroseconds per packet\n{'type':<24}" + ''.join(f" {name:^19}" for name in names))
+    for packet_id in sorted(REPORTS):
+        key = f'0x{packet_id:02X}'
+        line = f"{key} {REPORTS[packet_id].record.__name__:<19}"
+        for name in names:
+            value = results['per_type'][name][key]
+            old = base.get(name, {}).get(key)
+            line += f" {cell(value, old, False, f'{name} {key} us/packet')}"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TSIP decoders on synthetic captures.")
+    parser.add_argument("--bytes", type=lambda x: int(float(x)), default=4_000_000, help="Size of the mixed capture (default: 4 MB)")
+    parser.add_argument("--type-bytes", type=lambda x: int(float(x)), default=200_000, help="Size of each single-type capture (default: 200 kB)")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed (default: 0)")
+    parser.add_argument("--dle-share", type=float, default=0.1, help="Fraction of packets with a 0x10 data byte (default: 0.1)")
+    parser.add_argument("--noise", type=float, default=0.0, help="Fraction of frames preceded by line noise (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement, the best is kept (default: 3)")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file (default: tools/bench_baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a regression is reported (default: 0.25)")
+    parser.add_argument("--save", action="store_true", help="Save these results as the baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = measure(args, directory)
+    baseline = None
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Baseline: {args.baseline} ({baseline['machine']}, Python {baseline['python']})")
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save:
+        results.update(machine=platform.platform(), python=platform.python_version(),
+                       settings={key: getattr(args, key) for key in ('bytes', 'type_bytes', 'seed', 'dle_share', 'noise')})
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
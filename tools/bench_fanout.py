@@ -0,0 +1,75 @@
+"""CPU cost of datumserial.py --serve as the number of subscribers grows.
+
+For each client count a server is started on stdin, that many clients connect
+(raw or ndjson), the capture is piped through and the server's CPU time is
+taken from its resource usage at exit.  With raw subscribers the time should
+stay about flat.  Run from the repository root:
+
+    python tools/bench_fanout.py                     # 1, 8, 32 and 64 raw clients
+    python tools/bench_fanout.py -n 1 16 --mode ndjson --capture tsip10.bin
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def read_all(sock, received, k):
+    while chunk := sock.recv(1 << 16):
+        received[k] += len(chunk)
+    sock.close()
+
+
+def run(clients, data, mode, port):
+    """Returns (server CPU seconds, wall seconds, bytes each client received)."""
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'datumserial.py'), '-f', '-', '--serve', str(port)],
+                              stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()  # subscribes raw, then leaves
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    received = [0] * clients
+    readers = []
+    for k in range(clients):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(f"{mode}\n".encode())
+        readers.append(threading.Thread(target=read_all, args=(sock, received, k)))
+        readers[-1].start()
+    time.sleep(0.5)
+    start = time.perf_counter()
+    server.stdin.write(data)
+    server.stdin.close()
+    _, _, usage = os.wait4(server.pid, 0)
+    for reader in readers:
+        reader.join()
+    server.returncode = 0  # reaped by wait4() above
+    return usage.ru_utime + usage.ru_stime, time.perf_counter() - start, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark datumserial.py --serve with many subscribers.")
+    parser.add_argument("-n", "--clients", type=int, nargs='+', default=[1, 8, 32, 64], help="Client counts to run (default: 1 8 32 64)")
+    parser.add_argument("--mode", choices=('raw', 'ndjson'), default='raw', help="Subscription of every client (default: raw)")
+    parser.add_argument("--capture", default="tsip10.bin", help="Capture piped to the server (default: tsip10.bin)")
+    parser.add_argument("--bytes", type=int, default=4 << 20, help="Bytes piped through (default: 4 MiB)")
+    parser.add_argument("--port", type=int, default=5099, help="TCP port for the server (default: 5099)")
+    args = parser.parse_args()
+
+    capture = open(args.capture, 'rb').read()
+    data = capture * max(1, args.bytes // len(capture))
+    print(f"{len(data)} bytes, {args.mode} subscribers")
+    print(f"{'clients':>7} {'CPU s':>7} {'wall s':>7} {'MB out':>8} {'min MB/client':>14}")
+    for clients in args.clients:
+        cpu, wall, received = run(clients, data, args.mode, args.port)
+        print(f"{clients:>7} {cpu:>7.2f} {wall:>7.2f} {sum(received) / 1e6:>8.1f} {min(received) / 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
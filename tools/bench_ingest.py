@@ -0,0 +1,80 @@
+"""Throughput of datumserial's asyncio ingest with simulated receivers.
+
+Each receiver is a pseudo-terminal pair: a writer thread pushes a capture into
+the master side as fast as the pty takes it and the ingest loop reads the
+slave side as a serial port, so no hardware is needed.  Run from the
+repository root:
+
+    python tools/bench_ingest.py                 # 1, 4 and 16 receivers
+    python tools/bench_ingest.py -n 2 8 --bytes 4000000 --capture tsip7.bin
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import datumserial
+
+
+def write_all(master, data):
+    """Writer thread: feeds data to the master side of a pty."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(master, view):]
+
+
+async def run(receivers, data, expected):
+    """Decodes `receivers` ptys at once; returns (seconds, packets)."""
+    done = asyncio.Event()
+    count = [0]
+
+    def emit(tag, record):
+        count[0] += 1
+        if count[0] == expected * receivers:
+            done.set()
+
+    ports = [os.openpty() for _ in range(receivers)]
+    for master, slave in ports:
+        tty.setraw(master)
+        tty.setraw(slave)
+    task = asyncio.ensure_future(datumserial.ingest([('port', os.ttyname(slave)) for _, slave in ports], emit))
+    await asyncio.sleep(0.2)  # let every port open before data arrives
+    start = time.perf_counter()
+    for master, _ in ports:
+        threading.Thread(target=write_all, args=(master, data), daemon=True).start()
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    for master, slave in ports:
+        os.close(master)
+        os.close(slave)
+    return elapsed, count[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark asyncio multi-receiver ingest over pty pairs.")
+    parser.add_argument("-n", "--receivers", type=int, nargs='+', default=[1, 4, 16], help="Receiver counts to run (default: 1 4 16)")
+    parser.add_argument("--capture", default="tsip10.bin", help="Capture each receiver replays (default: tsip10.bin)")
+    parser.add_argument("--bytes", type=int, default=1 << 20, help="Bytes sent per receiver (default: 1 MiB)")
+    args = parser.parse_args()
+
+    capture = open(args.capture, 'rb').read()
+    data = capture * max(1, args.bytes // len(capture))
+    expected = len(datumserial.TSIPDeframer().feed(data))
+    print(f"{len(data)} bytes, {expected} packets per receiver")
+    print(f"{'receivers':>9} {'seconds':>8} {'packets/s':>10} {'MB/s':>7}")
+    for receivers in args.receivers:
+        elapsed, packets = asyncio.run(run(receivers, data, expected))
+        print(f"{receivers:>9} {elapsed:>8.2f} {packets / elapsed:>10.0f} {receivers * len(data) / elapsed / 1e6:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
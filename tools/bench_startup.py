@@ -0,0 +1,114 @@
+"""Start-up time of the decoders on a tiny capture, import included.
+
+Each command runs in a fresh interpreter (this one, sys.executable) --repeat
+times and the median and best wall times are reported in milliseconds:
+
+    python              the bare interpreter, for reference
+    import tsip.decode  the pure-Python decoding core on its own
+    decode_bytes        import tsip.decode and decode the capture
+    tsipdecode          tsipdecode.main(), the default text output
+    datumserial -f      datumserial.main() on the file, quiet
+
+Each command runs once untimed first, so the timed runs find the bytecode
+cache written.  The decoders are imported rather than run as scripts because
+Python never caches a script's own bytecode: 'python tsipdecode.py' spends
+another 10 ms or so compiling it on every start.
+
+The capture is the first --bytes of tsip10.bin (or of a stream from
+tools/synth_tsip.py when it is missing).  None of these should import NumPy,
+pandas or pyserial; a command that does is flagged, and one whose median is
+over --target milliseconds is reported as slow and the exit status is 1.
+The default target is 60 ms: the bare interpreter takes 15 to 20 ms of it,
+and argparse another 15 to 20 ms once it has loaded gettext, locale and
+shutil to build a parser, which leaves the two programs with little to trim.
+The decoding core on its own stays well under 50 ms.
+Run from the repository root:
+
+    python tools/bench_startup.py
+    python tools/bench_startup.py --repeat 50 --target 40
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('numpy', 'pandas', 'serial', 'asyncio')
+# Put before each command: which HEAVY modules are loaded at exit
+PROBE = ("import atexit, sys; "
+         "atexit.register(lambda: print(','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr))")
+
+
+def tiny_capture(size):
+    """First size bytes of tsip10.bin, or of a synthetic stream."""
+    sample = os.path.join(ROOT, 'tsip10.bin')
+    if os.path.exists(sample):
+        with open(sample, 'rb') as f:
+            return f.read(size)
+    from synth_tsip import generate
+    return generate(size)
+
+
+def commands(path):
+    python = sys.executable
+    entry = "import sys; sys.argv[1:] = {argv!r}; import {module}; {module}.main()"
+    return [
+        ('python', [python, '-c', 'pass']),
+        ('import tsip.decode', [python, '-c', 'import tsip.decode']),
+        ('decode_bytes', [python, '-c', f"from tsip.decode import decode_bytes; "
+                                        f"decode_bytes(open({path!r}, 'rb').read())"]),
+        ('tsipdecode', [python, '-c', entry.format(argv=[path], module='tsipdecode')]),
+        ('datumserial -f', [python, '-c', entry.format(argv=['-f', path, '-q'], module='datumserial')]),
+    ]
+
+
+def run(argv, env):
+    """(wall seconds, heavy modules loaded) of one run, its output thrown away."""
+    argv = argv[:-1] + [PROBE.format(heavy=HEAVY) + '\n' + argv[-1]]
+    start = time.perf_counter()
+    done = subprocess.run(argv, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if done.returncode:
+        raise SystemExit(f"{argv[-1]} failed:\n{done.stderr}")
+    return elapsed, done.stderr.strip().splitlines()[-1] if done.stderr.strip() else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time decoder start-up on a tiny capture.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of each command (default: 20)")
+    parser.add_argument("--bytes", type=int, default=2000, help="Size of the tiny capture (default: 2000)")
+    parser.add_argument("--target", type=float, default=60.0, help="Median milliseconds allowed (default: 60)")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as f:
+        f.write(tiny_capture(args.bytes))
+        path = f.name
+    # Let the first run of each command write its bytecode, as an installed copy would have
+    env = {name: value for name, value in os.environ.items() if name != 'PYTHONDONTWRITEBYTECODE'}
+    slow = False
+    try:
+        print(f"{args.bytes} byte capture, {args.repeat} runs each, {sys.executable}")
+        print(f"{'':<20} {'median ms':>10} {'best ms':>10}  loaded")
+        for label, argv in commands(path):
+            run(argv, env)
+            times, loaded = [], ''
+            for _ in range(args.repeat):
+                elapsed, loaded = run(argv, env)
+                times.append(elapsed * 1e3)
+            median = statistics.median(times)
+            verdict = ''
+            if label != 'python' and median > args.target:
+                verdict = f"  SLOW (> {args.target:g} ms)"
+                slow = True
+            print(f"{label:<20} {median:>10.1f} {min(times):>10.1f}  {loaded or '-'}{verdict}")
+    finally:
+        os.unlink(path)
+    sys.exit(1 if slow else 0)
+
+
+if __name__ == "__main__":
+    main()
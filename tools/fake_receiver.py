@@ -0,0 +1,149 @@
+"""A simulated Datum 9390 on a pseudo-terminal that answers TSIP commands.
+
+The slave side of a new pty (/dev/pts/N, printed at start) behaves like the
+receiver's serial port: every second it sends the reports the receiver sends
+unprompted (tools/synth_tsip.py's epoch, or nothing with --silent), and it
+answers the commands of tsip.command.COMMANDS with their reply reports, e.g.
+0x26 with 0x46 and 0x4B, or 0x20 with the 0x40 almanac of the PRN asked for.
+Commands it does not know are counted and ignored.
+
+--latency delays every reply and --drop ignores that share of the commands,
+so timeouts and retries can be watched; --run starts the decoder on the pty
+({pty}, {baud} and {python} are filled in) and stops it after --seconds.
+At the end the commands received, answered and dropped are printed per ID.
+Run from the repository root:
+
+    python tools/fake_receiver.py                              # attach by hand
+    python tools/fake_receiver.py --seconds 20 --drop 0.3 --run "{python} datumserial.py -p {pty} -q --poll 1:0x26 --send 0x20:05"
+"""
+import argparse
+import heapq
+import os
+import random
+import select
+import shlex
+import subprocess
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from replay_pty import ROOT, open_pty
+from synth_tsip import EPOCH_IDS, Receiver, frame, packet_data
+from tsip.command import COMMANDS, command_name
+from tsip.decode import TSIPDeframer
+from tsip.schema import REPORTS
+
+DECODER = "{python} datumserial.py -p {pty} -b {baud} -q --poll 1:0x26 --poll 2:0x27 --poll 5:0x1F --send 0x20:05"
+
+
+def replies(receiver, packet_id, data):
+    """Framed reply reports to one command: b'' for a command without a reply, None for an unknown one."""
+    command = COMMANDS.get(packet_id)
+    if command is None:
+        return None
+    out = []
+    for reply_id in command.replies:
+        if reply_id == 0x40 and data and data[0] in receiver.almanacs:
+            entry = REPORTS[0x40].entry._make(receiver.almanacs[data[0]])
+            payload = REPORTS[0x40].encode(receiver.record(0x40)._replace(almanacs=[entry]))
+        elif reply_id == 0x5B and data and data[0]:
+            payload = REPORTS[0x5B].encode(receiver.record(0x5B)._replace(sv_prn=data[0]))
+        else:
+            payload = packet_data(receiver, reply_id, 0.0)
+        out.append(frame(reply_id, payload))
+    return b''.join(out)
+
+
+def serve(master, receiver, seconds, silent, latency, drop, seed, decoder=None):
+    """Runs the receiver on the pty for seconds (None: until interrupted); returns its Counter."""
+    r = random.Random(seed)
+    deframer = TSIPDeframer()
+    counts = Counter()
+    pending = []  # (due, sequence, framed replies)
+    outgoing = bytearray()
+    start = time.monotonic()
+    end = start + seconds if seconds else None
+    next_epoch = start
+    sequence = 0
+    while end is None or time.monotonic() < end:
+        if decoder is not None and decoder.poll() is not None:
+            break
+        now = time.monotonic()
+        if now >= next_epoch:
+            if not silent:
+                outgoing += b''.join(frame(packet_id, packet_data(receiver, packet_id, 0.0)) for packet_id in EPOCH_IDS)
+            receiver.step()
+            next_epoch += 1.0
+        while pending and pending[0][0] <= now:
+            outgoing += heapq.heappop(pending)[2]
+        wake = min(next_epoch, pending[0][0] if pending else next_epoch, end or next_epoch)
+        readable, writable, _ = select.select([master], [master] if outgoing else [], [], max(wake - now, 0))
+        if readable:
+            try:
+                data = os.read(master, 4096)
+            except BlockingIOError:
+                data = b''
+            for packet in deframer.feed(data):
+                packet_id, data = packet[0], bytes(packet[1:])
+                counts[packet_id, 'received'] += 1
+                answer = replies(receiver, packet_id, data)
+                if answer is None:
+                    counts[packet_id, 'unknown'] += 1
+                elif r.random() < drop:
+                    counts[packet_id, 'dropped'] += 1
+                elif answer:
+                    counts[packet_id, 'answered'] += 1
+                    sequence += 1
+                    heapq.heappush(pending, (time.monotonic() + latency, sequence, answer))
+        if writable:
+            try:
+                del outgoing[:os.write(master, outgoing)]
+            except BlockingIOError:
+                pass
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a Datum 9390 that answers TSIP commands on a pseudo-terminal.")
+    parser.add_argument("--baud", type=int, default=9600, help="Baud rate passed to the decoder as {baud} (default: 9600)")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after this many seconds (default: run until Ctrl-C or the decoder exits)")
+    parser.add_argument("--silent", action="store_true", help="Send nothing unprompted, only replies to commands")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before each reply (default: 0.05)")
+    parser.add_argument("--drop", type=float, default=0.0, help="Share of commands left unanswered (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the reports and the dropped commands (default: 0)")
+    parser.add_argument("--run", nargs='?', const=DECODER, default=None, metavar="CMD",
+                        help="Start this decoder on the pty ({pty}, {baud} and {python} are filled in); without CMD, datumserial.py polling a few commands")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds to wait for the decoder to open the pty (default: 1)")
+    args = parser.parse_args()
+
+    master, slave, path = open_pty()
+    print(f"Fake receiver on {path}", flush=True)
+    decoder = None
+    if args.run:
+        command = args.run.format(pty=path, baud=args.baud, python=shlex.quote(sys.executable))
+        decoder = subprocess.Popen(command, shell=True, cwd=ROOT)
+        time.sleep(args.delay)
+    counts = Counter()
+    try:
+        counts = serve(master, Receiver(args.seed), args.seconds, args.silent, args.latency, args.drop, args.seed, decoder)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master)  # the decoder sees the port go away
+        os.close(slave)
+        if decoder:
+            try:
+                decoder.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                decoder.terminate()
+                decoder.wait()
+    print(f"{'command':<42} {'received':>8} {'answered':>8} {'dropped':>7} {'unknown':>7}")
+    for packet_id in sorted({packet_id for packet_id, _ in counts}):
+        print(f"{command_name(packet_id):<42} {counts[packet_id, 'received']:>8} {counts[packet_id, 'answered']:>8} "
+              f"{counts[packet_id, 'dropped']:>7} {counts[packet_id, 'unknown']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Replays a capture into a pseudo-terminal, so the live path runs without hardware.
+
+The capture is written to the master side of a new pty and the slave side
+(/dev/pts/N, printed at start) reads like the receiver's serial port, e.g.
+'python datumserial.py -p /dev/pts/5'.  Pacing follows the serial line: at
+--speed 1 the bytes arrive as fast as --baud carries them (10 bits a byte),
+--speed 8 is eight times that and --speed max writes as fast as the reader
+takes them.
+
+--run starts the decoder itself, with {pty} and {baud} filled in, and stops
+when the replay ends.  --find-max raises the rate step by step (doubling,
+then halving the gap) and reports the highest one the decoder sustained: the
+full rate was written and the pty did not back up.  The decoder should not
+buffer on its own for that, hence the default command's small blocking
+queue.  Queue delay is the bytes waiting in the pty divided by the rate, the
+time a byte spends there before the decoder reads it.  Run from the
+repository root:
+
+    python tools/replay_pty.py tsip10.bin                       # real time, attach by hand
+    python tools/replay_pty.py tsip10.bin --speed 50 --run "python datumserial.py -p {pty} --format ndjson"
+    python tools/replay_pty.py synth.bin --find-max --run
+"""
+import argparse
+import fcntl
+import os
+import select
+import shlex
+import subprocess
+import sys
+import termios
+import time
+import tty
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DECODER = "{python} datumserial.py -p {pty} -b {baud} -q --queue-policy block --queue-size 16384"
+TICK = 0.005  # seconds between paced writes
+SUSTAINED = 0.97  # share of the target rate that must get through
+
+
+def open_pty():
+    """(master fd, slave fd, slave path) of a raw pty; the master is non-blocking."""
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    return master, slave, os.ttyname(slave)
+
+
+def backlog(slave):
+    """Bytes written to the pty and not yet read by the decoder."""
+    return int.from_bytes(fcntl.ioctl(slave, termios.FIONREAD, b'\0\0\0\0'), sys.byteorder)
+
+
+def replay(master, slave, data, rate=None, seconds=None, loop=1, position=0):
+    """Writes data from position on (loop times, 0 for ever) at rate bytes/s (None: unpaced).
+
+    Stops after seconds when given.  Returns a dict: bytes written, elapsed
+    seconds, target bytes by then, mean/max pty backlog in bytes and the
+    position reached, to carry on from.
+    """
+    view = memoryview(data)
+    written = rounds = 0
+    samples = total_backlog = max_backlog = 0
+    start = time.monotonic()
+    deadline = start + seconds if seconds else None
+    while True:
+        now = time.monotonic()
+        if deadline and now >= deadline:
+            break
+        if position == len(view):
+            rounds += 1
+            if loop and rounds >= loop:
+                break
+            position = 0
+        due = len(view) if rate is None else int((now - start) * rate) - written
+        if due <= 0:
+            time.sleep(TICK)
+            continue
+        _, ready, _ = select.select([], [master], [], TICK)
+        if ready:
+            try:
+                count = os.write(master, view[position:position + min(due, len(view) - position)])
+            except BlockingIOError:
+                count = 0
+            position += count
+            written += count
+        queued = backlog(slave)
+        samples += 1
+        total_backlog += queued
+        max_backlog = max(max_backlog, queued)
+    elapsed = time.monotonic() - start
+    return {'bytes': written, 'seconds': elapsed, 'target': elapsed * rate if rate else written,
+            'mean_backlog': total_backlog / max(samples, 1), 'max_backlog': max_backlog, 'position': position}
+
+
+def drain(slave, timeout=5.0):
+    """Waits for the decoder to empty the pty; False if it does not within timeout."""
+    end = time.monotonic() + timeout
+    while backlog(slave) and time.monotonic() < end:
+        time.sleep(0.01)
+    return not backlog(slave)
+
+
+def sustained(result, rate):
+    """True when a step at rate got through in full without backing up the pty."""
+    return result['bytes'] >= SUSTAINED * result['target'] and result['max_backlog'] < rate  # under a second queued
+
+
+def report(label, rate, result, packet_bytes):
+    delay = result['mean_backlog'] / rate * 1e3 if rate else float('nan')
+    worst = result['max_backlog'] / rate * 1e3 if rate else float('nan')
+    achieved = result['bytes'] / result['seconds']
+    print(f"{label:>12} {rate or achieved:>12.0f} {achieved:>12.0f} {achieved / packet_bytes:>10.0f} "
+          f"{delay:>9.1f} {worst:>9.1f}", flush=True)
+
+
+def find_max(master, slave, data, start_rate, step_seconds, refine, packet_bytes):
+    """Highest rate (bytes/s) sustained for step_seconds, or None if even start_rate failed.
+
+    The steps run on through the capture, which is written to its end afterwards
+    so the decoder is not left with a cut frame.
+    """
+    good, bad = None, None
+    rate = start_rate
+    position = 0
+    while bad is None or (good is not None and refine > 0):
+        result = replay(master, slave, data, rate, step_seconds, loop=0, position=position)
+        position = result['position']
+        ok = sustained(result, rate)
+        report('ok' if ok else 'backed up', rate, result, packet_bytes)
+        if not drain(slave):
+            ok = False
+        if ok:
+            good = rate
+        else:
+            bad = rate
+        if bad is None:
+            rate *= 2
+        elif good is None:
+            break
+        else:
+            refine -= 1
+            rate = (good + bad) / 2
+    replay(master, slave, data, position=position)
+    drain(slave)
+    return good
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a TSIP capture into a pseudo-terminal for datumserial.py -p.")
+    parser.add_argument("capture", help="Capture file to replay")
+    parser.add_argument("--speed", default="1", help="Multiple of the --baud line rate, or 'max' (default: 1)")
+    parser.add_argument("--baud", type=int, default=9600, help="Line rate of the original capture (default: 9600)")
+    parser.add_argument("--loop", type=int, default=1, help="Times to replay the capture, 0 for ever (default: 1)")
+    parser.add_argument("--run", nargs='?', const=DECODER, default=None, metavar="CMD",
+                        help="Start this decoder on the pty ({pty}, {baud} and {python} are filled in); without CMD, datumserial.py -q")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds to wait before writing, for the decoder to open the pty (default: 1)")
+    parser.add_argument("--find-max", action="store_true", help="Search for the highest rate the decoder sustains (needs a reader on the pty)")
+    parser.add_argument("--step-seconds", type=float, default=3.0, help="Length of each --find-max step (default: 3)")
+    parser.add_argument("--start-rate", type=float, default=None, help="First --find-max rate in bytes/s (default: the --baud line rate)")
+    parser.add_argument("--refine", type=int, default=4, help="Halving steps after the first failed rate (default: 4)")
+    args = parser.parse_args()
+
+    data = open(args.capture, 'rb').read()
+    packet_bytes = len(data) / max(data.count(bytes([0x10, 0x03])), 1)  # about, from the frame closes
+    master, slave, path = open_pty()
+    print(f"Replaying {args.capture} ({len(data)} bytes) on {path}", flush=True)
+    decoder = None
+    if args.run:
+        command = args.run.format(pty=path, baud=args.baud, python=shlex.quote(sys.executable))
+        decoder = subprocess.Popen(command, shell=True, cwd=ROOT)
+    time.sleep(args.delay)
+    line_rate = args.baud / 10
+    print(f"{'':>12} {'target B/s':>12} {'written B/s':>12} {'packets/s':>10} {'delay ms':>9} {'max ms':>9}")
+    try:
+        if args.find_max:
+            best = find_max(master, slave, data, args.start_rate or line_rate, args.step_seconds, args.refine, packet_bytes)
+            if best is None:
+                print("The decoder did not keep up with the first rate; lower --start-rate")
+            else:
+                print(f"Maximum sustained rate: {best:.0f} bytes/s, about {best / packet_bytes:.0f} packets/s, "
+                      f"{best / line_rate:.1f}x a {args.baud} baud line")
+        else:
+            rate = None if args.speed == 'max' else float(args.speed) * line_rate
+            result = replay(master, slave, data, rate, loop=args.loop)
+            drain(slave)
+            report('replayed', rate, result, packet_bytes)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master)  # the decoder sees the port go away
+        os.close(slave)
+        if decoder:
+            try:
+                decoder.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                decoder.terminate()
+                decoder.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Soak test: days of receiver output through datumserial's live loop, in steady memory.
+
+A stream from tools/synth_tsip.py, one epoch of reports per simulated second,
+is fed to datumserial.main() as stdin, so it takes the live path: reader
+thread, chunk queue (--queue-policy block, as a serial port is paced by its
+baud rate), deframer, decoding and output into a null stream.  Line noise
+comes before a share of the frames (--noise), and once a simulated hour a
+frame is opened and followed by --garbage bytes that never close it, as with
+a wrong baud rate, so the deframer's frame length cap is exercised too.
+
+The stream is written to a temporary file first, so generating it is neither
+timed nor traced.  Its first --rate-hours are decoded once untraced for the
+throughput, since tracemalloc slows every allocation down several times.
+Then the whole stream is decoded under tracemalloc: every --sample simulated
+hours of input read, the traced memory and the peak since the last sample
+are recorded.  The queue is kept small (64 KiB) so the reader is never far
+ahead of the decoder.  After --warmup hours (the 24 hour signal statistics
+window filled) memory must stay within --max-growth bytes of where it was,
+and the decoder must reach --min-rate packets per second; otherwise the
+failures are listed and the exit status is 1.
+Run from the repository root:
+
+    python tools/soak.py                          # 2 simulated days
+    python tools/soak.py --days 7 --args "-q --stats"
+"""
+import argparse
+import io
+import os
+import random
+import shlex
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datumserial
+from synth_tsip import frame, noise_burst, packets
+from tsip.frame import DLE
+
+HOUR = 3600
+NOT_DLE = [byte for byte in range(256) if byte != DLE]
+DECODER = "--format ndjson --changes --signal-stats 3600 --stats"
+
+
+def write_stream(f, hours, seed=0, noise=0.001, garbage=4096):
+    """Writes hours of simulated receiver output to f; returns (hour start offsets, packets)."""
+    r = random.Random(seed + 1)
+    offsets = []
+    count = 0
+    seconds = -1
+    part = []
+    for packet_id, data in packets(seed):
+        if packet_id == 0x41:  # first report of an epoch
+            seconds += 1
+            if seconds % HOUR == 0:
+                f.write(b''.join(part))
+                part = []
+                if seconds == hours * HOUR:
+                    break
+                offsets.append(f.tell())
+                if garbage:
+                    # A frame that never closes: the receiver heard at the wrong baud rate
+                    part.append(bytes([DLE, 0x47]) + bytes(r.choice(NOT_DLE) for _ in range(garbage)))
+        if noise and r.random() < noise:
+            part.append(noise_burst(r))
+        part.append(frame(packet_id, data))
+        count += 1
+    return offsets, count
+
+
+class SampledStream(io.RawIOBase):
+    """The first limit bytes of the stream file as the decoder's stdin.
+
+    While tracemalloc is tracing, the memory is noted as each sampled hour is read.
+    """
+
+    def __init__(self, f, offsets, every, limit):
+        f.seek(0)
+        self.f = f
+        self.marks = offsets[::every] + [float('inf')]
+        self.samples = []  # (hour, traced bytes, peak bytes since the last sample)
+        self.every = every
+        self.limit = limit
+        self.read_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.f.readinto(memoryview(buffer)[:self.limit - self.read_bytes])
+        self.read_bytes += n
+        while tracemalloc.is_tracing() and self.read_bytes >= self.marks[len(self.samples)]:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.samples.append((len(self.samples) * self.every, current, peak))
+        return n
+
+
+def decode(stream, options, traced=False):
+    """Runs datumserial.main() on stream as stdin, output thrown away; returns the seconds it took."""
+    sys.argv[1:] = ['-f', '-', '--queue-policy', 'block', '--queue-size', '65536'] + options
+    sys.stdin = io.TextIOWrapper(io.BufferedReader(stream))
+    sys.stdout = open(os.devnull, 'w')
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        datumserial.main()
+        return time.perf_counter() - start
+    finally:
+        sys.stdout = sys.__stdout__
+        sys.stdin = sys.__stdin__
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run datumserial's live loop over days of synthetic data under tracemalloc.")
+    parser.add_argument("--days", type=float, default=2.0, help="Simulated days of input (default: 2)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the stream (default: 0)")
+    parser.add_argument("--noise", type=float, default=0.001, help="Fraction of frames preceded by line noise (default: 0.001)")
+    parser.add_argument("--garbage", type=int, default=4096, help="Bytes of an unclosed frame sent every hour, 0 for none (default: 4096)")
+    parser.add_argument("--args", default=DECODER, help=f"datumserial.py options besides -f - (default: {DECODER!r})")
+    parser.add_argument("--sample", type=int, default=1, help="Simulated hours between memory samples (default: 1)")
+    parser.add_argument("--warmup", type=float, default=25.0, help="Simulated hours before memory must be steady (default: 25)")
+    parser.add_argument("--max-growth", type=int, default=256 << 10, help="Bytes memory may grow after the warm-up (default: 256 KiB)")
+    parser.add_argument("--rate-hours", type=int, default=2, help="Simulated hours decoded untraced for the throughput (default: 2)")
+    parser.add_argument("--min-rate", type=float, default=5000.0, help="Packets per second the decoder must reach untraced (default: 5000)")
+    args = parser.parse_args()
+
+    hours = max(1, round(args.days * 24))
+    options = shlex.split(args.args)
+    failures = []
+    with tempfile.TemporaryFile() as f:
+        start = time.perf_counter()
+        offsets, count = write_stream(f, hours, args.seed, args.noise, args.garbage)
+        size = f.tell()
+        print(f"{hours} simulated hours: {size} bytes, {count} packets, generated in {time.perf_counter() - start:.1f} s")
+
+        rate_hours = min(args.rate_hours, hours)
+        limit = offsets[rate_hours] if rate_hours < hours else size
+        elapsed = decode(SampledStream(f, offsets, args.sample, limit), options)
+        rate = count * rate_hours / hours / elapsed
+        print(f"Untraced, first {rate_hours} hours: {rate:.0f} packets/s, {limit / elapsed / 1e6:.2f} MB/s, "
+              f"{rate_hours * HOUR / elapsed:.0f} times real time")
+        if rate < args.min_rate:
+            failures.append(f"{rate:.0f} packets/s (< {args.min_rate:g})")
+
+        stream = SampledStream(f, offsets, args.sample, size)
+        try:
+            elapsed = decode(stream, options, traced=True)
+            samples = stream.samples + [(hours,) + tracemalloc.get_traced_memory()]
+        finally:
+            tracemalloc.stop()
+    print(f"Traced, {hours} hours in {elapsed:.1f} s")
+    print(f"{'hour':>6} {'traced KiB':>11} {'peak KiB':>9}")
+    for hour, current, peak in samples:
+        print(f"{hour:>6} {current / 1024:>11.1f} {peak / 1024:>9.1f}")
+
+    steady = [sample for sample in samples if sample[0] >= args.warmup]
+    if len(steady) < 2:
+        failures.append(f"run shorter than the {args.warmup:g} hour warm-up: memory not checked")
+    else:
+        growth = max(current for _, current, _ in steady) - steady[0][1]
+        print(f"Memory after hour {steady[0][0]}: {steady[0][1] / 1024:.1f} KiB, grew at most {growth / 1024:.1f} KiB since")
+        if growth > args.max_growth:
+            failures.append(f"memory grew {growth} bytes after the warm-up (> {args.max_growth})")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
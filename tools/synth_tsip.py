@@ -0,0 +1,268 @@
+"""Synthetic Datum 9390 TSIP streams of any size, for testing and benchmarking.
+
+The stream is built epoch by epoch the way the receiver reports: every second
+0x41 time, 0x46 health, 0x4B status, 0x44 satellite selection, 0x47 signal
+levels, 0x42/0x4A position, 0x43 velocity and 0x54 bias, with the slower
+reports (0x5B ephemeris, 0x40 almanac, 0x45 firmware, ...) mixed in now and
+then.  Values follow a slowly moving fix, and the satellites tracked are those
+above the elevation mask there by the almanac the stream itself sends.
+
+Packet data is DLE-stuffed and framed as <DLE><ID>...<DLE><ETX>.  dle_share is
+the fraction of packets given a 0x10 data byte (the others have none), so the
+stuffing paths of the decoders get a known amount of work.  noise is the
+fraction of frames preceded by line noise: random bytes or the first half of a
+frame cut off mid-packet.  Data holding <DLE><ETX><DLE> (or ending in
+<DLE><ETX>) is never generated: stuffed, it reads as the receiver's own
+early close, and no decoder can tell the two apart.  Run from the repository root:
+
+    python tools/synth_tsip.py synth.bin --bytes 10000000
+    python tools/synth_tsip.py synth.bin --dle-share 0.5 --noise 0.01 --ids 0x41,0x47
+"""
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tsip.almanac import azimuth_elevation, orbit_positions, orbit_terms
+from tsip.frame import DLE, ETX
+from tsip.schema import REPORTS, parse_ids
+
+# Sent once per epoch, in this order
+EPOCH_IDS = (0x41, 0x46, 0x4B, 0x44, 0x47, 0x42, 0x4A, 0x43, 0x54)
+# Chance per epoch of the slower reports
+OCCASIONAL_IDS = {0x5B: 0.2, 0x40: 0.05, 0x49: 0.02, 0x48: 0.02, 0x45: 0.02, 0x55: 0.01, 0x70: 0.01, 0x82: 0.01}
+
+DLE_BYTE = bytes([DLE])
+DLE_PAIR = bytes([DLE, DLE])
+NO_DLE = bytes([0x11])
+QUIRK_CLOSE = bytes([DLE, ETX, DLE])
+TRACKED = 8  # satellites tracked at most
+MASK = 5.0  # degrees; lower satellites are not tracked, as check_visibility() expects
+
+
+def frame(packet_id, data):
+    """<DLE><ID>, data with every DLE doubled, <DLE><ETX>."""
+    return bytes([DLE, packet_id]) + data.replace(DLE_BYTE, DLE_PAIR) + bytes([DLE, ETX])
+
+
+def constellation(seed, week, tow):
+    """PRN -> 0x40 entry of a GPS-like constellation: 6 planes 60 degrees apart at about 55 degrees.
+
+    The raw fields are scaled as tsip.almanac reads them, with the almanacs
+    referenced to the hour before tow.
+    """
+    r = random.Random(seed + 1)
+    almanacs = {}
+    for prn in range(1, 33):
+        plane, slot = divmod(prn - 1, 6)
+        almanacs[prn] = (prn, week, 0, r.randint(0, 20000), int(tow // 4096), r.randint(2500, 3300) & 0xFFFF,
+                         -8.1e-9 + r.uniform(-2e-10, 2e-10), 5153.6 + r.uniform(-0.5, 0.5), r.uniform(-math.pi, math.pi),
+                         math.radians(plane * 60 - 180 + r.uniform(-2, 2)), math.radians(slot * 60 + plane * 10 - 180),
+                         r.uniform(-1e-4, 1e-4))
+    return almanacs
+
+
+class Receiver:
+    """State of a simulated receiver; record(packet_id) reports it as a tsip.schema record."""
+
+    def __init__(self, seed=0, week=652, tow=403200.0):
+        self.random = random.Random(seed)
+        self.week = week
+        self.tow = tow
+        self.latitude = math.radians(39.7392)
+        self.longitude = math.radians(-104.9903)
+        self.altitude = 1609.0
+        self.almanacs = constellation(seed, week, tow)
+        self.terms = orbit_terms(self.almanacs[prn] for prn in sorted(self.almanacs))
+        self.satellites = []
+        self.track()
+
+    def step(self):
+        """Advances one second: the fix wanders and now and then a satellite changes."""
+        r = self.random
+        self.tow += 1.0
+        if self.tow >= 604800.0:
+            self.tow -= 604800.0
+            self.week += 1
+        self.latitude += r.gauss(0, 2e-7)
+        self.longitude += r.gauss(0, 2e-7)
+        self.altitude += r.gauss(0, 0.5)
+        if r.random() < 0.02:
+            self.track(swap=True)
+        elif self.tow % 30 == 0:  # satellites rise and set
+            self.track()
+
+    def visible(self):
+        """PRNs at or above MASK at the current fix and time, as tsip.almanac places them."""
+        positions = orbit_positions(self.terms, self.tow, self.week)
+        _, elevation = azimuth_elevation(positions, self.ecef())
+        return [prn for prn, angle in zip(sorted(self.almanacs), elevation[0]) if angle >= MASK]
+
+    def track(self, swap=False):
+        """Drops satellites that have set and fills up to TRACKED from those in view.
+
+        With swap, one tracked satellite is also lost for another in view.
+        """
+        r = self.random
+        visible = self.visible()
+        kept = [prn for prn in self.satellites if prn in visible]
+        lost = [r.choice(kept)] if swap and kept else []
+        spare = [prn for prn in visible if prn not in kept and prn not in lost]
+        kept = [prn for prn in kept if prn not in lost]
+        self.satellites = sorted(kept + r.sample(spare, min(TRACKED - len(kept), len(spare))))
+
+    def ecef(self):
+        a, e2 = 6378137.0, 6.69437999014e-3
+        n = a / math.sqrt(1 - e2 * math.sin(self.latitude) ** 2)
+        xy = (n + self.altitude) * math.cos(self.latitude)
+        return (xy * math.cos(self.longitude), xy * math.sin(self.longitude),
+                (n * (1 - e2) + self.altitude) * math.sin(self.latitude))
+
+    def values(self, packet_id):
+        """Field values of one report, group entries last as a list of tuples."""
+        r = self.random
+        if packet_id == 0x40:
+            return [[self.almanacs[r.randint(1, 32)]]]
+        if packet_id == 0x41:
+            return [self.tow, self.week, 7.0]
+        if packet_id == 0x42:
+            return list(self.ecef()) + [self.tow]
+        if packet_id == 0x43:
+            return [r.gauss(0, 0.05), r.gauss(0, 0.05), r.gauss(0, 0.05), r.gauss(0, 1e-3), self.tow]
+        if packet_id == 0x44:
+            pdop = r.uniform(1.5, 4.0)
+            return [0x04] + self.satellites[:4] + [pdop, pdop * 0.6, pdop * 0.8, pdop * 0.5]
+        if packet_id == 0x45:
+            return [1, 3, 5, 30, 91, 2, 6, 8, 5, 88]
+        if packet_id == 0x46:
+            return [0x00, 0x00]
+        if packet_id == 0x47:
+            return [len(self.satellites), [(prn, r.uniform(4.0, 20.0)) for prn in self.satellites]]
+        if packet_id == 0x48:
+            return [b'DATUM 9390 SYNTHETIC  ']
+        if packet_id == 0x49:
+            return [bytes(0x3F if r.random() < 0.05 else 0 for _ in range(32))]
+        if packet_id == 0x4A:
+            return [self.latitude, self.longitude, self.altitude, r.gauss(0, 50.0), self.tow]
+        if packet_id == 0x4B:
+            return [0x07, 0x00, 0x01]
+        if packet_id == 0x54:
+            return [r.gauss(0, 100.0), r.gauss(0, 0.1), self.tow]
+        if packet_id == 0x55:
+            return [r.randint(0, 100)]
+        if packet_id == 0x5B:
+            return [r.choice(self.satellites), self.tow - r.uniform(0, 7200), 0, r.randint(0, 255),
+                    self.tow - self.tow % 7200, 0, r.uniform(2.0, 32.0)]
+        if packet_id == 0x70:
+            return [r.randint(0, 0xFFFF), r.randint(0, 0xFFFF)]
+        if packet_id == 0x82:
+            return [r.randint(0, 3), r.randint(0, 3)]
+        raise KeyError(packet_id)
+
+    def record(self, packet_id):
+        report = REPORTS[packet_id]
+        values = self.values(packet_id)
+        if report.group:
+            values[-1] = list(map(report.entry._make, values[-1]))
+        return report.record(*values)
+
+
+def packet_data(receiver, packet_id, dle_share):
+    """Packed data of one report, with a 0x10 byte dle_share of the time and none otherwise.
+
+    Bytes are only changed where the packet still decodes, so a group count
+    is never turned into 0x10, and where the stuffed data cannot be mistaken
+    for a close.  0x40 is sent as it is, so the almanac a decoder collects is
+    the one the tracked satellites follow.
+    """
+    report = REPORTS[packet_id]
+    data = report.encode(receiver.record(packet_id))
+    if packet_id == 0x40:
+        return data
+    r = receiver.random
+    if r.random() < dle_share:
+        for _ in range(8):
+            position = r.randrange(len(data))
+            candidate = data[:position] + DLE_BYTE + data[position + 1:]
+            if QUIRK_CLOSE in candidate + DLE_BYTE:
+                continue
+            try:
+                report.decode(candidate)
+            except struct.error:
+                continue
+            return candidate
+    elif DLE_BYTE in data:
+        candidate = data.replace(DLE_BYTE, NO_DLE)
+        try:
+            report.decode(candidate)
+            return candidate
+        except struct.error:
+            pass
+    return data
+
+
+def noise_burst(r):
+    """Line noise: random bytes, or the front half of a frame whose end was lost."""
+    if r.random() < 0.5:
+        return bytes(r.getrandbits(8) for _ in range(r.randint(1, 64)))
+    data = frame(r.choice(EPOCH_IDS), bytes(r.getrandbits(8) for _ in range(r.randint(4, 40))))
+    return data[:len(data) // 2]
+
+
+def packets(seed=0, dle_share=0.1, ids=None):
+    """Endless (packet ID, packet data) of a simulated receiver, epoch by epoch."""
+    receiver = Receiver(seed)
+    r = receiver.random
+    while True:
+        for packet_id in EPOCH_IDS + tuple(packet_id for packet_id, chance in OCCASIONAL_IDS.items() if r.random() < chance):
+            if ids is None or packet_id in ids:
+                yield packet_id, packet_data(receiver, packet_id, dle_share)
+        receiver.step()
+
+
+def generate(size, seed=0, dle_share=0.1, noise=0.0, ids=None):
+    """A stream of about size bytes (whole frames only) and its Counter of packets by ID.
+
+    Noise does not count as packets, though a burst may swallow the frame
+    after it when it leaves the decoder inside a frame.
+    """
+    r = random.Random(seed + 1)
+    parts = []
+    counts = Counter()
+    total = 0
+    for packet_id, data in packets(seed, dle_share, ids):
+        if total >= size:
+            break
+        if noise and r.random() < noise:
+            parts.append(noise_burst(r))
+            total += len(parts[-1])
+        parts.append(frame(packet_id, data))
+        total += len(parts[-1])
+        counts[packet_id] += 1
+    return b''.join(parts), counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Datum 9390 TSIP capture.")
+    parser.add_argument("output", help="Capture file to write")
+    parser.add_argument("--bytes", type=lambda x: int(float(x)), default=1 << 20, help="Approximate size (default: 1 MiB)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same stream (default: 0)")
+    parser.add_argument("--dle-share", type=float, default=0.1, help="Fraction of packets with a 0x10 data byte (default: 0.1)")
+    parser.add_argument("--noise", type=float, default=0.0, help="Fraction of frames preceded by line noise (default: 0)")
+    parser.add_argument("--ids", type=parse_ids, default=None, help="Only these report types, e.g. 0x41,0x47 (default: all)")
+    args = parser.parse_args()
+
+    data, counts = generate(args.bytes, args.seed, args.dle_share, args.noise, args.ids)
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print(f"{args.output}: {len(data)} bytes, {sum(counts.values())} packets")
+    for packet_id, count in sorted(counts.items()):
+        print(f"  0x{packet_id:02X} {REPORTS[packet_id].record.__name__}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+"""Shared TSIP decoding code for datumserial.py and tsipdecode.py."""
+from .schema import REPORTS, Report, MalformedPacket, UnknownPacket, decode_packet
@@ -0,0 +1,336 @@
+"""Almanac store and satellite azimuth/elevation, for whole arrays of epochs.
+
+AlmanacStore keeps what the receiver says about the constellation: the latest
+0x40 almanac of each PRN, the 0x49 health page and the 0x5B ephemeris status,
+fed one decoded record at a time (update()) or from decode_columns() tables
+(update_tables()).  save() and load() keep it in a small JSON file between
+runs, so a short capture can use the almanac an earlier one collected.
+
+positions() computes ECEF positions of many PRNs at many epochs in one call,
+with the Keplerian almanac orbit of IS-GPS-200 (section 20.3.3.4.3).  The
+terms that only depend on the almanac (semi-major axis, mean motion, cos/sin
+of inclination, node at the reference time, ...) are computed once per
+reference time of almanac (toa) and cached until a new almanac for that toa
+arrives, so repeated queries only do the time-dependent part.
+
+The 0x40 layout carries eccentricity, toa and inclination as the raw
+navigation message integers: eccentricity in units of 2**-21, toa in units of
+2**12 s and inclination as the signed offset from 0.3 semicircles in units of
+2**-19 semicircles.  The float fields are radians and radians per second.
+
+check_visibility() puts it together for a capture: the elevation of every
+satellite the receiver reports in 0x47 and selects in 0x44, and the healthy
+ones above the mask it is not tracking.
+"""
+import json
+import os
+
+import numpy as np
+
+from .geo import WEEK_SECONDS, ROLLOVER, ecef_to_lla, lla_to_ecef
+from .schema import REPORTS
+
+GM = 3.986005e14  # m^3/s^2, WGS-84 value used by GPS
+OMEGA_E = 7.2921151467e-5  # rad/s, Earth rotation rate
+ECCENTRICITY_SCALE = 2.0 ** -21
+TOA_SCALE = 2 ** 12
+INCLINATION_SCALE = 2.0 ** -19 * np.pi
+INCLINATION_REFERENCE = 0.3 * np.pi
+PRNS = range(1, 33)
+KEPLER_ITERATIONS = 4  # Newton from E = M, exact to float64 for GPS eccentricities
+
+ALMANAC = REPORTS[0x40].entry
+# Columns of the per-toa term arrays
+TERMS = ('a', 'mean_motion', 'eccentricity', 'root', 'cos_i', 'sin_i', 'node', 'node_rate', 'omega', 'mean_anomaly', 'toa', 'week')
+
+
+def usable(almanac):
+    """True for an almanac whose orbit makes sense (a GPS-like orbit, finite values)."""
+    values = (almanac.rate_of_ra, almanac.semi_major_axis_root, almanac.omega,
+              almanac.asc_node_longitude, almanac.mean_anomaly)
+    return (all(np.isfinite(values)) and 4000 < almanac.semi_major_axis_root < 7000
+            and almanac.ref_time * TOA_SCALE < WEEK_SECONDS and abs(almanac.rate_of_ra) < 1e-6)
+
+
+def toa_key(almanac):
+    """(10-bit week, toa) an almanac's cached terms are filed under."""
+    return almanac.gps_week % ROLLOVER, almanac.ref_time
+
+
+def orbit_terms(almanacs):
+    """(len(almanacs), len(TERMS)) array of the time-independent orbit terms."""
+    raw = np.array([tuple(almanac) for almanac in almanacs], dtype=np.float64).reshape(-1, len(ALMANAC._fields))
+    column = {name: raw[:, k] for k, name in enumerate(ALMANAC._fields)}
+    a = column['semi_major_axis_root'] ** 2
+    e = column['eccentricity'] * ECCENTRICITY_SCALE
+    offset = column['inclination'].astype(np.int64).astype(np.int16)  # two's complement
+    inclination = INCLINATION_REFERENCE + offset * INCLINATION_SCALE
+    toa = column['ref_time'] * TOA_SCALE
+    terms = np.empty((raw.shape[0], len(TERMS)))
+    terms[:, 0] = a
+    terms[:, 1] = np.sqrt(GM / a ** 3)
+    terms[:, 2] = e
+    terms[:, 3] = np.sqrt(1 - e * e)
+    terms[:, 4] = np.cos(inclination)
+    terms[:, 5] = np.sin(inclination)
+    terms[:, 6] = column['asc_node_longitude'] - OMEGA_E * toa
+    terms[:, 7] = column['rate_of_ra'] - OMEGA_E
+    terms[:, 8] = column['omega']
+    terms[:, 9] = column['mean_anomaly']
+    terms[:, 10] = toa
+    terms[:, 11] = column['gps_week'] % ROLLOVER
+    return terms
+
+
+def orbit_positions(terms, tow, weeks=None):
+    """ECEF metres, shape (epochs, satellites, 3), of satellites given by orbit_terms() rows.
+
+    tow is an array of GPS times of week; weeks the matching (10-bit or full)
+    weeks, or None to take each almanac's toa as the nearest one.
+    """
+    tow = np.asarray(tow, dtype=np.float64).reshape(-1, 1)
+    t = terms.T[:, None, :]  # each term as (1, satellites)
+    a, n, e, root, cos_i, sin_i, node, node_rate, omega, m0, toa, week = t
+    tk = tow - toa
+    if weeks is None:
+        tk = (tk + WEEK_SECONDS / 2) % WEEK_SECONDS - WEEK_SECONDS / 2
+    else:
+        weeks = np.asarray(weeks, dtype=np.float64).reshape(-1, 1) % ROLLOVER
+        tk += ((weeks - week + ROLLOVER // 2) % ROLLOVER - ROLLOVER // 2) * WEEK_SECONDS
+    mean = m0 + n * tk
+    anomaly = mean.copy()
+    for _ in range(KEPLER_ITERATIONS):  # Newton on E - e sin E = M
+        anomaly -= (anomaly - e * np.sin(anomaly) - mean) / (1 - e * np.cos(anomaly))
+    cos_e, sin_e = np.cos(anomaly), np.sin(anomaly)
+    latitude = np.arctan2(root * sin_e, cos_e - e) + omega
+    radius = a * (1 - e * cos_e)
+    x, y = radius * np.cos(latitude), radius * np.sin(latitude)
+    node = node + node_rate * tk
+    cos_node, sin_node = np.cos(node), np.sin(node)
+    return np.stack((x * cos_node - y * cos_i * sin_node,
+                     x * sin_node + y * cos_i * cos_node,
+                     y * sin_i), axis=-1)
+
+
+def azimuth_elevation(satellites, receiver):
+    """Azimuth (0-360, from north) and elevation in degrees of ECEF satellite positions.
+
+    satellites has shape (..., 3), e.g. (epochs, satellites, 3) from
+    orbit_positions(); receiver is one ECEF position (3,) or one per epoch
+    (epochs, 3).
+    """
+    receiver = np.asarray(receiver, dtype=np.float64)
+    if receiver.ndim == 2:
+        receiver = receiver[:, None, :]
+    latitude, longitude, _ = ecef_to_lla(receiver[..., 0], receiver[..., 1], receiver[..., 2])
+    phi, lam = np.radians(latitude)[..., None], np.radians(longitude)[..., None]
+    d = satellites - receiver
+    east = -np.sin(lam) * d[..., :1] + np.cos(lam) * d[..., 1:2]
+    north = -np.sin(phi) * (np.cos(lam) * d[..., :1] + np.sin(lam) * d[..., 1:2]) + np.cos(phi) * d[..., 2:]
+    up = np.cos(phi) * (np.cos(lam) * d[..., :1] + np.sin(lam) * d[..., 1:2]) + np.sin(phi) * d[..., 2:]
+    azimuth = np.degrees(np.arctan2(east, north))[..., 0] % 360
+    elevation = np.degrees(np.arctan2(up, np.hypot(east, north)))[..., 0]
+    return azimuth, elevation
+
+
+class AlmanacStore:
+    """Latest almanac, health and ephemeris status per PRN; see the module docstring."""
+
+    def __init__(self):
+        self.almanacs = {}  # PRN -> Almanac entry of 0x40
+        self.health = {}  # PRN -> 0x49 health byte
+        self.ephemeris = {}  # PRN -> dict of the 0x5B fields
+        self._terms = {}  # (week, toa) -> (PRNs, orbit_terms() rows)
+
+    def update(self, record):
+        """Takes one decoded record; 0x40, 0x49 and 0x5B are kept, others ignored.
+
+        Returns True when the store changed.
+        """
+        packet_id = getattr(record, 'packet_id', None)
+        if getattr(record, 'report', None) is None:
+            return False
+        if packet_id == 0x40:
+            changed = False
+            for almanac in record.almanacs:
+                changed |= self.add_almanac(almanac)
+            return changed
+        if packet_id == 0x49:
+            health = dict(zip(PRNS, record.health))
+            changed = health != self.health
+            self.health = health
+            return changed
+        if packet_id == 0x5B:
+            fields = {name: value for name, value in zip(record._fields, record) if name != 'sv_prn'}
+            changed = self.ephemeris.get(record.sv_prn) != fields
+            self.ephemeris[record.sv_prn] = fields
+            return changed
+        return False
+
+    def add_almanac(self, almanac):
+        """Stores one 0x40 entry, dropping the cached terms it replaces."""
+        previous = self.almanacs.get(almanac.prn)
+        if previous == almanac:
+            return False
+        for entry in (previous, almanac):
+            if entry is not None:
+                self._terms.pop(toa_key(entry), None)
+        self.almanacs[almanac.prn] = ALMANAC(*almanac)
+        return True
+
+    def update_tables(self, tables):
+        """Feeds decode_columns() tables; only the latest report of each kind counts."""
+        almanacs = tables.get(0x40)
+        if almanacs is not None:
+            for row in almanacs:  # in capture order, so later entries win
+                self.add_almanac(ALMANAC(*(row[name].item() for name in ALMANAC._fields)))
+        pages = tables.get(0x49)
+        if pages is not None and pages.size:
+            self.health = dict(zip(PRNS, pages['health'][-1].ljust(32, b'\0')))
+        status = tables.get(0x5B)
+        if status is not None:
+            for row in status:
+                self.ephemeris[int(row['sv_prn'])] = {name: row[name].item() for name in status.dtype.names
+                                                     if name not in ('offset', 'sv_prn')}
+
+    def healthy(self, prn):
+        """True unless the almanac, the health page or the ephemeris status flags the PRN."""
+        almanac = self.almanacs.get(prn)
+        return (almanac is not None and almanac.sv_health == 0 and self.health.get(prn, 0) == 0
+                and self.ephemeris.get(prn, {}).get('health', 0) == 0)
+
+    def terms(self, prns=None):
+        """(PRNs, orbit terms) of the stored usable almanacs, built per toa and cached."""
+        parts = []
+        for key in {toa_key(almanac) for almanac in self.almanacs.values()}:
+            if key not in self._terms:
+                members = sorted(prn for prn, almanac in self.almanacs.items() if toa_key(almanac) == key and usable(almanac))
+                self._terms[key] = (np.array(members, np.int64), orbit_terms([self.almanacs[prn] for prn in members]))
+            parts.append(self._terms[key])
+        prn_list = np.concatenate([members for members, _ in parts] + [np.zeros(0, np.int64)])
+        rows = np.concatenate([rows for _, rows in parts] + [np.zeros((0, len(TERMS)))])
+        order = np.argsort(prn_list)
+        if prns is not None:
+            order = order[np.isin(prn_list[order], list(prns))]
+        return prn_list[order], rows[order]
+
+    def positions(self, tow, weeks=None, prns=None):
+        """(PRNs, ECEF array of shape (epochs, PRNs, 3)) at GPS times of week tow."""
+        prn_list, rows = self.terms(prns)
+        return prn_list, orbit_positions(rows, tow, weeks)
+
+    def azimuth_elevation(self, receiver, tow, weeks=None, prns=None):
+        """(PRNs, azimuth, elevation), degrees with shape (epochs, PRNs), seen from receiver.
+
+        receiver is one ECEF position or one per epoch, e.g. from 0x42 reports.
+        """
+        prn_list, positions = self.positions(tow, weeks, prns)
+        return (prn_list,) + azimuth_elevation(positions, receiver)
+
+    def snapshot(self):
+        """The store as plain, JSON-ready dicts."""
+        return {'almanacs': {prn: almanac._asdict() for prn, almanac in sorted(self.almanacs.items())},
+                'health': dict(sorted(self.health.items())),
+                'ephemeris': dict(sorted(self.ephemeris.items()))}
+
+    def save(self, path):
+        """Writes snapshot() as JSON, replacing path only once it is complete."""
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """A store read back from save(); empty when path does not exist."""
+        store = cls()
+        if not os.path.exists(path):
+            return store
+        with open(path) as f:
+            saved = json.load(f)
+        for fields in saved.get('almanacs', {}).values():
+            store.add_almanac(ALMANAC(**fields))
+        store.health = {int(prn): value for prn, value in saved.get('health', {}).items()}
+        store.ephemeris = {int(prn): fields for prn, fields in saved.get('ephemeris', {}).items()}
+        return store
+
+
+def latest_before(offsets, times):
+    """Row of times holding the latest report before each offset, -1 for none."""
+    return np.searchsorted(times, offsets) - 1
+
+
+def check_visibility(tables, store, mask=5.0):
+    """Elevation of what the receiver tracks, from decode_columns() tables and a store.
+
+    Each 0x47 (signal levels) and 0x44 (satellite selection) packet is dated
+    by the latest valid 0x41 before it and placed at the latest 0x42 (or 0x4A)
+    fix.  Returns a dict of structured arrays with offset, prn, azimuth and
+    elevation columns: 'tracked' (every 0x47 entry, with its signal_level),
+    'selected' (every satellite named in 0x44) and 'missed' (healthy
+    satellites at or above mask degrees absent from a 0x47).  Satellites
+    without a usable almanac get NaN angles.  All epochs are one
+    store.azimuth_elevation() call.
+    """
+    from .geo import valid_times
+    columns = [('offset', np.int64), ('prn', np.int64), ('azimuth', np.float64), ('elevation', np.float64)]
+    empty = {name: np.zeros(0, columns) for name in ('tracked', 'selected', 'missed')}
+    times = tables.get(0x41)
+    fixes = tables.get(0x42)
+    if fixes is not None and fixes.size:
+        fix_offsets, fix_positions = fixes['offset'], np.stack([fixes['x'], fixes['y'], fixes['z']], axis=-1)
+    elif tables.get(0x4A) is not None and tables[0x4A].size:
+        lla = tables[0x4A]
+        fix_offsets = lla['offset']
+        fix_positions = np.stack(lla_to_ecef(np.degrees(lla['latitude']), np.degrees(lla['longitude']), lla['altitude']), axis=-1)
+    else:
+        return empty
+    if times is None:
+        return empty
+    times = times[valid_times(times['time_of_week'])]
+    signals = tables.get(0x47, np.zeros(0, [('offset', np.int64), ('prn', 'u1'), ('signal_level', 'f4')]))
+    selection = tables.get(0x44)
+    selected = np.zeros(0, [('offset', np.int64), ('prn', np.int64)])
+    if selection is not None and selection.size:
+        offsets = np.repeat(selection['offset'], 4)
+        prns = np.stack([selection[name] for name in ('sv1', 'sv2', 'sv3', 'sv4')], axis=-1).ravel()
+        selected = np.rec.fromarrays([offsets[prns > 0], prns[prns > 0].astype(np.int64)], dtype=selected.dtype)
+    epochs = np.union1d(signals['offset'], selected['offset'])
+    time_row = latest_before(epochs, times['offset'])
+    fix_row = latest_before(epochs, fix_offsets)
+    known = (time_row >= 0) & (fix_row >= 0)
+    epochs, time_row, fix_row = epochs[known], time_row[known], fix_row[known]
+    if not epochs.size:
+        return empty
+    week_column = 'week' if 'week' in times.dtype.names else 'gps_week'
+    prn_list, azimuth, elevation = store.azimuth_elevation(
+        fix_positions[fix_row], times['time_of_week'][time_row], times[week_column][time_row])
+
+    column_of = np.full(256, -1)
+    column_of[prn_list] = np.arange(prn_list.size)
+
+    def table(offsets, prns, extra=()):
+        out = np.empty(offsets.size, columns + [(name, values.dtype) for name, values in extra])
+        out['offset'], out['prn'] = offsets, prns
+        out['azimuth'] = out['elevation'] = np.nan
+        epoch = np.minimum(np.searchsorted(epochs, offsets), epochs.size - 1)
+        column = column_of[prns & 0xFF]
+        found = (epochs[epoch] == offsets) & (column >= 0)
+        out['azimuth'][found] = azimuth[epoch[found], column[found]]
+        out['elevation'][found] = elevation[epoch[found], column[found]]
+        for name, values in extra:
+            out[name] = values
+        return out
+
+    result = {'tracked': table(signals['offset'], signals['prn'].astype(np.int64), [('signal_level', signals['signal_level'])]),
+              'selected': table(selected['offset'], selected['prn'])}
+    # Healthy satellites above the mask at each 0x47 epoch that the 0x47 leaves out
+    reported = np.isin(epochs, signals['offset'])
+    up = (elevation >= mask) & reported[:, None] & np.array([store.healthy(prn) for prn in prn_list], bool)
+    epoch, column = np.nonzero(up)
+    pairs = epochs[epoch] * 256 + prn_list[column]
+    heard = np.isin(pairs, signals['offset'] * 256 + signals['prn'])
+    missed = np.empty(int((~heard).sum()), columns)
+    missed['offset'], missed['prn'] = epochs[epoch[~heard]], prn_list[column[~heard]]
+    missed['azimuth'], missed['elevation'] = azimuth[epoch[~heard], column[~heard]], elevation[epoch[~heard], column[~heard]]
+    result['missed'] = missed
+    return result
@@ -0,0 +1,192 @@
+"""On-disk cache of decoded captures, keyed by their content, for repeated analysis.
+
+CaptureCache keeps the decode_columns() tables of a capture (one structured
+array per report type) as .npy files in a directory per entry, named for the
+SHA-256 of the capture's bytes and the decoder version.  The same bytes under
+another name or in another place find the same entry, and an entry is never
+used for different bytes or by a decoder whose report layouts have changed.
+
+Hashing a capture is done once per change of it: the cache remembers each
+path's size, modification time and inode with its hash, as the sidecar index
+does, so reopening an unchanged capture reads a few .npy files and nothing
+else.  When a capture has grown since its last visit, the hash of its first
+(old size) bytes is taken on the way through the file; if that matches the
+old entry the capture was appended to, and only the new part needs decoding.
+
+Entries are written to a temporary directory and renamed into place, so a
+crashed or concurrent writer never leaves half an entry.  Their total size is
+kept under max_bytes by removing the least recently used ones (each hit
+touches its directory).
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from .schema import REPORTS
+
+# Default cache directory and size limit
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'tsip')
+MAX_BYTES = 2 << 30
+# Bytes hashed at a time
+HASH_BYTES = 1 << 20
+# The stat -> hash memo of the paths seen, in the cache directory
+PATHS = 'paths.json'
+META = 'meta.json'
+
+# key: this content's entry; previous: the entry of the capture before it grew, if any
+Identity = namedtuple('Identity', 'key size stat previous')
+
+
+def layout_version(extra=''):
+    """Short hash of every report layout in tsip.schema, plus the caller's own version."""
+    layout = [(packet_id, report.header.format, report.names,
+               report.optional.format if report.optional else None, report.optional_names,
+               report.group.format if report.group else None, report.group_names, report.count)
+              for packet_id, report in sorted(REPORTS.items())]
+    return hashlib.sha256(repr((layout, extra)).encode()).hexdigest()[:12]
+
+
+def file_digest(path, prefix=None):
+    """(SHA-256 of the file, SHA-256 of its first prefix bytes or None), in one read."""
+    digest = hashlib.sha256()
+    early = None
+    done = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_BYTES):
+            if prefix is not None and early is None and done + len(chunk) >= prefix:
+                digest.update(chunk[:prefix - done])
+                early = digest.copy().hexdigest()
+                digest.update(chunk[prefix - done:])
+            else:
+                digest.update(chunk)
+            done += len(chunk)
+    return digest.hexdigest(), early
+
+
+def stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class CaptureCache:
+    """Decoded capture tables on disk, content-addressed; see the module docstring.
+
+    version is the decoder's own version string, changed whenever what it
+    stores for the same bytes changes; the report layouts are added to it.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES, version=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = layout_version(version)
+        os.makedirs(directory, exist_ok=True)
+
+    def _memo(self):
+        try:
+            with open(os.path.join(self.directory, PATHS)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def identify(self, path):
+        """Identity of a capture's current content, hashing it only when it changed."""
+        stat = stat_key(path)
+        seen = self._memo().get(os.path.abspath(path))
+        if seen and seen['stat'] == stat and seen['version'] == self.version:
+            return Identity(seen['key'], stat[0], stat, None)
+        grown = seen is not None and seen['version'] == self.version and 0 < seen['stat'][0] < stat[0]
+        digest, early = file_digest(path, seen['stat'][0] if grown else None)
+        previous = seen['key'] if grown and early == seen['key'].split('-')[0] else None
+        return Identity(f"{digest}-{self.version}", stat[0], stat, previous)
+
+    def remember(self, path, identity):
+        """Records the path's stat and key, so the next identify() need not hash it."""
+        memo = self._memo()
+        memo[os.path.abspath(path)] = {'stat': identity.stat, 'key': identity.key, 'version': self.version}
+        memo = {name: seen for name, seen in memo.items() if os.path.exists(name)}
+        self._write(PATHS, json.dumps(memo))
+
+    def _write(self, name, text):
+        handle, temporary = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(handle, 'w') as f:
+            f.write(text)
+        os.replace(temporary, os.path.join(self.directory, name))
+
+    def load(self, key):
+        """{packet ID: structured array} of an entry, or None when it is not cached."""
+        import numpy as np
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, META)) as f:
+                meta = json.load(f)
+            tables = {int(packet_id, 16): np.load(os.path.join(entry, f"{packet_id}.npy"), allow_pickle=False)
+                      for packet_id in meta['ids']}
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(entry)  # most recently used
+        return tables
+
+    def store(self, key, tables):
+        """Saves an entry's tables, then evicts down to max_bytes; returns the entry directory."""
+        import numpy as np
+        entry = os.path.join(self.directory, key)
+        partial = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            size = 0
+            for packet_id, table in tables.items():
+                path = os.path.join(partial, f"0x{packet_id:02X}.npy")
+                np.save(path, table, allow_pickle=False)
+                size += os.path.getsize(path)
+            with open(os.path.join(partial, META), 'w') as f:
+                json.dump({'ids': [f"0x{packet_id:02X}" for packet_id in tables], 'bytes': size}, f)
+            try:
+                os.rename(partial, entry)
+            except OSError:  # stored meanwhile by another process
+                shutil.rmtree(partial, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return entry
+
+    def discard(self, key):
+        """Removes an entry, if it is there."""
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def entries(self):
+        """[(last used, bytes, key)] of every entry, least recently used first."""
+        out = []
+        for key in os.listdir(self.directory):
+            entry = os.path.join(self.directory, key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                with open(os.path.join(entry, META)) as f:
+                    size = json.load(f)['bytes']
+                out.append((os.stat(entry).st_mtime, size, key))
+            except (OSError, ValueError, KeyError):
+                continue
+        return sorted(out)
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the rest fit in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self.discard(key)
+                total -= size
+
+    def clear(self):
+        """Removes every entry, the path memo and what interrupted writers left behind."""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name == PATHS or name.startswith('.tmp-'):
+                os.remove(path)
@@ -0,0 +1,322 @@
+"""Raw capture segments: recording the receiver's byte stream and reading it back.
+
+CaptureRecorder saves the bytes of a source exactly as they were read into
+segment files that are rotated on the hour (or every rotate_seconds) and after
+rotate_bytes, compressed with gzip, xz or zstd (the last when the zstandard
+package is installed).  write() only queues a chunk; a writer thread does the
+compression and the file I/O, so a slow disk or a high compression level never
+holds up reading the port.  A segment is written as NAME.part and renamed when
+it is complete, so a directory of captures only ever shows whole segments, and
+it is cut right after a frame close so every segment decodes on its own.
+
+open_capture() reads any capture, compressed or not (by its .gz, .xz or .zst
+suffix), as a stream, open_reader() gives a read()-able view of a byte range
+of one (memory-mapped when it is not compressed), and stream_windows() walks one window at a time the way
+tsip.frame.scan_windows() walks a memory-mapped file, so tsipdecode.py and
+datumserial.py decode segments without decompressing them to disk first.
+"""
+import mmap
+import os
+import time
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd segments need it
+    zstandard = None
+
+# Compression name -> file suffix
+SUFFIXES = {'gzip': '.gz', 'xz': '.xz', 'zstd': '.zst'}
+COMPRESSIONS = ('gzip', 'xz', 'zstd', 'none')
+# Decompressed bytes read and scanned at a time
+READ_BYTES = 1 << 20
+# Seconds the writer thread waits for data before checking the time rotation
+IDLE_SECONDS = 1.0
+
+
+def available_compressions():
+    """COMPRESSIONS this Python can write."""
+    return tuple(name for name in COMPRESSIONS if name != 'zstd' or zstandard is not None)
+
+
+def compression_of(path):
+    """'gzip', 'xz' or 'zstd' from a capture's suffix, None for a plain capture."""
+    for name, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return name
+    return None
+
+
+def _need_zstandard(path):
+    if zstandard is None:
+        raise ImportError(f"{path}: zstd captures need the zstandard package (pip install zstandard)")
+
+
+def open_capture(path):
+    """Binary file object reading a capture's raw bytes, decompressed on the fly."""
+    compression = compression_of(path)
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, 'rb')
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path, 'rb')
+    if compression == 'zstd':
+        _need_zstandard(path)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return open(path, 'rb')
+
+
+def create_capture(path, compression='gzip'):
+    """Binary file object writing a capture, compressed as named."""
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path, 'wb', preset=6)
+    if compression == 'zstd':
+        _need_zstandard(path)
+        return zstandard.ZstdCompressor(level=10).stream_writer(open(path, 'wb'), closefd=True)
+    if compression in (None, 'none'):
+        return open(path, 'wb')
+    raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}, got {compression!r}")
+
+
+class MappedCapture:
+    """Read-only, memory-mapped capture file limited to the byte range [start, end).
+
+    Behaves like a binary file for read(); pages behind the read position are
+    released every WINDOW bytes so resident memory stays flat for any file size.
+    """
+    WINDOW = 1 << 20
+
+    def __init__(self, path, start=0, end=None):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.end = size if end is None else min(end, size)
+        self.position = min(start, self.end)
+        self._released = self.position - self.position % mmap.PAGESIZE
+
+    def read(self, size=-1):
+        stop = self.end if size is None or size < 0 else min(self.position + size, self.end)
+        if stop <= self.position:
+            return b''
+        chunk = self._map[self.position:stop]
+        self.position = stop
+        if self.position - self._released >= self.WINDOW and hasattr(mmap, 'MADV_DONTNEED'):
+            released_to = self.position - self.position % mmap.PAGESIZE
+            self._map.madvise(mmap.MADV_DONTNEED, self._released, released_to - self._released)
+            self._released = released_to
+        return chunk
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+class CaptureReader:
+    """Decompressed bytes [start, end) of a capture, read() like a file.
+
+    The stream counterpart of MappedCapture: bytes before start are
+    decompressed and thrown away, as a compressed stream cannot seek.
+    """
+
+    def __init__(self, path, start=0, end=None):
+        self._file = open_capture(path)
+        self.end = end
+        self.position = 0
+        while self.position < start:
+            skipped = len(self._file.read(min(start - self.position, READ_BYTES)))
+            if not skipped:
+                break
+            self.position += skipped
+
+    def read(self, size=-1):
+        if self.end is not None:
+            left = self.end - self.position
+            size = left if size is None or size < 0 else min(size, left)
+            if size <= 0:
+                return b''
+        chunk = self._file.read(size)
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+def open_reader(path, start=0, end=None):
+    """Reader of bytes [start, end) of a capture: MappedCapture, or CaptureReader when compressed."""
+    if compression_of(path):
+        return CaptureReader(path, start, end)
+    return MappedCapture(path, start, end)
+
+
+def stream_windows(filename, scan, start=0, stop=None, window=READ_BYTES, synced=None):
+    """tsip.frame.scan_windows() for a compressed capture, decompressing as it goes.
+
+    scan(data, base, synced) gets a read-only uint8 array of each window and
+    returns the bytes it consumed; the unconsumed tail (a frame cut by the end
+    of the window) is carried into the next one.  Offsets are in the
+    decompressed stream.
+    """
+    import numpy as np
+    reader = CaptureReader(filename, start, stop)
+    position = start
+    synced = start == 0 if synced is None else synced
+    carried = b''
+    try:
+        while chunk := reader.read(window):
+            data = carried + chunk if carried else chunk
+            consumed = scan(np.frombuffer(data, np.uint8), position, synced)
+            if consumed:
+                position += consumed
+                carried = data[consumed:]
+                synced = True
+            else:  # no frame closed in a whole window: line noise, resync in the next one
+                position += len(data)
+                carried = b''
+                synced = False
+    finally:
+        reader.close()
+
+
+class CaptureRecorder:
+    """Rotating, compressed segments of a raw byte stream; see the module docstring.
+
+    Segments are DIRECTORY/PREFIX-YYYYmmddTHHMMSSZ-NNNN.bin[.gz|.xz|.zst],
+    named for the UTC time they start and numbered, so they sort in stream
+    order.  Time rotation happens on multiples of rotate_seconds (0 or None:
+    never), size rotation once rotate_bytes of raw data are in a segment;
+    either waits for the next frame close.  Chunks that
+    would take the queue over queue_bytes are dropped and counted, so a stuck
+    disk cannot take the process's memory.
+    """
+
+    def __init__(self, directory, prefix='tsip', compression='gzip', rotate_seconds=3600, rotate_bytes=None,
+                 queue_bytes=64 << 20):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}, got {compression!r}")
+        if compression == 'zstd':
+            _need_zstandard(directory)
+        import threading
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.rotate_seconds = rotate_seconds
+        self.rotate_bytes = rotate_bytes
+        self.queue_bytes = queue_bytes
+        self.segments = []  # paths of the finished segments
+        self.written_bytes = 0
+        self.dropped_bytes = 0
+        self.error = None  # the OSError that stopped the writer, if any
+        self._chunks = deque()
+        self._queued = 0
+        self._ready = threading.Condition()
+        self._closed = False
+        self._file = None
+        self._path = None
+        self._segment_bytes = 0
+        self._rotate_at = None
+        self._sequence = 0
+        self._dle_run = 0  # DLEs at the end of the data written so far
+        self._thread = threading.Thread(target=self._run, name="tsip-recorder", daemon=True)
+        self._thread.start()
+
+    def write(self, chunk):
+        """Queues raw bytes for the writer thread; never blocks on I/O."""
+        with self._ready:
+            if self._closed or self.error is not None or self._queued + len(chunk) > self.queue_bytes:
+                self.dropped_bytes += len(chunk)
+                return
+            self._chunks.append(chunk)
+            self._queued += len(chunk)
+            self._ready.notify()
+
+    @property
+    def path(self):
+        """The segment being written (with its .part suffix), or None between segments."""
+        return self._path
+
+    def close(self):
+        """Writes out the queue, finishes the current segment and stops the writer."""
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                with self._ready:
+                    if not self._chunks and not self._closed:
+                        self._ready.wait(IDLE_SECONDS)
+                    chunks = list(self._chunks)
+                    self._chunks.clear()
+                    self._queued = 0
+                    closed = self._closed
+                for chunk in chunks:
+                    self._write(chunk)
+                if not chunks and self._file is not None and self._due(0):
+                    self._finish()  # quiet line: rotate on time anyway
+                if closed and not self._chunks:
+                    break
+        except OSError as e:
+            self.error = e
+        finally:
+            if self._file is not None:
+                try:
+                    self._finish()
+                except OSError as e:
+                    self.error = self.error or e
+
+    def _due(self, incoming):
+        if self.rotate_bytes and self._segment_bytes + incoming > self.rotate_bytes:
+            return True
+        return self._rotate_at is not None and time.time() >= self._rotate_at
+
+    def _write(self, chunk):
+        if self._file is not None and self._due(len(chunk)):
+            from .frame import DLE, find_boundary
+            # The DLE run the last chunk ended with counts towards a close at the start of this one
+            cut = find_boundary(bytes([DLE]) * self._dle_run + chunk)
+            if cut is not None:
+                cut -= self._dle_run
+                self._file.write(chunk[:cut])
+                self._segment_bytes += cut
+                self.written_bytes += cut
+                self._finish()
+                chunk = chunk[cut:]
+        if not chunk:
+            return
+        if self._file is None:
+            self._start()
+        self._file.write(chunk)
+        self._segment_bytes += len(chunk)
+        self.written_bytes += len(chunk)
+        trailing = len(chunk) - len(chunk.rstrip(b'\x10'))
+        self._dle_run = self._dle_run + trailing if trailing == len(chunk) else trailing
+
+    def _start(self):
+        now = time.time()
+        path = None
+        while path is None or os.path.exists(path) or os.path.exists(path + '.part'):  # another recorder's
+            self._sequence += 1
+            name = (f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))}-{self._sequence:04d}"
+                    f".bin{SUFFIXES.get(self.compression, '')}")
+            path = os.path.join(self.directory, name)
+        self._path = path + '.part'
+        self._file = create_capture(self._path, self.compression)
+        self._segment_bytes = 0
+        self._rotate_at = (now // self.rotate_seconds + 1) * self.rotate_seconds if self.rotate_seconds else None
+
+    def _finish(self):
+        self._file.close()
+        os.replace(self._path, self._path[:-len('.part')])
+        self.segments.append(self._path[:-len('.part')])
+        self._file = None
+        self._path = None
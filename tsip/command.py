@@ -0,0 +1,307 @@
+"""Sending TSIP commands without blocking the decoder: queueing, pacing and replies.
+
+CommandScheduler sits between the live reader and the port.  send() queues a
+command, every() polls one on a fixed period, feed() takes every decoded record
+as it arrives and tick() does the rest: it writes queued commands at no more
+than the link's byte rate, gives up on a reply after timeout seconds and sends
+the command again up to retries times.  Nothing waits: tick() returns how long
+the caller may sleep (or block on its read queue) before it has work again, so
+the scheduler runs in the decode loop itself, on whatever thread that is.
+
+A command is answered by the next report of one of its reply IDs (COMMANDS;
+0x26, for instance, by 0x46 or 0x4B), checked by the command's match function
+where the report carries what was asked for, such as the PRN of a 0x20 almanac
+request.  The receiver sends most of those reports unprompted as well, so while
+one command waits for an ID no other command expecting that ID is sent: a reply
+can then only belong to one request.  It may still be one the receiver sent
+on its own just after the command went out, and nothing in it says which: so
+once UNPROMPTED reports of an ID have arrived with no command waiting for
+them, a match on that ID completes the request but is counted as
+'unconfirmed', not 'answered', and adds nothing to the reply latency.
+Commands without a reply (a reset) are done once written.
+"""
+import time
+from collections import Counter, deque, namedtuple
+
+from .frame import DLE, ETX
+
+DLE_BYTE = bytes([DLE])
+DLE_PAIR = bytes([DLE, DLE])
+
+TIMEOUT = 2.0  # seconds to wait for a reply before sending again
+RETRIES = 2  # sends after the first before a command fails
+BURST_SECONDS = 0.1  # link time the rate limit lets commands use back to back
+UNPROMPTED = 2  # reports of an ID seen with nothing waiting before the receiver is taken to send it unasked
+
+Command = namedtuple('Command', 'name replies match')
+
+
+def almanac_for(record, data):
+    """A 0x40 reply to a 0x20 request for the PRN in data."""
+    return not data or any(entry.prn == data[0] for entry in record.almanacs)
+
+
+def ephemeris_for(record, data):
+    """A 0x5B reply to a 0x3B request for the PRN in data (0: any satellite)."""
+    return not data or not data[0] or record.sv_prn == data[0]
+
+
+# Command ID -> name, reply report IDs and reply check
+COMMANDS = {
+    0x1F: Command('Request Software Versions', (0x45,), None),
+    0x20: Command('Request Almanac', (0x40,), almanac_for),
+    0x21: Command('Request Current Time', (0x41,), None),
+    0x24: Command('Request Satellite Selection', (0x44,), None),
+    0x25: Command('Soft Reset', (), None),
+    0x26: Command('Request Receiver Health', (0x46, 0x4B), None),
+    0x27: Command('Request Signal Levels', (0x47,), None),
+    0x29: Command('Request Almanac Health Page', (0x49,), None),
+    0x3B: Command('Request Satellite Ephemeris Status', (0x5B,), ephemeris_for),
+}
+
+
+def frame_command(packet_id, data=b''):
+    """<DLE><ID>, data with every DLE doubled, <DLE><ETX>: one command as sent."""
+    return bytes([DLE, packet_id]) + bytes(data).replace(DLE_BYTE, DLE_PAIR) + bytes([DLE, ETX])
+
+
+def parse_command(text):
+    """'0x20:05' -> (0x20, b'\\x05'): command ID and hex data; the argparse type of --send."""
+    packet_id, _, data = text.partition(':')
+    return int(packet_id, 0), bytes.fromhex(data)
+
+
+def parse_poll(text):
+    """'10:0x26' or '60:0x20:05' -> (10.0, 0x26, b'...'); the argparse type of --poll."""
+    seconds, _, command = text.partition(':')
+    if not command or float(seconds) <= 0:
+        raise ValueError(f"expected SECONDS:ID[:HEXDATA], got {text!r}")
+    return (float(seconds),) + parse_command(command)
+
+
+def command_name(packet_id):
+    """'0x26 Request Receiver Health', or just the ID for a command not in COMMANDS."""
+    command = COMMANDS.get(packet_id)
+    return f"0x{packet_id:02X} {command.name}" if command else f"0x{packet_id:02X}"
+
+
+class Request:
+    """One command on its way: state is 'queued', 'sent', 'done' or 'failed'.
+
+    reply is the record that answered it, latency the seconds from the send
+    that got the reply to the reply (None when the reply could have been one
+    the receiver sent unprompted).
+    """
+    __slots__ = ('packet_id', 'data', 'replies', 'match', 'timeout', 'retries', 'callback',
+                 'state', 'attempts', 'queued_at', 'sent_at', 'reply', 'latency')
+
+    def __init__(self, packet_id, data, replies, match, timeout, retries, callback, now):
+        self.packet_id = packet_id
+        self.data = bytes(data)
+        self.replies = tuple(replies)
+        self.match = match
+        self.timeout = timeout
+        self.retries = retries
+        self.callback = callback
+        self.state = 'queued'
+        self.attempts = 0
+        self.queued_at = now
+        self.sent_at = None
+        self.reply = None
+        self.latency = None
+
+    def __repr__(self):
+        return f"Request({command_name(self.packet_id)}, {self.state}, attempts={self.attempts})"
+
+    @property
+    def pending(self):
+        return self.state in ('queued', 'sent')
+
+
+class Poll:
+    """A command sent every period seconds; request is the latest one."""
+    __slots__ = ('period', 'packet_id', 'data', 'options', 'due', 'request')
+
+    def __init__(self, period, packet_id, data, options, due):
+        self.period = period
+        self.packet_id = packet_id
+        self.data = bytes(data)
+        self.options = options
+        self.due = due
+        self.request = None
+
+
+class CommandScheduler:
+    """Queued, paced TSIP commands matched to their replies; see the module docstring.
+
+    send(packet_id, data) frames and writes one command, as datumserial's
+    send_tsip_packet() does, and should not block for long (a serial port's
+    write does not, for frames this size).  rate is the link's bytes per
+    second, baudrate / 10 on a serial line; frames are paced by their
+    stuffed length.  log(text) gets one line per command that failed.  clock
+    is the time source, for replaying tests.
+    """
+
+    def __init__(self, send, rate=960.0, timeout=TIMEOUT, retries=RETRIES, log=None, clock=time.monotonic):
+        self._send = send
+        self.rate = rate
+        self.burst = max(rate * BURST_SECONDS, 64)  # bytes the rate limit lets through at once
+        self.timeout = timeout
+        self.retries = retries
+        self.log = log
+        self.clock = clock
+        self.queue = deque()
+        self.waiting = {}  # reply ID -> the sent Request expecting it
+        self.polls = []
+        self.counts = Counter()  # (command ID, 'sent'/'retried'/'answered'/'unconfirmed'/'failed'/'skipped') -> count
+        self.unprompted = Counter()  # report ID -> reports that arrived with no request waiting
+        self.latency = Counter()  # command ID -> seconds summed over answered requests
+        self.bytes_sent = 0
+        self._credit = self.burst
+        self._refilled = clock()
+
+    def send(self, packet_id, data=b'', replies=None, match=None, timeout=None, retries=None, callback=None):
+        """Queues a command and returns its Request.
+
+        replies and match default to the COMMANDS entry (no reply for an
+        unknown command); callback(request) is called when it is done or has
+        failed.
+        """
+        command = COMMANDS.get(packet_id)
+        if replies is None:
+            replies = command.replies if command else ()
+            match = match or (command.match if command else None)
+        request = Request(packet_id, data, replies, match, self.timeout if timeout is None else timeout,
+                          self.retries if retries is None else retries, callback, self.clock())
+        self.queue.append(request)
+        return request
+
+    def every(self, period, packet_id, data=b'', **options):
+        """Sends a command every period seconds, the first time on the next tick().
+
+        options are send()'s.  A poll whose last request is still pending when
+        the next is due skips that turn (counted as 'skipped'), so a receiver
+        that stopped answering does not pile up commands.  Returns the Poll.
+        """
+        poll = Poll(period, packet_id, data, options, self.clock())
+        self.polls.append(poll)
+        return poll
+
+    def feed(self, record):
+        """Takes one decoded record; returns the Request it answered, if any.
+
+        A reply of an ID the receiver sends unprompted leaves latency None.
+        """
+        packet_id = getattr(record, 'packet_id', None)
+        if getattr(record, 'report', None) is None:
+            return None
+        request = self.waiting.get(packet_id)
+        if request is None:
+            self.unprompted[packet_id] += 1
+            return None
+        if request.match and not request.match(record, request.data):
+            return None
+        request.reply = record
+        if self.unprompted[packet_id] >= UNPROMPTED:
+            self.counts[request.packet_id, 'unconfirmed'] += 1
+        else:
+            request.latency = self.clock() - request.sent_at
+            self.latency[request.packet_id] += request.latency
+            self.counts[request.packet_id, 'answered'] += 1
+        self._finish(request, 'done')
+        return request
+
+    def tick(self, now=None):
+        """Starts due polls, expires replies and writes what the rate allows.
+
+        Returns the seconds until something is due again, or None when there is
+        nothing left to do.
+        """
+        now = self.clock() if now is None else now
+        for poll in self.polls:
+            if now >= poll.due:
+                if poll.request is not None and poll.request.pending:
+                    self.counts[poll.packet_id, 'skipped'] += 1
+                else:
+                    poll.request = self.send(poll.packet_id, poll.data, **poll.options)
+                poll.due += poll.period * max(1, (now - poll.due) // poll.period + 1)
+        for request in set(self.waiting.values()):
+            if now >= request.sent_at + request.timeout:
+                self._release(request)
+                if request.attempts > request.retries:
+                    self.counts[request.packet_id, 'failed'] += 1
+                    if self.log:
+                        self.log(f"command {command_name(request.packet_id)} got no "
+                                 f"{'/'.join(f'0x{i:02X}' for i in request.replies)} reply "
+                                 f"after {request.attempts} tries")
+                    self._finish(request, 'failed')
+                else:
+                    request.state = 'queued'
+                    self.counts[request.packet_id, 'retried'] += 1
+                    self.queue.appendleft(request)
+        wait = self._write_queued(now)
+        times = [poll.due for poll in self.polls] + [r.sent_at + r.timeout for r in self.waiting.values()]
+        if times:
+            wait = min(wait if wait is not None else float('inf'), max(min(times) - now, 0.0))
+        return wait
+
+    def _write_queued(self, now):
+        """Writes queued commands in order, skipping any whose reply ID is taken.
+
+        Returns the seconds until the rate allows the next one, None when no
+        sendable command is left waiting for credit.
+        """
+        self._credit = min(self.burst, self._credit + (now - self._refilled) * self.rate)
+        self._refilled = now
+        held = []
+        wait = None
+        while self.queue:
+            request = self.queue.popleft()
+            if any(reply in self.waiting for reply in request.replies):
+                held.append(request)
+                continue
+            frame = frame_command(request.packet_id, request.data)
+            if len(frame) > self._credit and self._credit < self.burst:
+                self.queue.appendleft(request)
+                wait = (min(len(frame), self.burst) - self._credit) / self.rate
+                break
+            self._send(request.packet_id, request.data)
+            self._credit -= len(frame)
+            self.bytes_sent += len(frame)
+            request.attempts += 1
+            request.sent_at = now
+            self.counts[request.packet_id, 'sent'] += 1
+            if request.replies:
+                request.state = 'sent'
+                for reply in request.replies:
+                    self.waiting[reply] = request
+            else:
+                self._finish(request, 'done')
+        self.queue.extendleft(reversed(held))
+        return wait
+
+    def _release(self, request):
+        for reply in request.replies:
+            if self.waiting.get(reply) is request:
+                del self.waiting[reply]
+
+    def _finish(self, request, state):
+        self._release(request)
+        request.state = state
+        if request.callback:
+            request.callback(request)
+
+    @property
+    def pending(self):
+        """Commands queued or waiting for a reply."""
+        return len(self.queue) + len(set(self.waiting.values()))
+
+    def lines(self):
+        """Per command: sent, retried, answered, unconfirmed, failed, skipped polls and mean reply latency."""
+        out = [f"{'command':<42} {'sent':>6} {'retried':>7} {'answered':>8} {'unconfirmed':>11} {'failed':>6} {'skipped':>7} {'latency':>8}"]
+        for packet_id in sorted({packet_id for packet_id, _ in self.counts}):
+            count = {what: self.counts[packet_id, what] for what in ('sent', 'retried', 'answered', 'unconfirmed', 'failed', 'skipped')}
+            latency = f"{self.latency[packet_id] / count['answered'] * 1e3:.0f} ms" if count['answered'] else '-'
+            out.append(f"{command_name(packet_id):<42} {count['sent']:>6} {count['retried']:>7} {count['answered']:>8} "
+                       f"{count['unconfirmed']:>11} {count['failed']:>6} {count['skipped']:>7} {latency:>8}")
+        return out
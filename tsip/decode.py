@@ -0,0 +1,191 @@
+"""Pure-Python decoding core: TSIP bytes or capture files in, records out.
+
+Importing this module loads neither NumPy, pandas nor pyserial, so a script
+that decodes a small capture starts in a few tens of milliseconds:
+
+    from tsip.decode import decode_bytes, read_records
+    records = decode_bytes(open('tsip10.bin', 'rb').read())
+    for record in read_records('capture.bin.gz', keep=id_filter({0x41})):
+        ...
+
+TSIPDeframer is the incremental deframer datumserial.py reads serial ports,
+pipes and files with; decode_bytes() and read_records() run it over a whole
+buffer or capture and decode each packet with tsip.schema.decode_packet().
+For large captures, tsipdecode.decode_columns() decodes every packet of a
+type at once with NumPy.
+"""
+from .capture import open_reader
+from .frame import DLE, DLE_ETX, ETX
+from .schema import decode_packet
+
+DLE_BYTE = bytes([DLE])
+DLE_PAIR = bytes([DLE, DLE])  # Stuffed DLE inside packet data
+
+# Bytes read from a capture file at a time
+READ_SIZE = 65536
+# Longest frame accepted, in stuffed bytes from the ID to the closing <DLE><ETX>.
+# The Datum 9390's largest report is a few dozen bytes; even a 0x47 for 32
+# satellites with every byte stuffed stays well under this.
+MAX_FRAME = 1024
+
+
+class TSIPDeframer:
+    """Incremental TSIP deframer: feed() it chunks of any size, get whole packets back.
+
+    Follows the same framing rules as tsip.frame.find_frames().  A DLE run of odd
+    length followed by ETX closes a frame, and so does an even run followed by ETX
+    and another DLE (this receiver's way of ending on a stuffed DLE).  The first
+    DLE run after a close opens the next frame, so <DLE><DLE><ID> is accepted.
+    Inside a frame any other DLE is payload, as the old read_tsip_packet did.
+    A <DLE><ETX> seen while hunting for a start means we joined mid-frame, and
+    we keep hunting.  With synced=False the first frame is dropped, because it
+    may have started before the data we were given.  With raw=True feed()
+    returns (packet, frame) pairs, frame being the bytes as received from the
+    opening DLE through <DLE><ETX>, for passing on without re-encoding.
+
+    keep is a tsip.schema.id_filter() table: frames whose ID it rules out are
+    decided on as soon as the ID byte is read and skipped at their close,
+    without copying or un-stuffing the payload; skipped[ID] counts them.
+
+    A frame still open max_frame bytes after its ID (line noise, a wrong baud
+    rate) is dropped and counted in overruns, and the hunt for a start resumes
+    right after its ID byte, so a real frame inside the dropped bytes is not
+    lost; the frame found that way is dropped too, as after resync().  So
+    however long a close takes to arrive, the buffer never holds more than
+    max_frame bytes plus the chunk being fed.  find_frames() has no cap: a
+    capture is scanned window by window anyway.
+    """
+
+    def __init__(self, synced=True, raw=False, keep=None, max_frame=MAX_FRAME):
+        self._buffer = bytearray()
+        self._frame = -1  # offset of the packet ID in _buffer, -1 while hunting
+        self._start = 0  # offset of the DLE run opening the frame
+        self.raw = raw
+        self.keep = keep
+        self.max_frame = max_frame
+        self._wanted = True  # whether the current frame's ID passes keep
+        self._scan = 0  # where the search for the closing <DLE><ETX> resumes
+        self._discard = not synced
+        self.packets = 0
+        self.garbage_bytes = 0
+        self.resyncs = 0
+        self.overruns = 0
+        self.skipped = [0] * 256
+
+    @property
+    def pending(self):
+        """Number of buffered bytes that do not form a complete packet yet."""
+        return len(self._buffer)
+
+    def feed(self, chunk):
+        """Adds chunk to the stream and returns the list of packets it completed.
+
+        Each packet is bytes holding the ID followed by the un-stuffed data.
+        """
+        buffer = self._buffer
+        buffer += chunk
+        size = len(buffer)
+        packets = []
+        position = 0
+        while True:
+            if self._frame < 0:  # Looking for start of packet (DLE)
+                start = buffer.find(DLE_BYTE, position)
+                if start < 0:
+                    self.garbage_bytes += size - position
+                    position = size
+                    break
+                self.garbage_bytes += start - position
+                packet_id = start + 1
+                while packet_id < size and buffer[packet_id] == DLE:
+                    packet_id += 1
+                if packet_id == size:  # Need the byte after the DLE run
+                    position = start
+                    break
+                if buffer[packet_id] == ETX:  # End of a frame we never saw start
+                    self.resyncs += 1
+                    self._discard = False
+                    self.garbage_bytes += packet_id + 1 - start
+                    position = packet_id + 1
+                    continue
+                self._frame = packet_id
+                self._wanted = self.keep is None or self.keep[buffer[packet_id]]
+                self._start = start
+                self._scan = packet_id + 1
+            limit = self._frame + self.max_frame
+            close = buffer.find(DLE_ETX, self._scan, limit + 2)
+            if close < 0:
+                if size < limit + 2:
+                    self._scan = max(self._frame + 1, size - 1)
+                    position = self._start
+                    break
+                # Too long for a frame: hunt again from the byte after the ID
+                self.overruns += 1
+                self.garbage_bytes += self._frame + 1 - self._start
+                self._discard = True
+                position = self._frame + 1
+                self._frame = -1
+                continue
+            run = close
+            while buffer[run - 1] == DLE and run - 1 > self._frame:
+                run -= 1
+            if not (close - run) & 1:  # Odd DLE run: framing DLE before ETX
+                pass
+            elif close + 2 == size:  # Need the next byte to tell
+                self._scan = close
+                position = self._start
+                break
+            elif buffer[close + 2] != DLE:  # Stuffed DLE followed by data 0x03
+                self._scan = close + 2
+                continue
+            if self._discard:
+                self._discard = False
+                self.resyncs += 1
+            elif not self._wanted:
+                self.skipped[buffer[self._frame]] += 1
+            else:
+                packet = bytes(buffer[self._frame:close])
+                if DLE_BYTE in packet:
+                    packet = packet.replace(DLE_PAIR, DLE_BYTE)
+                packets.append((packet, bytes(buffer[self._start:close + 2])) if self.raw else packet)
+                self.packets += 1
+            self._frame = -1
+            position = close + 2
+        if position:
+            del buffer[:position]
+            if self._frame >= 0:
+                self._frame -= position
+                self._start -= position
+                self._scan -= position
+        return packets
+
+    def resync(self):
+        """Forgets the partial frame after a gap in the stream, e.g. dropped chunks.
+
+        The next frame is dropped too, since it may have started inside the gap.
+        """
+        self.garbage_bytes += len(self._buffer)
+        self._buffer.clear()
+        self._frame = -1
+        self._scan = 0
+        self._discard = True
+
+
+def decode_bytes(data, synced=True, keep=None):
+    """Records of every packet in data, in stream order (see TSIPDeframer)."""
+    return [decode_packet(packet) for packet in TSIPDeframer(synced, keep=keep).feed(data)]
+
+
+def read_records(path, start=0, end=None, keep=None):
+    """Yields the records of bytes [start, end) of a capture, plain or compressed.
+
+    The file is read READ_SIZE bytes at a time, so memory stays flat for any
+    capture size.  The first frame is dropped unless start is 0 (see synced).
+    """
+    reader = open_reader(path, start, end)
+    deframer = TSIPDeframer(synced=start == 0, keep=keep)
+    try:
+        while chunk := reader.read(READ_SIZE):
+            for packet in deframer.feed(chunk):
+                yield decode_packet(packet)
+    finally:
+        reader.close()
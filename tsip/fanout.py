@@ -0,0 +1,214 @@
+"""Decode-once broadcast of one receiver's packets to many socket clients.
+
+FanOut runs TCP and Unix-socket servers on the caller's asyncio loop.  A client
+subscribes by sending one line when it connects:
+
+    raw                 every frame, byte for byte as the receiver sent it
+    raw 0x41,0x47       only those packet IDs
+    ndjson              every packet as a decoded JSON line (tsip.output)
+    ndjson 0x42         ...filtered the same way
+    changes [IDS]       a {"snapshot": ...} line, then NDJSON of changed fields only
+    snapshot            one {"snapshot": ...} line of the receiver state, then close
+
+The last two need a tsip.state.ReceiverState, which FanOut keeps up to date
+from every packet when given one.
+
+A client that sends nothing within SUBSCRIBE_SECONDS, or closes its sending
+side, gets raw frames of every ID, so anything that reads a TSIP byte stream
+(datumserial.py --tcp, nc > capture.bin) can connect as is.
+
+publish() takes the (packet, frame) pairs TSIPDeframer(raw=True) returns for
+one chunk.  The payload for each distinct subscription is built once per chunk
+and the same bytes object is queued to every client holding that
+subscription, so a raw subscriber costs a queue append and a socket write;
+packets are decoded once, and only when some ndjson client wants their ID
+or a state is kept.  Each client has its own queue of at most queue_bytes; payloads that do
+not fit are dropped for that client alone and counted, so one slow reader
+never holds up the receiver or the other clients.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+
+from .output import changes_line, ndjson_line
+from .schema import decode_packet, parse_ids
+
+SUBSCRIBE_SECONDS = 0.5
+MODES = ('raw', 'ndjson', 'changes', 'snapshot')
+
+
+def parse_subscription(line):
+    """'ndjson 0x41,0x42' -> ('ndjson', frozenset({0x41, 0x42})); IDs None for all.
+
+    Raises ValueError for an unknown mode or bad IDs.
+    """
+    text = line.decode('ascii', 'replace').strip()
+    words = text.split()
+    mode = words[0].lower() if words else 'raw'
+    if mode not in MODES or len(words) > 2:
+        raise ValueError(f"expected 'raw|ndjson|changes [IDS]' or 'snapshot', got {text!r}")
+    return mode, frozenset(parse_ids(words[1])) if len(words) > 1 else None
+
+
+class Subscriber:
+    """One connected client: its subscription, bounded queue and writer task."""
+
+    def __init__(self, writer, mode, ids, capacity):
+        self.writer = writer
+        self.mode = mode
+        self.ids = ids
+        self.capacity = capacity
+        self.name = str(writer.get_extra_info('peername') or 'unix socket')
+        self._chunks = deque()
+        self._size = 0
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.sent_bytes = 0
+        self.dropped_bytes = 0
+
+    def put(self, payload):
+        if self._size + len(payload) > self.capacity:
+            self.dropped_bytes += len(payload)
+            return
+        self._chunks.append(payload)
+        self._size += len(payload)
+        self._ready.set()
+
+    async def run(self):
+        """Writes queued payloads to the client until it goes away or close() is called."""
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                if not self._chunks:  # woken by close()
+                    return
+                data = b''.join(self._chunks)
+                self._chunks.clear()
+                self._size = 0
+                self.writer.write(data)
+                await self.writer.drain()
+                self.sent_bytes += len(data)
+                if self.closed and not self._chunks:
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.writer.close()
+
+    def close(self):
+        """Ends run() once the queue is written out."""
+        self.closed = True
+        self._ready.set()
+
+
+class FanOut:
+    """Servers plus the subscribers they accepted; see the module docstring."""
+
+    def __init__(self, queue_bytes=1 << 20, decode=decode_packet, log=print, state=None):
+        self.queue_bytes = queue_bytes
+        self.decode = decode
+        self.log = log
+        self.state = state
+        self.groups = {}  # (mode, ids) -> list of Subscriber
+        self.servers = []
+        self._tasks = set()
+
+    @property
+    def subscribers(self):
+        return [subscriber for group in self.groups.values() for subscriber in group]
+
+    async def listen(self, address):
+        """Starts a server on '[HOST:]PORT' (host defaults to 127.0.0.1) or 'unix:PATH'."""
+        if address.startswith('unix:'):
+            path = address[5:]
+            if os.path.exists(path):
+                os.unlink(path)  # left over from an earlier run
+            server = await asyncio.start_unix_server(self._accept, path)
+        else:
+            host, _, port = address.rpartition(':')
+            server = await asyncio.start_server(self._accept, host or '127.0.0.1', int(port))
+        self.servers.append(server)
+        return server
+
+    async def _accept(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), SUBSCRIBE_SECONDS)
+        except asyncio.TimeoutError:
+            line = b''
+        except (ConnectionError, OSError):
+            writer.close()
+            return
+        try:
+            mode, ids = parse_subscription(line)
+            if mode in ('changes', 'snapshot') and self.state is None:
+                raise ValueError(f"{mode} needs the server to keep receiver state")
+        except ValueError as e:
+            writer.write(f"error: {e}\n".encode())
+            writer.close()
+            return
+        subscriber = Subscriber(writer, mode, ids, self.queue_bytes)
+        if mode in ('changes', 'snapshot'):
+            subscriber.put(json.dumps({'snapshot': self.state.snapshot()}, separators=(',', ':')).encode() + b'\n')
+        if mode == 'snapshot':
+            subscriber.close()
+            await subscriber.run()
+            return
+        group = self.groups.setdefault((mode, ids), [])
+        group.append(subscriber)
+        wanted = 'all IDs' if ids is None else ','.join(f'0x{packet_id:02X}' for packet_id in sorted(ids))
+        self.log(f"Client {subscriber.name} subscribed: {mode}, {wanted}")
+        task = asyncio.ensure_future(subscriber.run())
+        self._tasks.add(task)
+        try:
+            await task
+        finally:
+            self._tasks.discard(task)
+            group.remove(subscriber)
+            if not group:
+                del self.groups[mode, ids]
+            self.log(f"Client {subscriber.name} left: {subscriber.sent_bytes} bytes sent, {subscriber.dropped_bytes} dropped")
+
+    def publish(self, frames):
+        """Queues one chunk's (packet, frame) pairs to every subscriber that wants them."""
+        records = {}
+        changed = {}
+        if self.state is not None:
+            for k, (packet, _) in enumerate(frames):
+                record = records[k] = self.decode(packet)
+                first, changes = self.state.update(record)
+                if changes:
+                    changed[k] = changes
+        if not self.groups or not frames:
+            return
+        lines = {}
+        for (mode, ids), group in list(self.groups.items()):
+            if mode == 'raw':
+                payload = b''.join(frame for packet, frame in frames if ids is None or packet[0] in ids)
+            elif mode == 'changes':
+                payload = b''.join(changes_line(records[k], changes).encode() for k, changes in changed.items()
+                                   if ids is None or records[k].packet_id in ids)
+            else:
+                parts = []
+                for k, (packet, _) in enumerate(frames):
+                    if ids is None or packet[0] in ids:
+                        line = lines.get(k)
+                        if line is None:
+                            record = records[k] if k in records else self.decode(packet)
+                            line = lines[k] = ndjson_line(record).encode()
+                        parts.append(line)
+                payload = b''.join(parts)
+            if payload:
+                for subscriber in group:
+                    subscriber.put(payload)
+
+    async def close(self, timeout=5.0):
+        """Stops accepting, lets clients drain their queues for up to timeout seconds, then disconnects them."""
+        for server in self.servers:
+            server.close()
+        for subscriber in self.subscribers:
+            subscriber.close()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+        for server in self.servers:
+            await server.wait_closed()
@@ -0,0 +1,179 @@
+"""Locating TSIP frames in captures: vectorized scanning and shard boundaries.
+
+find_frames() finds every frame of a capture window with NumPy, by the same
+rules as tsip.decode.TSIPDeframer, and scan_windows() walks a whole file
+with it through np.memmap.
+
+Right after a <DLE><ETX> that closes a frame the deframer is hunting for the
+next start whatever came before, so a capture cut there decodes piece by piece
+exactly as it does in one pass.  A close is a DLE run of odd length followed by
+ETX, or an even run followed by ETX and another DLE (the Datum 9390 quirk).
+Only odd-run closes are used as cut points: telling the quirk close from
+payload needs the byte after ETX, which would be in the next piece.
+
+find_frames_plain() gives the same frames without NumPy, for inputs so small
+that importing NumPy would take longer than the scan.  NumPy and re are only
+imported by the functions that use them.
+"""
+import mmap
+import os
+
+DLE = 0x10
+ETX = 0x03
+DLE_ETX = bytes([DLE, ETX])
+DLE_RUN = bytes([DLE]) + b'+'  # regular expression
+
+# Bytes of a capture mapped and scanned at a time
+WINDOW_BYTES = 1 << 20
+
+
+def find_frames(data, synced=True):
+    """Locates every <DLE><ID>...<DLE><ETX> frame in a uint8 array in one pass.
+
+    Works on DLE runs rather than single bytes.  A run of odd length followed by
+    ETX closes a frame; so does an even run followed by ETX and another DLE, which
+    this receiver sends when a stuffed DLE is the last payload byte.  While hunting
+    for a start, runs followed by ETX are skipped and the first other run opens a
+    frame (the receiver sometimes sends <DLE><DLE><ID>).  Inside a frame every
+    other run is payload.  These are the rules of tsip.decode.TSIPDeframer.
+    With synced=False the data may start mid-frame, so a frame opened before any
+    <DLE><ETX> was seen is dropped.
+
+    Returns (index, ids, begin, end) arrays: offset of the DLE in front of the ID,
+    the ID byte, and the [begin, end) span of the still-stuffed payload; plus the
+    offset just past the last close, where an unfinished frame would begin.
+    """
+    import numpy as np
+    edges = np.diff(np.concatenate(([0], (data == DLE).view(np.int8), [0])))
+    run_start = np.flatnonzero(edges == 1)
+    run_stop = np.flatnonzero(edges == -1)  # byte following each DLE run
+    if run_stop.size and run_stop[-1] == data.size:
+        run_start = run_start[:-1]
+        run_stop = run_stop[:-1]
+    follow = data[run_stop]
+    after = run_stop + 1
+    then_dle = (data[np.minimum(after, data.size - 1)] == DLE) & (after < data.size)
+    odd = ((run_stop - run_start) & 1).astype(bool)
+    is_etx = follow == ETX
+    is_end = (odd | then_dle) & is_etx
+
+    # A run is hunting when no other run came before it, or when a close
+    # happened after the last run that was not followed by ETX.
+    last_id = np.maximum.accumulate(np.where(is_etx, -1, np.arange(follow.size)))
+    previous_id = np.concatenate(([-1], last_id[:-1]))
+    closes = np.concatenate(([0], np.cumsum(is_end)))
+    hunting = (previous_id < 0) | (closes[:-1] > closes[previous_id + 1])
+
+    starts = np.flatnonzero(hunting & ~is_etx)
+    if not synced and starts.size and starts[0] == 0:
+        starts = starts[1:]
+    ends = np.flatnonzero(is_end)
+    closing = np.searchsorted(ends, starts)
+    complete = closing < ends.size
+    s = starts[complete]
+    e = ends[closing[complete]]
+    consumed = int(run_stop[ends[-1]]) + 1 if ends.size else 0
+    return run_stop[s] - 1, follow[s], run_stop[s] + 1, run_stop[e] - 1, consumed
+
+
+def find_frames_plain(data, synced=True):
+    """find_frames() in pure Python: the same frames of bytes-like data, as lists.
+
+    Walks the DLE runs in order, hunting or inside a frame, which is quicker
+    than importing NumPy for a capture of a few kilobytes.
+    """
+    import re
+    index, ids, begin, end = [], [], [], []
+    size = len(data)
+    hunting = True
+    opened = None  # byte after the DLE run that opened the current frame, None if dropped
+    consumed = 0
+    first = True
+    for run in re.finditer(DLE_RUN, data):
+        run_start, run_stop = run.span()
+        if run_stop == size:  # the byte after it is not here yet
+            break
+        if data[run_stop] == ETX:
+            if (run_stop - run_start) & 1 or (run_stop + 1 < size and data[run_stop + 1] == DLE):
+                if not hunting and opened is not None:
+                    index.append(opened - 1)
+                    ids.append(data[opened])
+                    begin.append(opened + 1)
+                    end.append(run_stop - 1)
+                hunting = True
+                consumed = run_stop + 1
+        elif hunting:
+            hunting = False
+            opened = None if first and not synced else run_stop
+        first = False
+    return index, ids, begin, end, consumed
+
+
+def scan_windows(filename, scan, start=0, stop=None, window=WINDOW_BYTES, synced=None):
+    """Runs scan over bytes [start, stop) of a capture through np.memmap.
+
+    The file is mapped one window at a time; a frame cut by the end of a window
+    is scanned again at the start of the next, so resident memory depends on the
+    window size and not on the file size.  scan(data, base, synced) is called on
+    each window and returns the bytes it consumed.  The first frame is trusted
+    only when start is 0 or synced says start is a frame boundary.
+    """
+    import numpy as np
+    stop = os.path.getsize(filename) if stop is None else min(stop, os.path.getsize(filename))
+    position = start
+    synced = start == 0 if synced is None else synced
+    while position < stop:
+        limit = min(position + window, stop)
+        data = np.memmap(filename, dtype=np.uint8, mode='r', offset=position, shape=(limit - position,))
+        consumed = scan(data, position, synced)
+        del data
+        if limit == stop:
+            break
+        if consumed:
+            position += consumed
+            synced = True
+        else:  # no frame closed in a whole window: line noise, resync in the next one
+            position = limit
+            synced = False
+
+
+def find_boundary(data, start=0, stop=None):
+    """Offset just past the first odd-run frame close in data[start:stop], or None.
+
+    data is bytes, bytearray or an mmap of the whole capture; DLE runs are
+    counted back before start when needed.
+    """
+    stop = len(data) if stop is None else stop
+    position = data.find(DLE_ETX, start, stop)
+    while position >= 0 and position + 2 <= stop:
+        run = position
+        while run > 0 and data[run - 1] == DLE:
+            run -= 1
+        if (position - run) % 2 == 0:
+            return position + 2
+        position = data.find(DLE_ETX, position + 2, stop)
+    return None
+
+
+def shard_boundaries(path, shards, start=0, stop=None):
+    """Cuts bytes [start, stop) of a capture into about `shards` pieces.
+
+    Returns the sorted cut offsets, beginning with start and ending with stop;
+    every cut in between falls right after a frame close.  Fewer pieces come
+    back when the capture has too few closes.
+    """
+    size = os.path.getsize(path)
+    stop = size if stop is None else min(stop, size)
+    cuts = [start]
+    if shards > 1 and stop > start:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for k in range(1, shards):
+                target = start + (stop - start) * k // shards
+                if target <= cuts[-1]:
+                    continue
+                cut = find_boundary(data, target, stop)
+                if cut is None or cut >= stop:
+                    break
+                cuts.append(cut)
+    cuts.append(stop)
+    return cuts
@@ -0,0 +1,155 @@
+"""Array-at-once coordinate and time conversions for decoded reports.
+
+ecef_to_lla() turns 0x42 ECEF fixes into WGS-84 latitude, longitude and height,
+and gps_to_utc() turns (week, time of week, UTC offset) into datetime64
+timestamps, for whole columns at a time (see tsipdecode.decode_columns).
+
+The Datum 9390 sends a 10-bit week number, so the week it reports repeats every
+1024 weeks (about 19.6 years).  resolve_weeks() settles which 1024-week era a
+capture is in once, from context: the capture's date (its file modification
+time, or now for live data) must not be earlier than the weeks it holds.  The
+most common valid week of the capture is placed in the latest era that allows
+that, and every other week is counted from it, so a capture that runs across
+a rollover stays continuous.
+
+NumPy is only imported by the array functions, so gps_week_at(),
+resolve_week() and ecef_to_lla_point() are cheap to use from the console
+decoder.
+"""
+import math
+import time
+
+# WGS-84
+A = 6378137.0
+F = 1 / 298.257223563
+B = A * (1 - F)
+E2 = F * (2 - F)
+EP2 = E2 / (1 - E2)
+
+GPS_EPOCH = '1980-01-06T00:00:00'  # as a numpy.datetime64 string
+GPS_EPOCH_UNIX = 315964800  # 1980-01-06 in seconds since 1970-01-01
+WEEK_SECONDS = 604800
+ROLLOVER = 1024
+
+
+def ecef_to_lla(x, y, z):
+    """WGS-84 geodetic (latitude, longitude in degrees, height in metres) of ECEF metres.
+
+    Closed form (Heikkinen), exact to well under a millimetre for any point
+    outside the Earth's core; arrays of any shape, NaN in gives NaN out.
+    """
+    import numpy as np
+    with np.errstate(invalid='ignore', divide='ignore'):  # NaN or the core: NaN out, quietly
+        x, y, z = (np.asarray(v, dtype=np.float64) for v in (x, y, z))
+        p2 = x * x + y * y
+        p = np.sqrt(p2)
+        f = 54 * B * B * z * z
+        g = p2 + (1 - E2) * z * z - E2 * (A * A - B * B)
+        c = E2 * E2 * f * p2 / (g * g * g)
+        s = np.cbrt(1 + c + np.sqrt(c * c + 2 * c))
+        k = s + 1 + 1 / s
+        q = f / (3 * k * k * g * g)
+        r = np.sqrt(1 + 2 * E2 * E2 * q)
+        r0 = -q * E2 * p / (1 + r) + np.sqrt(np.maximum(
+            0.5 * A * A * (1 + 1 / r) - q * (1 - E2) * z * z / (r * (1 + r)) - 0.5 * q * p2, 0))
+        u = np.hypot(p - E2 * r0, z)
+        v = np.sqrt((p - E2 * r0) ** 2 + (1 - E2) * z * z)
+        z0 = B * B * z / (A * v)
+        height = u * (1 - B * B / (A * v))
+        latitude = np.degrees(np.arctan2(z + EP2 * z0, p))
+        longitude = np.degrees(np.arctan2(y, x))
+    return latitude, longitude, height
+
+
+def ecef_to_lla_point(x, y, z):
+    """ecef_to_lla() of one point with the math module, as floats; no NumPy needed."""
+    p2 = x * x + y * y
+    p = math.sqrt(p2)
+    f = 54 * B * B * z * z
+    g = p2 + (1 - E2) * z * z - E2 * (A * A - B * B)
+    if p == 0 or g == 0 or not math.isfinite(p + z):
+        return tuple(float(v) for v in ecef_to_lla(x, y, z))  # the pole, the core or NaN: as the array version
+    c = E2 * E2 * f * p2 / (g * g * g)
+    s = (1 + c + math.sqrt(c * c + 2 * c)) ** (1 / 3)
+    k = s + 1 + 1 / s
+    q = f / (3 * k * k * g * g)
+    r = math.sqrt(1 + 2 * E2 * E2 * q)
+    r0 = -q * E2 * p / (1 + r) + math.sqrt(max(
+        0.5 * A * A * (1 + 1 / r) - q * (1 - E2) * z * z / (r * (1 + r)) - 0.5 * q * p2, 0))
+    u = math.hypot(p - E2 * r0, z)
+    v = math.sqrt((p - E2 * r0) ** 2 + (1 - E2) * z * z)
+    z0 = B * B * z / (A * v)
+    return (math.degrees(math.atan2(z + EP2 * z0, p)), math.degrees(math.atan2(y, x)),
+            u * (1 - B * B / (A * v)))
+
+
+def lla_to_ecef(latitude, longitude, height):
+    """Inverse of ecef_to_lla(): degrees and metres to ECEF metres."""
+    import numpy as np
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    height = np.asarray(height, dtype=np.float64)
+    n = A / np.sqrt(1 - E2 * np.sin(latitude) ** 2)
+    return ((n + height) * np.cos(latitude) * np.cos(longitude),
+            (n + height) * np.cos(latitude) * np.sin(longitude),
+            (n * (1 - E2) + height) * np.sin(latitude))
+
+
+def gps_week_at(unix_seconds=None):
+    """Full GPS week number at a Unix time (default: now)."""
+    unix_seconds = time.time() if unix_seconds is None else unix_seconds
+    return int((unix_seconds - GPS_EPOCH_UNIX) // WEEK_SECONDS)
+
+
+def valid_times(tow, utc_offset=None):
+    """Mask of plausible 0x41 reports: time of week in range and, if given, a sane UTC offset."""
+    import numpy as np
+    tow = np.asarray(tow, dtype=np.float64)
+    valid = (tow >= 0) & (tow < WEEK_SECONDS)
+    if utc_offset is not None:
+        utc_offset = np.asarray(utc_offset, dtype=np.float64)
+        valid &= (utc_offset >= 0) & (utc_offset < 1000)
+    return valid
+
+
+def resolve_weeks(weeks, reference_week=None, valid=None):
+    """Full GPS weeks of reported (possibly 10-bit) weeks, era chosen once for all.
+
+    reference_week is a full week the data cannot be later than (default: this
+    week; for a capture, gps_week_at() of its modification time).  Only the
+    weeks marked valid choose the era; all are converted.  Returns int64.
+    """
+    import numpy as np
+    weeks = np.asarray(weeks, dtype=np.int64) % ROLLOVER
+    reference_week = gps_week_at() if reference_week is None else reference_week
+    if weeks.size == 0:
+        return weeks
+    chosen = weeks if valid is None else weeks[np.asarray(valid, bool)]
+    anchor = np.bincount(chosen if chosen.size else weeks, minlength=ROLLOVER).argmax()
+    anchor_full = reference_week - (reference_week - anchor) % ROLLOVER
+    # Signed distance from the anchor, within half an era either way
+    return anchor_full + (weeks - anchor + ROLLOVER // 2) % ROLLOVER - ROLLOVER // 2
+
+
+def resolve_week(week, reference_week=None):
+    """Full GPS week of one reported week: the latest one not after reference_week."""
+    reference_week = gps_week_at() if reference_week is None else reference_week
+    return reference_week - (reference_week - week % ROLLOVER) % ROLLOVER
+
+
+def gps_to_utc(weeks, tow, utc_offset=0.0):
+    """datetime64[ns] UTC timestamps of full GPS weeks plus time of week.
+
+    utc_offset is the GPS-UTC leap second count (whole seconds are used, as the
+    receiver's console output does); NaN weeks and times of week outside a
+    week give NaT.
+    """
+    import numpy as np
+    weeks = np.asarray(weeks, dtype=np.float64)
+    tow = np.asarray(tow, dtype=np.float64)
+    valid = np.isfinite(weeks) & valid_times(tow)
+    offset = np.trunc(np.nan_to_num(np.asarray(utc_offset, dtype=np.float64)))
+    # Whole seconds and time of week apart, so nanoseconds survive float64
+    whole = np.where(valid, weeks * WEEK_SECONDS - offset, 0).astype(np.int64)
+    fraction = np.round(np.where(valid, tow, 0) * 1e9).astype(np.int64)
+    nanoseconds = (whole * 1_000_000_000 + fraction).astype('timedelta64[ns]')
+    return np.where(valid, np.datetime64(GPS_EPOCH, 'ns') + nanoseconds, np.datetime64('NaT'))
@@ -0,0 +1,131 @@
+"""Packet offset index: a sidecar file for seeking in capture files.
+
+build_index() makes one pass over a capture and writes capture.bin.idx next to
+it: a short header followed by one fixed-size record per frame with its byte
+offset, length, packet ID and the GPS week and time of week of the latest 0x41
+report at that point (NaN before the first one).  query() then picks frames by
+ID and time of week in milliseconds, and read_packets() slices just those
+frames out of the capture, so nothing else is decoded.
+
+The header holds the capture's size and modification time; an index that no
+longer matches its capture is ignored and rebuilt.
+"""
+import mmap
+import os
+import struct
+
+from .frame import DLE, WINDOW_BYTES, find_frames, scan_windows
+from .schema import REPORTS
+
+MAGIC = b'TSIPIDX1'
+HEADER = struct.Struct('<8sQq')  # magic, capture size, capture mtime in ns
+# One record per frame, 19 bytes
+FIELDS = [('offset', '<u8'), ('length', '<u4'), ('week', '<u2'), ('tow', '<f4'), ('id', 'u1')]
+DLE_PAIR = bytes([DLE, DLE])
+
+
+def index_path(path):
+    """Sidecar index file of a capture."""
+    return path + '.idx'
+
+
+def build_index(path, window=WINDOW_BYTES):
+    """Indexes every frame of a capture, writes the sidecar and returns the records.
+
+    The frames are the ones tsipdecode.py decodes; records are a NumPy array
+    with the FIELDS columns.  They are returned even when the sidecar cannot
+    be written, as reading one that cannot be read counts as no index.
+    """
+    import numpy as np
+    dtype = np.dtype(FIELDS)
+    time_report = REPORTS[0x41]
+    parts = []
+    clock = [0, np.nan]  # week and tow of the last 0x41 seen
+
+    def scan(data, base, synced):
+        index, ids, begin, end, consumed = find_frames(data, synced)
+        records = np.zeros(index.size, dtype)
+        records['offset'] = index + base
+        records['length'] = end + 2 - index  # through the closing ETX
+        records['id'] = ids
+        is_time = ids == 0x41
+        weeks = [clock[0]]
+        tows = [clock[1]]
+        for frame in np.flatnonzero(is_time).tolist():
+            payload = data[begin[frame]:end[frame]].tobytes().replace(DLE_PAIR, bytes([DLE]))
+            if len(payload) >= time_report.min_length:
+                (tow, week, _), _ = time_report.unpack(payload)
+            else:
+                tow, week = np.nan, 0
+            weeks.append(week)
+            tows.append(tow)
+        latest = np.cumsum(is_time)  # the 0x41 each frame follows, 0 for the previous window's
+        records['week'] = np.array(weeks, np.uint16)[latest]
+        records['tow'] = np.array(tows, np.float32)[latest]
+        clock[:] = [weeks[-1], tows[-1]]
+        parts.append(records)
+        return consumed
+
+    scan_windows(path, scan, window=window)
+    records = np.concatenate(parts) if parts else np.zeros(0, dtype)
+    stat = os.stat(path)
+    try:
+        with open(index_path(path), 'wb') as f:
+            f.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns))
+            f.write(records.tobytes())
+    except OSError:  # e.g. a read-only directory: the index is used unsaved
+        pass
+    return records
+
+
+def load_index(path):
+    """Records of a capture's sidecar index, or None when it is missing or stale."""
+    import numpy as np
+    try:
+        with open(index_path(path), 'rb') as f:
+            magic, size, mtime = HEADER.unpack(f.read(HEADER.size))
+            records = np.fromfile(f, np.dtype(FIELDS))
+    except (OSError, struct.error):
+        return None
+    stat = os.stat(path)
+    if magic != MAGIC or size != stat.st_size or mtime != stat.st_mtime_ns:
+        return None
+    return records
+
+
+def open_index(path):
+    """The capture's index, built first when it is missing or out of date."""
+    records = load_index(path)
+    return build_index(path) if records is None else records
+
+
+def query(records, ids=None, from_tow=None, to_tow=None):
+    """Records of the packets with one of ids whose time of week is in [from_tow, to_tow]."""
+    import numpy as np
+    keep = np.ones(records.size, bool)
+    if ids:
+        keep &= np.isin(records['id'], list(ids))
+    if from_tow is not None:
+        keep &= records['tow'] >= from_tow
+    if to_tow is not None:
+        keep &= records['tow'] <= to_tow
+    return records[keep]
+
+
+def read_packets(path, records):
+    """Yields (offset, packet) for the given index records.
+
+    Each packet is the ID followed by the un-stuffed data, as TSIPDeframer.feed
+    returns it, cut straight out of the memory-mapped capture.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for offset, length in zip(records['offset'].tolist(), records['length'].tolist()):
+            frame = data[offset:offset + length]
+            start = 0
+            while frame[start] == DLE:
+                start += 1
+            packet = frame[start:-2]
+            if DLE in packet:
+                packet = packet.replace(DLE_PAIR, bytes([DLE]))
+            yield offset, packet
+
@@ -0,0 +1,202 @@
+"""Runtime counters of a live decoder, printed with --stats or served to Prometheus.
+
+Metrics counts packets and bytes per packet ID, malformed and unknown packets
+per ID, and keeps a histogram of decode times per ID.  Deframers and chunk
+queues are registered with watch() and their own counters (garbage bytes,
+resyncs, overlong frames, frames skipped by the ID filter, queue depth, dropped and spilled
+bytes) are only read when a report is made, so the per-packet cost is the decode timing and one row of counters.
+A decoder without a Metrics does none of this.
+
+serve() answers GET /metrics with the Prometheus text format from a daemon
+thread.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .schema import REPORTS, MalformedPacket, decode_packet
+
+# Upper bounds of the decode time histogram buckets, in seconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+
+
+def type_name(packet_id):
+    report = REPORTS.get(packet_id)
+    return report.record.__name__ if report else 'Unknown'
+
+
+def label(value):
+    """A Prometheus label value: backslash, quote and newline escaped."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def quantile(counts, q):
+    """Upper bucket bound below which a fraction q of the observations fall."""
+    total = sum(counts)
+    seen = 0
+    for bound, count in zip(BUCKETS + (float('inf'),), counts):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return float('inf')
+
+
+class Metrics:
+    """Counters of one decoder process, shared by all its sources.
+
+    Only the decoding thread updates them; snapshot() copies each table in one
+    step, which the GIL keeps consistent for readers on other threads.
+    """
+
+    def __init__(self):
+        self.rows = {}  # packet ID -> [packets, bytes, decode seconds, malformed, count per bucket..., +Inf]
+        self.sources = {}  # source -> (deframer, queue)
+        self.started = time.monotonic()
+
+    def watch(self, source, deframer=None, queue=None):
+        """Reports the counters of a source's TSIPDeframer and ChunkQueue too."""
+        self.sources[source] = (deframer, queue)
+
+    def decode(self, packet):
+        """decode_packet() with the packet and its decode time counted."""
+        start = time.perf_counter()
+        record = decode_packet(packet)
+        seconds = time.perf_counter() - start
+        row = self.rows.get(packet[0])
+        if row is None:
+            row = self.rows[packet[0]] = [0, 0, 0.0, 0] + [0] * (len(BUCKETS) + 1)
+        row[0] += 1
+        row[1] += len(packet)
+        row[2] += seconds
+        row[4 + bisect.bisect_left(BUCKETS, seconds)] += 1
+        if record.__class__ is MalformedPacket:
+            row[3] += 1
+        return record
+
+    def snapshot(self):
+        """Copy of the counters as plain dicts keyed by packet ID, source counters included."""
+        rows = {packet_id: list(row) for packet_id, row in list(self.rows.items())}
+        sources = {}
+        skipped = {}
+        for source, (deframer, queue) in list(self.sources.items()):
+            counters = {}
+            if deframer is not None:
+                counters.update(packets=deframer.packets, garbage_bytes=deframer.garbage_bytes,
+                                resyncs=deframer.resyncs, overruns=deframer.overruns, pending_bytes=deframer.pending)
+                if deframer.keep is not None:
+                    counters['skipped_frames'] = sum(deframer.skipped)
+                    for packet_id, count in enumerate(deframer.skipped):
+                        if count:
+                            skipped[packet_id] = skipped.get(packet_id, 0) + count
+            if queue is not None:
+                counters.update(queue_depth=queue.depth, queue_max_depth=queue.max_depth,
+                                dropped_bytes=queue.dropped_bytes, spilled_bytes=queue.spilled_bytes)
+            sources[source] = counters
+        return {
+            'uptime': time.monotonic() - self.started,
+            'packets': {packet_id: row[0] for packet_id, row in rows.items()},
+            'bytes': {packet_id: row[1] for packet_id, row in rows.items()},
+            'decode_seconds': {packet_id: row[2] for packet_id, row in rows.items()},
+            'malformed': {packet_id: row[3] for packet_id, row in rows.items() if packet_id in REPORTS},
+            'unknown': {packet_id: row[0] for packet_id, row in rows.items() if packet_id not in REPORTS},
+            'histograms': {packet_id: row[4:] for packet_id, row in rows.items()},
+            'skipped': skipped,
+            'sources': sources,
+        }
+
+    def summary(self):
+        """Lines of the --stats report."""
+        snap = self.snapshot()
+        total = sum(snap['packets'].values())
+        lines = [f"Decoded {total} packets in {snap['uptime']:.1f} s"]
+        unknown = {packet_id: count for packet_id, count in snap['packets'].items() if packet_id not in REPORTS}
+        for packet_id in sorted(set(snap['packets']) - set(unknown)):
+            count = snap['packets'][packet_id]
+            histogram = snap['histograms'][packet_id]
+            line = (f"  0x{packet_id:02X} {type_name(packet_id)}: {count} packets, {snap['bytes'][packet_id]} bytes, "
+                    f"decode mean {snap['decode_seconds'][packet_id] / count * 1e6:.1f} us, "
+                    f"p99 <= {quantile(histogram, 0.99) * 1e6:g} us")
+            if snap['malformed'].get(packet_id):
+                line += f", {snap['malformed'][packet_id]} malformed"
+            lines.append(line)
+        if unknown:
+            lines.append(f"  unknown IDs: {sum(unknown.values())} packets with {len(unknown)} different IDs")
+        if snap['skipped']:
+            lines.append("  skipped by ID filter: " + ', '.join(f"0x{packet_id:02X}={count}" for packet_id, count in sorted(snap['skipped'].items())))
+        for source, counters in snap['sources'].items():
+            lines.append(f"  {source}: " + ', '.join(f"{name.replace('_', ' ')}={value}" for name, value in counters.items()))
+        return lines
+
+    def prometheus(self):
+        """The counters in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        out = []
+
+        def family(name, kind, text):
+            out.append(f"# HELP {name} {text}\n# TYPE {name} {kind}\n")
+
+        def by_id(name, text, values):
+            family(name, 'counter', text)
+            for packet_id in sorted(values):
+                out.append(f'{name}{{id="0x{packet_id:02X}",type="{type_name(packet_id)}"}} {values[packet_id]}\n')
+
+        family('tsip_uptime_seconds', 'gauge', 'Seconds since the decoder started.')
+        out.append(f"tsip_uptime_seconds {snap['uptime']:.3f}\n")
+        by_id('tsip_packets_total', 'Packets decoded per packet ID.', snap['packets'])
+        by_id('tsip_packet_bytes_total', 'Un-stuffed packet bytes (ID included) per packet ID.', snap['bytes'])
+        by_id('tsip_malformed_packets_total', 'Packets too short for their report layout.', snap['malformed'])
+        by_id('tsip_unknown_packets_total', 'Packets with an ID no report layout is known for.', snap['unknown'])
+        by_id('tsip_skipped_frames_total', 'Frames the packet ID filter skipped without decoding.', snap['skipped'])
+        family('tsip_decode_seconds', 'histogram', 'Time to decode one packet.')
+        for packet_id in sorted(snap['histograms']):
+            labels = f'id="0x{packet_id:02X}",type="{type_name(packet_id)}"'
+            seen = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), snap['histograms'][packet_id]):
+                seen += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                out.append(f'tsip_decode_seconds_bucket{{{labels},le="{le}"}} {seen}\n')
+            out.append(f"tsip_decode_seconds_sum{{{labels}}} {snap['decode_seconds'][packet_id]:.9f}\n")
+            out.append(f"tsip_decode_seconds_count{{{labels}}} {seen}\n")
+        for key, name, kind, text in (
+                ('packets', 'tsip_frames_total', 'counter', 'Frames deframed per source.'),
+                ('skipped_frames', 'tsip_filtered_frames_total', 'counter', 'Frames skipped by the packet ID filter per source.'),
+                ('garbage_bytes', 'tsip_garbage_bytes_total', 'counter', 'Bytes skipped while hunting for a frame start.'),
+                ('resyncs', 'tsip_resyncs_total', 'counter', 'Times the deframer lost and regained framing.'),
+                ('overruns', 'tsip_overruns_total', 'counter', 'Frames dropped for running past the frame length cap.'),
+                ('pending_bytes', 'tsip_pending_bytes', 'gauge', 'Bytes buffered in an incomplete frame.'),
+                ('queue_depth', 'tsip_queue_depth_bytes', 'gauge', 'Bytes waiting between reader and decoder.'),
+                ('queue_max_depth', 'tsip_queue_max_depth_bytes', 'gauge', 'Most bytes ever waiting in the queue.'),
+                ('dropped_bytes', 'tsip_queue_dropped_bytes_total', 'counter', 'Bytes the queue dropped because the decoder fell behind.'),
+                ('spilled_bytes', 'tsip_queue_spilled_bytes_total', 'counter', 'Bytes the queue spilled to disk.')):
+            rows = [(source, counters[key]) for source, counters in snap['sources'].items() if key in counters]
+            if rows:
+                family(name, kind, text)
+                out.extend(f'{name}{{source="{label(source)}"}} {value}\n' for source, value in rows)
+        return ''.join(out)
+
+
+def serve(metrics, port, host='127.0.0.1'):
+    """Serves metrics.prometheus() at http://host:port/metrics from a daemon thread.
+
+    Returns the server; call shutdown() on it to stop.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # keep the console for packets
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="tsip-metrics", daemon=True).start()
+    return server
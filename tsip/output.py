@@ -0,0 +1,163 @@
+"""Output formats for decoded records and the buffered writer behind them.
+
+csv_line(), ndjson_line() and binary_record() turn one record from
+tsip.schema into a line or a byte string.  BatchWriter collects what the
+decoders write and hands it to the real stream in large pieces, either once
+batch_bytes have piled up or interval seconds after the last flush, so a slow
+pipe sees a few big writes instead of one per line.
+
+The binary stream is a sequence of little-endian (packet ID u8, length u16)
+headers each followed by that many bytes of un-stuffed packet data;
+iter_binary() reads it back as packets for decode_packet().
+
+json and csv are imported by the functions that use them, so importing this
+module adds nothing to a decoder's start-up.
+"""
+import math
+import struct
+import time
+
+from .schema import encode
+
+BINARY_HEADER = struct.Struct('<BH')
+# Byte string fields holding ASCII text (0x48); other byte strings are written as hex
+TEXT_FIELDS = frozenset({'message'})
+FORMATS = ('color', 'text', 'csv', 'ndjson', 'binary')
+
+
+class BatchWriter:
+    """File-like buffer in front of stream (text or binary, matching what is written).
+
+    write() only queues; flush() writes everything queued as one piece.
+    tick() flushes when interval seconds have passed, for callers that go idle.
+    """
+
+    def __init__(self, stream, batch_bytes=1 << 16, interval=0.5):
+        self.stream = stream
+        self.batch_bytes = batch_bytes
+        self.interval = interval
+        self._parts = []
+        self._size = 0
+        self._flushed = time.monotonic()
+        self.flushes = 0
+
+    def write(self, data):
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self.batch_bytes or time.monotonic() - self._flushed >= self.interval:
+            self.flush()
+        return len(data)
+
+    def tick(self):
+        if self._parts and time.monotonic() - self._flushed >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.stream.write(self._parts[0][:0].join(self._parts))
+            self._parts = []
+            self._size = 0
+            self.flushes += 1
+        self.stream.flush()
+        self._flushed = time.monotonic()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+
+def plain(value, name=None):
+    """JSON/CSV form of field name's value: bytes as hex (text for TEXT_FIELDS), NaN as None."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, bytes):
+        return value.decode('ascii', errors='replace').rstrip('\0 ') if name in TEXT_FIELDS else value.hex()
+    return value
+
+
+def record_fields(record):
+    """Field name -> plain value of a record, group entries as lists of dicts."""
+    fields = {}
+    for name, value in zip(record._fields, record):
+        if isinstance(value, list):
+            fields[name] = [{key: plain(item) for key, item in zip(entry._fields, entry)} for entry in value]
+        elif name != 'packet_id':
+            fields[name] = plain(value, name)
+    return fields
+
+
+def ndjson_line(record, source=None):
+    """One JSON object per record: id, type, optional source, then the fields."""
+    import json
+    line = {'id': record.packet_id, 'type': type(record).__name__}
+    if source is not None:
+        line['source'] = source
+    line.update(record_fields(record))
+    return json.dumps(line, separators=(',', ':')) + '\n'
+
+
+def plain_changes(changes):
+    """JSON form of a tsip.state change dict: group entries as dicts, None kept for gone."""
+    out = {}
+    for name, value in changes.items():
+        if isinstance(value, dict):
+            out[name] = {key: None if entry is None else {field: plain(item) for field, item in zip(entry._fields[1:], entry[1:])}
+                         for key, entry in value.items()}
+        else:
+            out[name] = plain(value, name)
+    return out
+
+
+def changes_line(record, changes, source=None):
+    """ndjson_line() of only the changed fields (see tsip.state), under 'changes'."""
+    import json
+    line = {'id': record.packet_id, 'type': type(record).__name__}
+    if source is not None:
+        line['source'] = source
+    line['changes'] = plain_changes(changes)
+    return json.dumps(line, separators=(',', ':')) + '\n'
+
+
+def signal_stats_line(snapshot, source=None):
+    """One {"signal_stats": ...} line of a tsip.signals snapshot, with optional source."""
+    import json
+    line = {'source': source} if source is not None else {}
+    line['signal_stats'] = snapshot
+    return json.dumps(line, separators=(',', ':')) + '\n'
+
+
+def csv_line(record, source=None):
+    """0x41,GPSTime[,source],values...; group entries are appended to the same row."""
+    row = ['0x%02X' % record.packet_id, type(record).__name__]
+    if source is not None:
+        row.append(source)
+    for name, value in zip(record._fields, record):
+        if isinstance(value, list):
+            for entry in value:
+                row.extend(plain(item) for item in entry)
+        elif name != 'packet_id':
+            row.append(plain(value, name))
+    cells = ['' if value is None else str(value) for value in row]
+    if any(',' in cell or '"' in cell or '\n' in cell for cell in cells):  # needs quoting
+        import csv
+        import io
+        line = io.StringIO()
+        csv.writer(line, lineterminator='\n').writerow(row)
+        return line.getvalue()
+    return ','.join(cells) + '\n'
+
+
+def binary_record(record):
+    """Length-prefixed packet data of one record (see the module docstring)."""
+    data = encode(record)
+    return BINARY_HEADER.pack(record.packet_id, len(data)) + data
+
+
+def iter_binary(data):
+    """Packets (ID byte + data) from a binary record stream."""
+    view = memoryview(data)
+    offset = 0
+    while offset + BINARY_HEADER.size <= len(view):
+        packet_id, length = BINARY_HEADER.unpack_from(view, offset)
+        offset += BINARY_HEADER.size
+        yield bytes([packet_id]) + bytes(view[offset:offset + length])
+        offset += length
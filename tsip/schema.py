@@ -0,0 +1,224 @@
+"""Field layouts of the TSIP report packets (0x40-0x82) sent by the Datum 9390.
+
+Every report is described once as a list of (name, struct code) pairs and
+compiled to struct.Struct when this module is imported; its record type and
+numpy layouts are built the first time they are used, which keeps the import
+(and so the decoders' start-up) short.  Decoding uses
+unpack_from/iter_unpack on a memoryview, so no intermediate slices are made.
+Both datumserial.py and tsipdecode.py decode through REPORTS; adding a packet
+type is one entry in the table at the bottom.
+
+Each report also gets a record type, a named tuple with its field names, and
+decode_packet() turns a deframed packet into one of those records without
+formatting anything.  Printing is left to whoever consumes the records.
+"""
+import struct
+from collections import namedtuple
+from functools import cached_property
+
+# numpy type of each struct code, for decoding many packets at once
+NUMPY_TYPES = {'B': 'u1', 'b': 'i1', 'H': '>u2', 'h': '>i2', 'I': '>u4', 'i': '>i4',
+               'Q': '>u8', 'q': '>i8', 'f': '>f4', 'd': '>f8'}
+
+# Packets decode_packet() has no layout for, or whose data is too short
+UnknownPacket = namedtuple('UnknownPacket', 'packet_id data')
+MalformedPacket = namedtuple('MalformedPacket', 'packet_id data error')
+
+
+class Report:
+    """Layout of one report packet: fixed fields, optional tail and repeated group.
+
+    fields are always present.  optional fields follow them and are decoded only
+    when the packet is long enough, otherwise they read as None.  group is a
+    record repeated after the fixed part, given as (field, entry name, layout):
+    count names the field holding the number of entries, or with count=None the
+    group repeats to the end of the data.  A field named None is a pad byte ('x').
+
+    columns and group_columns are the same layouts as numpy dtype specs
+    (names/formats/offsets, pad bytes skipped) for batch decoding.
+
+    record is the named tuple decode() returns, called name, with the fixed and
+    optional fields followed by the group field holding a list of entry tuples.
+    """
+
+    def __init__(self, packet_id, name, title, fields, optional=(), group=None, count=None):
+        self.packet_id = packet_id
+        self.title = title
+        self.names = tuple(name for name, _ in fields if name)
+        self.header = struct.Struct('>' + ''.join(code for _, code in fields))
+        self.optional_names = tuple(name for name, _ in optional if name)
+        self.optional = struct.Struct('>' + ''.join(code for _, code in optional)) if optional else None
+        self.group_field, self.entry_name, self.group_layout = group or (None, None, ())
+        self.group_names = tuple(name for name, _ in self.group_layout if name)
+        self.group = struct.Struct('>' + ''.join(code for _, code in self.group_layout)) if group else None
+        self.count = self.names.index(count) if count else None
+        self.min_length = self.header.size
+        self.name = name
+        self.layout = list(fields) + list(optional)
+
+    @cached_property
+    def columns(self):
+        return numpy_layout(self.layout)
+
+    @cached_property
+    def group_columns(self):
+        return numpy_layout(self.group_layout) if self.group else None
+
+    @cached_property
+    def entry(self):
+        return namedtuple(self.entry_name, self.group_names) if self.group else None
+
+    @cached_property
+    def record(self):
+        fields = self.names + self.optional_names + ((self.group_field,) if self.group else ())
+        return type(self.name, (namedtuple(self.name, fields),), {'__slots__': (), 'packet_id': self.packet_id, 'report': self})
+
+    def __repr__(self):
+        return f"Report(0x{self.packet_id:02X}, {self.title!r})"
+
+    def unpack(self, data):
+        """Decodes data (bytes, bytearray or memoryview) in place.
+
+        Returns (fields, groups): the fixed and optional values as one tuple and
+        the repeated group as a list of tuples.  Raises struct.error when data is
+        shorter than the fixed part or than the group count it announces.
+        """
+        view = memoryview(data)
+        fields = self.header.unpack_from(view, 0)
+        offset = self.header.size
+        if self.optional:
+            if len(view) >= offset + self.optional.size:
+                fields += self.optional.unpack_from(view, offset)
+                offset += self.optional.size
+            else:
+                fields += (None,) * len(self.optional_names)
+        if not self.group:
+            return fields, []
+        if self.count is None:
+            records = (len(view) - offset) // self.group.size
+        else:
+            records = fields[self.count]
+            if len(view) < offset + records * self.group.size:
+                raise struct.error(f"0x{self.packet_id:02X} needs {offset + records * self.group.size} bytes, got {len(view)}")
+        return fields, list(self.group.iter_unpack(view[offset:offset + records * self.group.size]))
+
+    def decode(self, data):
+        """Decodes data to a record; raises struct.error like unpack()."""
+        fields, groups = self.unpack(data)
+        if self.group:
+            return self.record(*fields, list(map(self.entry._make, groups)))
+        return self.record._make(fields)
+
+    def encode(self, record):
+        """Packs a record back into packet data; optional fields that are None are left off."""
+        data = self.header.pack(*record[:len(self.names)])
+        if self.optional:
+            extra = record[len(self.names):len(self.names) + len(self.optional_names)]
+            if None not in extra:
+                data += self.optional.pack(*extra)
+        if self.group:
+            data += b''.join(self.group.pack(*entry) for entry in record[-1])
+        return data
+
+
+def encode(record):
+    """Packet data of a record, the inverse of decode_packet() (ID byte not included)."""
+    if isinstance(record, (MalformedPacket, UnknownPacket)):
+        return record.data
+    return record.report.encode(record)
+
+
+def numpy_layout(fields):
+    """numpy dtype spec of a big-endian field list; numpy itself is not needed here."""
+    names, formats, offsets = [], [], []
+    offset = 0
+    for name, code in fields:
+        if name:
+            names.append(name)
+            formats.append('S' + code[:-1] if code.endswith('s') else NUMPY_TYPES[code])
+            offsets.append(offset)
+        offset += struct.calcsize('>' + code)
+    return {'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': offset}
+
+
+def report(packet_id, name, title, fields, **layout):
+    """Adds a report to REPORTS and returns it."""
+    REPORTS[packet_id] = Report(packet_id, name, title, fields, **layout)
+    return REPORTS[packet_id]
+
+
+def parse_ids(text):
+    """'0x42,0x47' -> {0x42, 0x47}; the argparse type of --ids options."""
+    return {int(item, 0) for item in text.split(',') if item.strip()}
+
+
+def id_filter(only=None, exclude=None):
+    """256-byte table with 1 for every packet ID to keep, from --only/--exclude ID sets.
+
+    None when everything is kept, so deframers can skip the lookup.
+    """
+    if only is None and not exclude:
+        return None
+    exclude = exclude or ()
+    return bytes((only is None or packet_id in only) and packet_id not in exclude for packet_id in range(256))
+
+
+def skipped_summary(skipped):
+    """'0x46=10, 0x4B=10' for per-ID counts of frames a filter skipped (any 256-long sequence)."""
+    return ', '.join(f"0x{packet_id:02X}={int(count)}" for packet_id, count in enumerate(skipped) if count)
+
+
+def decode_packet(packet):
+    """Decodes one deframed packet (ID byte followed by unstuffed data).
+
+    Always returns a record: the report's own type, MalformedPacket when the data
+    is shorter than the layout, or UnknownPacket for IDs not in REPORTS.
+    """
+    packet_id = packet[0]
+    data = memoryview(packet)[1:]
+    report = REPORTS.get(packet_id)
+    if report is None:
+        return UnknownPacket(packet_id, bytes(data))
+    try:
+        return report.decode(data)
+    except struct.error as e:
+        if len(data) < report.min_length:
+            e = f"need {report.min_length} bytes, got {len(data)}"
+        return MalformedPacket(packet_id, bytes(data), str(e))
+
+
+REPORTS = {}
+
+report(0x40, 'AlmanacData', 'Almanac Data', [], group=('almanacs', 'Almanac', [
+    ('prn', 'B'), ('gps_week', 'H'), ('sv_health', 'B'), ('eccentricity', 'H'),
+    ('ref_time', 'H'), ('inclination', 'H'), ('rate_of_ra', 'f'),
+    ('semi_major_axis_root', 'f'), ('omega', 'f'), ('asc_node_longitude', 'f'),
+    ('mean_anomaly', 'f'), ('af0', 'f'), (None, 'x')]))
+report(0x41, 'GPSTime', 'GPS Time', [('time_of_week', 'f'), ('gps_week', 'H'), ('utc_offset', 'f')])
+report(0x42, 'PositionECEF', 'Single-Precision XYZ ECEF Position Fix',
+       [('x', 'f'), ('y', 'f'), ('z', 'f')], optional=[('time_of_fix', 'f')])
+report(0x43, 'VelocityECEF', 'Velocity Fix (XYZ ECEF)',
+       [('x_velocity', 'f'), ('y_velocity', 'f'), ('z_velocity', 'f')],
+       optional=[('bias_rate', 'f'), ('time_of_fix', 'f')])
+report(0x44, 'SatelliteSelection', 'Non-Overdetermined Satellite Selection Report', [
+    ('mode', 'B'), ('sv1', 'B'), ('sv2', 'B'), ('sv3', 'B'), ('sv4', 'B'),
+    ('pdop', 'f'), ('hdop', 'f'), ('vdop', 'f'), ('tdop', 'f')])
+report(0x45, 'FirmwareInfo', 'Receiver Firmware Information', [
+    ('nav_major', 'B'), ('nav_minor', 'B'), ('nav_month', 'B'), ('nav_day', 'B'), ('nav_year', 'B'),
+    ('sig_major', 'B'), ('sig_minor', 'B'), ('sig_month', 'B'), ('sig_day', 'B'), ('sig_year', 'B')])
+report(0x46, 'ReceiverHealth', 'Health of Receiver', [('status_code', 'B'), ('error_code', 'B')])
+report(0x47, 'SignalLevels', 'Signal Levels', [('count', 'B')],
+       group=('signals', 'SignalLevel', [('prn', 'B'), ('signal_level', 'f')]), count='count')
+report(0x48, 'SystemMessage', 'GPS System Message', [('message', '22s')])
+report(0x49, 'AlmanacHealth', 'Almanac Health Page', [('health', '32s')])
+report(0x4A, 'PositionLLA', 'Single Precision LLA Position Fix', [
+    ('latitude', 'f'), ('longitude', 'f'), ('altitude', 'f'), ('clock_bias', 'f'), ('time_of_fix', 'f')])
+report(0x4B, 'MachineStatus', 'Machine/Code ID and Additional Status', [
+    ('machine_id', 'B'), ('status_flags_1', 'B'), ('status_flags_2', 'B')])
+report(0x54, 'SatelliteBias', 'One Satellite Bias and Bias Rate', [('bias', 'f'), ('bias_rate', 'f'), ('time_of_fix', 'f')])
+report(0x55, 'Throttle', 'Throttle Percentage', [('throttle', 'B')])
+report(0x5B, 'EphemerisStatus', 'Satellite Ephemeris Status', [
+    ('sv_prn', 'B'), ('collection_time', 'f'), ('health', 'B'), ('iode', 'B'),
+    ('toe', 'f'), ('fit_interval_flag', 'B'), ('ura', 'f')])
+report(0x70, 'FilterConfig', 'Navigation Filter Configuration', [('nav1', 'H'), ('nav2', 'H')])
+report(0x82, 'OutputRateControl', 'Output Rate Control', [('rate_control1', 'B'), ('rate_control2', 'B')])
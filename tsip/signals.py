@@ -0,0 +1,207 @@
+"""Rolling per-satellite signal level statistics from 0x47 reports, in bounded memory.
+
+SignalStats takes decoded records as they arrive and keeps, for each sliding
+window (1 minute, 1 hour and 24 hours by default), a ring of BUCKETS time
+buckets.  A bucket holds per PRN the sample count, sum, sum of squares, min,
+max and dropouts of its slice of the window.  A 0x47 report only updates the
+accumulators of the current tick (the narrowest bucket width), which are
+merged into each window's bucket when the tick ends, so adding a report is a
+constant amount of work and the memory is the same after a minute or a year.
+snapshot() merges the live buckets of each window into mean, min, max and
+standard deviation; the oldest bucket leaves a window whole, so a window
+covers between (BUCKETS - 1) and BUCKETS buckets' worth of time.
+
+A dropout is a PRN the previous 0x47 reported with a positive signal level
+that is missing from the next one, or reported at 0 or below; such levels
+are not counted as samples.
+
+The clock is the wall clock for live data, or with clock='gps' the GPS time
+of the latest valid 0x41 report, so a replayed capture gives the same
+statistics as it did live.  A 0x41 moves that clock when it is at most
+CONFIRM_SECONDS past it; any other time (the first one, or a jump) is only
+taken after JUMP_REPORTS reports in a row, each at most CONFIRM_SECONDS past
+the one before, so a corrupted report cannot throw the windows days ahead.
+0x47 reports before the clock is set are counted in untimed and otherwise
+ignored.
+"""
+import math
+import time
+
+WINDOWS = (60, 3600, 86400)
+BUCKETS = 60
+WEEK_SECONDS = 604800
+CONFIRM_SECONDS = 10  # most a 0x41 may follow the clock (or the 0x41 before) by
+JUMP_REPORTS = 10  # consecutive 0x41 reports that set the GPS clock to a new time
+
+# Per-PRN accumulator fields
+COUNT, TOTAL, SQUARES, LOW, HIGH, DROPOUTS = range(6)
+
+
+def window_name(seconds):
+    """'1m', '1h', '24h' or '90s' for a window length."""
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds:g}s"
+
+
+def merge(into, part):
+    """Adds the {PRN: [count, total, squares, low, high, dropouts]} part into into."""
+    for prn, row in part.items():
+        mine = into.get(prn)
+        if mine is None:
+            into[prn] = row[:]
+        else:
+            mine[COUNT] += row[COUNT]
+            mine[TOTAL] += row[TOTAL]
+            mine[SQUARES] += row[SQUARES]
+            mine[LOW] = min(mine[LOW], row[LOW])
+            mine[HIGH] = max(mine[HIGH], row[HIGH])
+            mine[DROPOUTS] += row[DROPOUTS]
+
+
+class Window:
+    """Ring of time buckets covering one window length, each {PRN: accumulator}."""
+
+    def __init__(self, seconds, buckets=BUCKETS):
+        self.seconds = seconds
+        self.buckets = buckets
+        self.width = seconds / buckets
+        self.stamp = [-1] * buckets  # bucket number each slot holds
+        self.ring = [{} for _ in range(buckets)]
+
+    def add(self, now, part):
+        """Merges the accumulators of a slice of time starting at now into its bucket."""
+        number = int(now // self.width)
+        slot = number % self.buckets
+        if self.stamp[slot] != number:
+            if self.stamp[slot] > number:  # older than the ring reaches back
+                return
+            self.stamp[slot] = number
+            self.ring[slot] = {}
+        merge(self.ring[slot], part)
+
+    def merged(self, now):
+        """{PRN: stats dict} over the buckets still inside the window at time now."""
+        number = int(now // self.width)
+        total = {}
+        for stamp, bucket in zip(self.stamp, self.ring):
+            if number - self.buckets < stamp <= number:
+                merge(total, bucket)
+        out = {}
+        for prn, (n, level_sum, squares, low, high, dropouts) in sorted(total.items()):
+            mean = level_sum / n if n else None
+            out[prn] = {'samples': n, 'mean': mean,
+                        'min': low if n else None, 'max': high if n else None,
+                        'stddev': math.sqrt(max(squares / n - mean * mean, 0.0)) if n else None,
+                        'dropouts': dropouts}
+        return out
+
+
+class SignalStats:
+    """Sliding-window signal statistics per PRN; see the module docstring."""
+
+    def __init__(self, windows=WINDOWS, buckets=BUCKETS, clock='wall'):
+        if clock not in ('wall', 'gps'):
+            raise ValueError(f"clock must be 'wall' or 'gps', got {clock!r}")
+        self.windows = [Window(seconds, buckets) for seconds in windows]
+        self.tick = min(window.width for window in self.windows)
+        self.clock = clock
+        self.now = None  # time of the latest sample (or 0x41, for the GPS clock)
+        self._reported = None  # GPS time of the last 0x41, taken or not
+        self._streak = 0  # 0x41 reports in a row that followed each other in time
+        self.pending = {}  # accumulators of the current tick, not yet in the windows
+        self.pending_number = None
+        self.tracking = set()  # PRNs with a positive level in the last 0x47
+        self.samples = 0
+        self.untimed = 0
+
+    def flush(self):
+        """Hands the current tick's accumulators to every window."""
+        if self.pending:
+            for window in self.windows:
+                window.add(self.pending_number * self.tick, self.pending)
+            self.pending = {}
+
+    def update(self, record, now=None):
+        """Takes one decoded record; 0x47 adds samples and 0x41 moves the GPS clock.
+
+        now overrides the clock (seconds).  Returns True when samples were added.
+        """
+        packet_id = getattr(record, 'packet_id', None)
+        if getattr(record, 'report', None) is None:
+            return False
+        if packet_id == 0x41 and self.clock == 'gps' and now is None:
+            if 0 <= record.time_of_week < WEEK_SECONDS:
+                reported = record.gps_week * WEEK_SECONDS + record.time_of_week
+                if self._reported is not None and 0 <= reported - self._reported <= CONFIRM_SECONDS:
+                    self._streak += 1
+                else:
+                    self._streak = 1
+                self._reported = reported
+                if (self.now is not None and 0 <= reported - self.now <= CONFIRM_SECONDS
+                        or self._streak >= JUMP_REPORTS):
+                    self.now = reported
+            return False
+        if packet_id != 0x47:
+            return False
+        if now is None:
+            now = time.time() if self.clock == 'wall' else self.now
+            if now is None:
+                self.untimed += 1
+                return False
+        self.now = now
+        number = int(now // self.tick)
+        if number != self.pending_number:
+            self.flush()
+            self.pending_number = number
+        pending = self.pending
+        heard = set()
+        for prn, level in record.signals:
+            if not level > 0:  # not tracked (NaN too)
+                continue
+            heard.add(prn)
+            row = pending.get(prn)
+            if row is None:
+                pending[prn] = [1, level, level * level, level, level, 0]
+            else:
+                row[COUNT] += 1
+                row[TOTAL] += level
+                row[SQUARES] += level * level
+                if level < row[LOW]:
+                    row[LOW] = level
+                if level > row[HIGH]:
+                    row[HIGH] = level
+        for prn in self.tracking - heard:
+            row = pending.get(prn)
+            if row is None:
+                pending[prn] = [0, 0.0, 0.0, math.inf, -math.inf, 1]
+            else:
+                row[DROPOUTS] += 1
+        self.tracking = heard
+        self.samples += len(heard)
+        return True
+
+    def snapshot(self, now=None):
+        """{window name: {PRN: samples, mean, min, max, stddev, dropouts}}, JSON-ready.
+
+        now defaults to the time of the latest report seen.
+        """
+        self.flush()
+        now = self.now if now is None else now
+        if now is None:
+            return {window_name(window.seconds): {} for window in self.windows}
+        return {window_name(window.seconds): window.merged(now) for window in self.windows}
+
+    def lines(self, now=None):
+        """snapshot() as a console table, one row per window and PRN."""
+        out = [f"{'window':>6} {'PRN':>4} {'samples':>8} {'mean':>7} {'min':>7} {'max':>7} {'stddev':>7} {'dropouts':>8}"]
+        for name, prns in self.snapshot(now).items():
+            for prn, s in sorted(prns.items()):
+                if s['samples']:
+                    out.append(f"{name:>6} {prn:>4} {s['samples']:>8} {s['mean']:>7.2f} {s['min']:>7.2f} "
+                               f"{s['max']:>7.2f} {s['stddev']:>7.2f} {s['dropouts']:>8}")
+                else:
+                    out.append(f"{name:>6} {prn:>4} {0:>8} {'-':>7} {'-':>7} {'-':>7} {'-':>7} {s['dropouts']:>8}")
+        return out
@@ -0,0 +1,110 @@
+"""Receiver state: the latest value of every report, and what each packet changed.
+
+ReceiverState.update() takes the records decode_packet() returns, in stream
+order, and keeps the newest one per report type (per satellite for 0x5B).
+Repeated groups are kept per PRN: the 0x47 signal levels are the current set,
+so a PRN missing from the next 0x47 is gone, while 0x40 almanac entries add to
+what came before.  update() returns only the fields that differ from the
+previous report of the same kind, so the receiver's steady once-a-second
+0x46/0x4B/0x49 blocks reduce to nothing unless something moved.
+
+snapshot() gives the whole state as plain, JSON-ready dicts.  Each update is
+a dict lookup and a compare per field, however long the run.
+"""
+from .output import plain, plain_changes, record_fields
+
+# Reports kept once per satellite, by this field
+KEYED = {0x5B: 'sv_prn'}
+# Reports whose group is the whole current set; other groups accumulate
+FULL_GROUPS = {0x47}
+
+
+def same(a, b):
+    """a == b, except that NaN equals NaN."""
+    return a == b or (a != a and b != b)
+
+
+def describe_changes(changes):
+    """'status_code=0, signals: 5=12.5 9=gone' for the console."""
+    def text(value):
+        return f"{value:g}" if isinstance(value, float) else str(value)
+
+    parts = []
+    for name, value in plain_changes(changes).items():
+        if isinstance(value, dict):
+            entries = ' '.join(f"{key}=gone" if entry is None else f"{key}=" + '/'.join(map(text, entry.values()))
+                               for key, entry in value.items())
+            parts.append(f"{name}: {entries}")
+        else:
+            parts.append(f"{name}={text(value)}")
+    return ', '.join(parts)
+
+
+class ReceiverState:
+    """Latest report values of one receiver; see the module docstring."""
+
+    def __init__(self):
+        self.latest = {}  # (packet ID, key or None) -> record
+        self.groups = {}  # (packet ID, key or None) -> {PRN: group entry}
+        self.packets = 0
+        self.changed = 0  # packets that changed anything
+
+    def update(self, record):
+        """Takes one decoded record; returns (first, changes).
+
+        first is True the first time this report (or satellite) is seen, and for
+        MalformedPacket/UnknownPacket, which are not kept.  changes maps each
+        field that differs from last time to its new value; a group field maps
+        PRN to the new entry, or None for a PRN that dropped out.  Keyed reports
+        always carry their key field when anything changed.
+        """
+        self.packets += 1
+        report = getattr(record, 'report', None)
+        if report is None:
+            return True, {}
+        packet_id = record.packet_id
+        key_field = KEYED.get(packet_id)
+        slot = (packet_id, getattr(record, key_field) if key_field else None)
+        previous = self.latest.get(slot)
+        self.latest[slot] = record
+        first = previous is None
+        names = record._fields[:-1] if report.group else record._fields
+        changes = {name: record[k] for k, name in enumerate(names) if first or not same(record[k], previous[k])}
+        if report.group:
+            entries = self.groups.setdefault(slot, {})
+            fresh = {entry[0]: entry for entry in record[-1]}
+            changed = {prn: entry for prn, entry in fresh.items()
+                       if prn not in entries or not all(map(same, entry, entries[prn]))}
+            if packet_id in FULL_GROUPS:
+                changed.update((prn, None) for prn in entries.keys() - fresh.keys())
+                self.groups[slot] = fresh
+            else:
+                entries.update(fresh)
+            if changed:
+                changes[record._fields[-1]] = changed
+        if changes:
+            self.changed += 1
+            if key_field and key_field not in changes:
+                changes = {key_field: getattr(record, key_field), **changes}
+        return first, changes
+
+    def get(self, packet_id, key=None):
+        """Latest record of a report type (of one satellite for keyed reports), or None."""
+        return self.latest.get((packet_id, key))
+
+    def snapshot(self):
+        """Everything known, as {record type: fields} (keyed reports: {key: fields}).
+
+        Groups are given as {PRN: entry fields}; packets counts the records seen.
+        """
+        out = {'packets': self.packets}
+        for slot, record in sorted(self.latest.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+            fields = record_fields(record)
+            if record.report.group:
+                fields[record._fields[-1]] = {prn: {name: plain(value) for name, value in zip(entry._fields[1:], entry[1:])}
+                                              for prn, entry in sorted(self.groups[slot].items())}
+            if slot[1] is None:
+                out[type(record).__name__] = fields
+            else:
+                out.setdefault(type(record).__name__, {})[slot[1]] = fields
+        return out
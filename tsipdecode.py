@@ -1,160 +1,675 @@
-import numpy as np
-import pandas as pd
 import struct
 import sys
+import os
+import argparse
+from functools import partial
+from itertools import repeat
+from tsip.frame import WINDOW_BYTES, find_frames, find_frames_plain, scan_windows, shard_boundaries
+from tsip.capture import SUFFIXES, compression_of, open_capture, stream_windows
+from tsip.index import build_index, index_path, load_index, open_index, query, read_packets
+from tsip.schema import REPORTS, id_filter, parse_ids, skipped_summary
 #filename = 'tsip10.bin'   #holder for test file
+
+# Constants for TSIP framing
+DLE = 0x10  # Data Link Escape
+ETX = 0x03  # End of Text
+DLE_BYTE = bytes([DLE])
+DLE_PAIR = bytes([DLE, DLE])
+# Largest capture decoded without NumPy (see scan_plain())
+PLAIN_BYTES = 1 << 18
+
+
+# Precompiled report layouts shared with datumserial.py (tsip/schema.py)
+BIAS_54 = REPORTS[0x54].header
+FIRMWARE_45 = REPORTS[0x45].header
+HEALTH_46 = REPORTS[0x46].header
+MACHINE_4B = REPORTS[0x4B].header
+SELECTION_44 = REPORTS[0x44].header
+TIME_41 = REPORTS[0x41].header
+EPHEMERIS_5B = REPORTS[0x5B].header
+# The original decoder read the 0x41 UTC offset from byte 7, one byte late; --legacy keeps that
+LEGACY_41 = struct.Struct('>fHxf')
+# and the 0x44 PDOP, HDOP and VDOP from bytes 4, 8 and 12, one byte early (TDOP from 17 is right)
+LEGACY_44 = struct.Struct('>4xfffxf')
+# This receiver's 0x70 payload does not match the documented layout, dump it raw
+RAW_70 = struct.Struct('>qh')
+
+STATUS_46 = {
+    0x00: 'Doing position fixes',
+    0x01: 'Do not have GPS time yet',
+    0x02: 'Reserved:set to zero',
+    0x03: 'PDOP is too high',
+    0x08: 'No usable satellites',
+    0x09: 'Only 1 usable satellite',
+    0x10: 'Only 2 usable satellites',
+    0x11: 'Only 3 usable satellites',
+    0x12: 'The chosen satellite is unusable',
+}
+
+MODE_44 = {
+    0x01: 'Auto 1-satellite, 0D',
+    0x03: 'Auto 3-satellite, 2D',
+    0x04: 'Auto 4-satellite, 3D',
+    0x11: 'Manual 1-satellite, 0D',
+    0x13: 'Manual 3-satellite, 2D',
+    0x14: 'Manual 4-satellite, 3D',
+}
+
+def format_packet_54(index, data, offset):
+    #Report Packet 0x54
+    #One Satellite Bias and Bias Rate Report
+    satmeters, satmeterssecond, seconds = BIAS_54.unpack_from(data, offset)
+    return '0x54, %x ,Bias,%s ,Bias Rate,%s ,GPS(Seconds),%s' % (index, satmeters, satmeterssecond, seconds)
+
+def format_packet_45(index, data, offset):
+    #Report Packet 0x45
+    #Receiver Firmware Information Report
+    return '0x45, %x ,NAVProc %d . %d Date %d / %d / %d ,SIG Proc %d . %d Date %d / %d / %d' % ((index,) + FIRMWARE_45.unpack_from(data, offset))
+
+def format_packet_46(index, data, offset):
+    #Report Packet 0x46
+    #Health of Receiver Report
+    statuscode, errorcode = HEALTH_46.unpack_from(data, offset)
+    status = STATUS_46.get(statuscode)
+    status = 'statuscode: %#x %s' % (statuscode, status) if status else ''
+    return '0x46, %x ,%s errorcode: %#x' % (index, status, errorcode)
+
+def format_packet_4B(index, data, offset):
+    #Report Packet 0x4B
+    #Machine / Code ID and Additional Status Report
+    #Byte
+    # 0 Machine ID     BYTE varies Machine ID for receiver. Values are listed in the product-specific appendices.
+    # 1 Status Flags 1 Byte 1 Bit Encoding, Status 1 Flag
+    # 2 Status Flags 2 Byte 2 Bit Encoding, Status 2 Flag
+    return '0x4B, %x , Machine ID: %#x ,statusflag1: %#x ,statusflag2: %#x' % ((index,) + MACHINE_4B.unpack_from(data, offset))
+
+def format_packet_44(index, data, offset):
+    #Report Packet 0x44
+    #Non-Overdetermined Satellite Selection Report
+    #Table 3-10
+    # Byte #  Item Type   Value/Units  Meaning
+    # 0   Mode     BYTE   flag Non-overdetermined mode:
+    # 1-4 4SV#s    BYTE
+    # 5-8 PDOP     SINGLE PDOP Precision Dilution of Precision
+    # 9-12HDOP     SINGLE HDOP Horizontal Dilution of Precision
+    # 13-16VDOP    SINGLE VDOP Vertical Dilution of Precision
+    # 17-20TDOP    SINGLE TDOP Time Dilution of Precision
+    mode, SV1, SV2, SV3, SV4, PDOP, HDOP, VDOP, TDOP = SELECTION_44.unpack_from(data, offset)
+    description = MODE_44.get(mode)
+    mode = ' Mode %#x ,%s' % (mode, description) if description else ''
+    return '0x44, %x ,%s,SV1: %d ,SV2: %d ,SV3: %d ,SV4: %d,PDOP: %s ,HDOP:%s ,VDOP:%s ,TDOP:%s' % (index, mode, SV1, SV2, SV3, SV4, PDOP, HDOP, VDOP, TDOP)
+
+def format_packet_41(index, data, offset):
+    #Table 3-6
+    #GPS Time
+    #Byte #ItemTypeValue/UnitsMeaning
+    #0-3TimeSINGLEsecondsGPS time of week
+    #4-5WeekINTEGERweeksGPS week number
+    #6-9OffsetSINGLEsecondsUTC/GPS time offset
+    seconds, week, utcoffset = TIME_41.unpack_from(data, offset)
+    #GPS Week mod1024 offset
+    week = week % 1024
+    return '0x41, %x , Seconds,%s ,GPSWeek,%d ,Offset_Sec:,%s' % (index, seconds, week, utcoffset)
+
+def format_legacy_41(index, data, offset):
+    """format_packet_41() with the original decoder's misplaced UTC offset, for --legacy."""
+    seconds, week, utcoffset = LEGACY_41.unpack_from(data, offset)
+    return '0x41, %x , Seconds,%s ,GPSWeek,%d ,Offset_Sec:,%s' % (index, seconds, week % 1024, utcoffset)
+
+def format_legacy_44(index, data, offset):
+    """format_packet_44() with the original decoder's misplaced DOPs, for --legacy."""
+    mode, SV1, SV2, SV3, SV4, _, _, _, _ = SELECTION_44.unpack_from(data, offset)
+    PDOP, HDOP, VDOP, TDOP = LEGACY_44.unpack_from(data, offset)
+    description = MODE_44.get(mode)
+    mode = ' Mode %#x ,%s' % (mode, description) if description else ''
+    return '0x44, %x ,%s,SV1: %d ,SV2: %d ,SV3: %d ,SV4: %d,PDOP: %s ,HDOP:%s ,VDOP:%s ,TDOP:%s' % (index, mode, SV1, SV2, SV3, SV4, PDOP, HDOP, VDOP, TDOP)
+
+def format_packet_5B(index, data, offset):
+    #Report Packet 0x5B
+    #Satellite Ephemeris Status Report
+    return '0x5B, %x , SVPRN: %d CollectionTime:%s ,health: %#x IODE: %#x toe:%s FITFLAG: %#x URA:%s' % ((index,) + EPHEMERIS_5B.unpack_from(data, offset))
+
+def format_packet_70(index, data, offset):
+    #Report 0x70 does not match Reference C doc
+    whatever, whatever1 = RAW_70.unpack_from(data, offset)
+    return '0x70, %x ,unknown0x70 %s %s' % (index, hex(whatever), hex(whatever1))
+
+# Report formatters keyed by packet ID, with the payload bytes each one reads
+FORMATTERS = {
+    0x54: (format_packet_54, REPORTS[0x54].min_length),
+    0x45: (format_packet_45, REPORTS[0x45].min_length),
+    0x46: (format_packet_46, REPORTS[0x46].min_length),
+    0x4B: (format_packet_4B, REPORTS[0x4B].min_length),
+    0x44: (format_packet_44, REPORTS[0x44].min_length),
+    0x41: (format_packet_41, REPORTS[0x41].min_length),
+    0x5B: (format_packet_5B, REPORTS[0x5B].min_length),
+    0x70: (format_packet_70, RAW_70.size),
+}
+
+# The same for --legacy, byte for byte the original decoder's output
+LEGACY_FORMATTERS = {**FORMATTERS, 0x41: (format_legacy_41, LEGACY_41.size), 0x44: (format_legacy_44, LEGACY_44.size)}
+
+# Lines collected before each write to stdout
+BATCH_LINES = 4096
+
+def scan_legacy(data, base=0):
+    """Original byte-by-byte walk: matches every <DLE><ID> pair, stuffed or not."""
+    size = data.size
+    for index in range(size-1):
+        idata = struct.unpack('>H', data[index+0:index+2])
+        if idata[0] >> 8 != DLE:
+            continue
+        formatter = LEGACY_FORMATTERS.get(idata[0] & 0xFF)
+        if formatter:
+            print(formatter[0](base + index, data, index + 2))
+
+def write_lines(lines):
+    """Writes formatted lines to stdout in batches instead of one print() each."""
+    for start in range(0, len(lines), BATCH_LINES):
+        sys.stdout.write('\n'.join(lines[start:start + BATCH_LINES]) + '\n')
+
+def unstuff(data):
+    """Drops the second DLE of every stuffed pair, like bytes.replace() on each run.
+
+    Returns the packed array and a table mapping original offsets to packed ones.
+    """
+    import numpy as np
+    is_dle = data == DLE
+    position = np.arange(data.size)
+    head = np.where(is_dle & ~np.concatenate(([False], is_dle[:-1])), position, 0)
+    keep = ~(is_dle & ((position - np.maximum.accumulate(head)) & 1).astype(bool))
+    return data[keep], np.concatenate(([0], np.cumsum(keep)))
+
+def kept_frames(data, synced=True, keep=None, skipped=None):
+    """find_frames() with payloads un-stuffed: (index, ids, packed, begin, length, consumed).
+
+    begin and length locate each payload in packed.  keep is a
+    tsip.schema.id_filter() table; frames it rules out are dropped by their ID
+    byte before any payload is touched, counted per ID into the skipped array
+    when one is given, and only the kept payloads are copied and un-stuffed.
+    """
+    import numpy as np
+    index, ids, begin, end, consumed = find_frames(data, synced)
+    if keep is None:
+        packed, moved = unstuff(data)
+        return index, ids, packed, moved[begin], moved[end] - moved[begin], consumed
+    wanted = np.frombuffer(keep, np.uint8).astype(bool)[ids]
+    if skipped is not None:
+        skipped += np.bincount(ids[~wanted], minlength=256)
+    index, ids, begin, end = index[wanted], ids[wanted], begin[wanted], end[wanted]
+    # Kept payloads back to back, each followed by a 0 so DLE runs never join
+    span = end - begin + 1
+    first = np.cumsum(span) - span
+    picked = data[np.repeat(begin - first, span) + np.arange(span.sum())]
+    picked[first + span - 1] = 0
+    packed, moved = unstuff(picked)
+    return index, ids, packed, moved[first], moved[first + span - 1] - moved[first], consumed
+
+def format_frames(data, base=0, synced=True, keep=None, skipped=None):
+    """Vectorized scan: decodes only properly framed packets, payloads un-stuffed.
+
+    Payloads of each report type are gathered into one contiguous block and
+    formatted from it; lines are put back in stream order.  base is the file
+    offset of data[0]; keep and skipped filter by packet ID (kept_frames()).
+    Returns (lines, bytes consumed).
+    """
+    import numpy as np
+    index, ids, packed, begin, length, consumed = kept_frames(data, synced, keep, skipped)
+    order = []
+    lines = []
+    for packet_id, (formatter, size) in FORMATTERS.items():
+        chosen = np.flatnonzero((ids == packet_id) & (length >= size))
+        rows = packed[begin[chosen, None] + np.arange(size)].tobytes()
+        lines.extend(map(formatter, (index[chosen] + base).tolist(), repeat(rows), range(0, len(rows), size)))
+        order.append(index[chosen])
+    order = np.argsort(np.concatenate(order), kind='stable')
+    return [lines[k] for k in order.tolist()], consumed
+
+def scan_frames(data, base=0, synced=True, keep=None, skipped=None):
+    """format_frames() written straight to stdout; returns the bytes consumed."""
+    lines, consumed = format_frames(data, base, synced, keep, skipped)
+    write_lines(lines)
+    return consumed
+
+def format_frames_plain(data, base=0, synced=True, keep=None, skipped=None):
+    """format_frames() without NumPy (tsip.frame.find_frames_plain()), for small captures.
+
+    data is bytes; skipped is a list.  Returns (lines, bytes consumed).
+    """
+    lines = []
+    index, ids, begin, end, consumed = find_frames_plain(data, synced)
+    for offset, packet_id, first, last in zip(index, ids, begin, end):
+        if keep is not None and not keep[packet_id]:
+            if skipped is not None:
+                skipped[packet_id] += 1
+            continue
+        formatter = FORMATTERS.get(packet_id)
+        if formatter:
+            payload = data[first:last].replace(DLE_PAIR, DLE_BYTE)
+            if len(payload) >= formatter[1]:
+                lines.append(formatter[0](offset + base, payload, 0))
+    return lines, consumed
+
+def scan_plain(filename, start=0, stop=None, keep=None, skipped=None):
+    """Decodes bytes [start, stop) of a small capture in one piece with format_frames_plain()."""
+    with open(filename, 'rb') as capture:
+        capture.seek(start)
+        data = capture.read(-1 if stop is None else max(stop - start, 0))
+    write_lines(format_frames_plain(data, start, start == 0, keep, skipped)[0])
+
+def native(dtype):
+    """Native-endian copy of a structured dtype spec, with pads dropped."""
+    import numpy as np
+    dtype = np.dtype(dtype)
+    return [(name, dtype.fields[name][0].newbyteorder('=')) for name in dtype.names]
+
+def gather(packed, begin, size):
+    """Copies size bytes from each begin offset into one (n, size) block.
+
+    Bytes past the end of packed read as 0; callers mask rows that were short.
+    """
+    import numpy as np
+    cells = begin[:, None] + np.arange(size)
+    return np.where(cells < packed.size, packed[np.minimum(cells, packed.size - 1)], 0).astype(np.uint8)
+
+def decode_report(report, packed, index, begin, length):
+    """Decodes every packet of one report type at once into a structured array.
+
+    Each row starts with offset, the packet's file offset.  Optional fields of
+    packets too short to hold them read as NaN.  A report with a repeated group
+    is flattened to one row per group entry (0x47 gives offset, prn,
+    signal_level), the offset telling which packet, i.e. epoch, it came from;
+    packets shorter than their announced count are dropped.
+    """
+    import numpy as np
+    dtype = np.dtype(report.columns)
+    if dtype.itemsize:
+        fields = gather(packed, begin, dtype.itemsize).view(dtype).ravel()
+    else:  # nothing but the group, like 0x40
+        fields = np.zeros(index.size, dtype)
+    short = length < dtype.itemsize
+    if not report.group:
+        table = np.empty(index.size, dtype=[('offset', np.int64)] + native(dtype))
+        table['offset'] = index
+        for name in dtype.names:
+            table[name] = fields[name]
+        for name in report.optional_names:
+            table[name][short] = np.nan
+        return table
+    group = np.dtype(report.group_columns)
+    start = np.where(short, report.header.size, dtype.itemsize)
+    if report.count is None:
+        count = (length - start) // group.itemsize
+    else:
+        count = fields[report.names[report.count]].astype(np.int64)
+        count[length < start + count * group.itemsize] = 0
+    packet = np.repeat(np.arange(index.size), count)
+    entry = np.arange(packet.size) - np.repeat(np.cumsum(count) - count, count)
+    entries = gather(packed, begin[packet] + start[packet] + entry * group.itemsize, group.itemsize).view(group).ravel()
+    header = [name for name in dtype.names if report.count is None or name != report.names[report.count]]
+    table = np.empty(packet.size, dtype=[('offset', np.int64)] + [f for f in native(dtype) if f[0] in header] + native(group))
+    table['offset'] = index[packet]
+    for name in header:
+        table[name] = fields[name][packet]
+    for name in group.names:
+        table[name] = entries[name]
+    return table
+
+def decode_frames(data, base=0, synced=True, keep=None, skipped=None):
+    """Columnar counterpart of scan_frames: decodes instead of formatting.
+
+    Returns ({packet ID: structured array}, bytes consumed).
+    """
+    import numpy as np
+    index, ids, packed, begin, length, consumed = kept_frames(data, synced, keep, skipped)
+    tables = {}
+    for packet_id, report in REPORTS.items():
+        chosen = np.flatnonzero((ids == packet_id) & (length >= report.min_length))
+        if chosen.size:
+            tables[packet_id] = decode_report(report, packed, index[chosen] + base, begin[chosen], length[chosen])
+    return tables, consumed
+
+def scan_file(filename, start=0, stop=None, window=WINDOW_BYTES, scan=scan_frames, synced=None):
+    """Decodes the packets in bytes [start, stop) of a capture, window by window.
+
+    See tsip.frame.scan_windows; scan(data, base, synced) defaults to printing.
+    Compressed captures (.gz, .xz, .zst) are decompressed window by window.
+    """
+    walk = stream_windows if compression_of(filename) else scan_windows
+    walk(filename, scan, start, stop, window, synced)
+
+def scan_indexed(filename, ids=None, from_tow=None, to_tow=None, start=0, stop=None, keep=None):
+    """Decodes only the frames the sidecar index selects by ID and time of week.
+
+    The index (tsip/index.py) is built on first use; afterwards only the chosen
+    frames are read from the capture.  keep is an id_filter() table on top of ids.
+    """
+    import numpy as np
+    records = query(open_index(filename), ids, from_tow, to_tow)
+    records = records[(records['offset'] >= start) & (records['offset'] < (np.inf if stop is None else stop))]
+    if keep is not None:
+        records = records[np.frombuffer(keep, np.uint8).astype(bool)[records['id']]]
+    lines = []
+    for offset, packet in read_packets(filename, records):
+        formatter = FORMATTERS.get(packet[0])
+        if formatter and len(packet) - 1 >= formatter[1]:
+            lines.append(formatter[0](offset, packet, 1))
+        if len(lines) == BATCH_LINES:
+            write_lines(lines)
+            lines = []
+    write_lines(lines)
+
+def decode_columns(filename, start=0, stop=None, window=WINDOW_BYTES, jobs=1, synced=None, keep=None, skipped=None):
+    """Decodes a capture into one structured array per report type.
+
+    Returns {packet ID: array}; see decode_report() for the columns.  With
+    jobs > 1 the capture is decoded in shards on that many processes and the
+    pieces are joined in stream order.  keep and skipped filter by packet ID
+    as in kept_frames().
+    """
+    import numpy as np
+    parts = {}
+    if jobs > 1:
+        from multiprocessing import Pool
+        with Pool(jobs) as pool:
+            for tables, shard_skipped in pool.imap(partial(columns_shard, keep=keep), shard_tasks([filename], jobs, start, stop)):
+                for packet_id, table in tables.items():
+                    parts.setdefault(packet_id, []).append(table)
+                if skipped is not None:
+                    skipped += shard_skipped
+    else:
+        def scan(data, base, synced):
+            tables, consumed = decode_frames(data, base, synced, keep, skipped)
+            for packet_id, table in tables.items():
+                parts.setdefault(packet_id, []).append(table)
+            return consumed
+        scan_file(filename, start, stop, window, scan, synced)
+    return {packet_id: np.concatenate(tables) for packet_id, tables in sorted(parts.items())}
+
+# Reports stamped with a time of fix, which convert_columns() turns into UTC
+TIME_OF_FIX = (0x42, 0x43, 0x4A, 0x54)
+HALF_WEEK = 302400
+
+def with_columns(table, columns):
+    """Copy of a structured array with (name, array) columns appended."""
+    import numpy as np
+    out = np.empty(table.size, dtype=table.dtype.descr + [(name, values.dtype) for name, values in columns])
+    for name in table.dtype.names:
+        out[name] = table[name]
+    for name, values in columns:
+        out[name] = values
+    return out
+
+def convert_columns(tables, reference_week=None):
+    """Adds derived columns to decode_columns() output, a whole capture at a time.
+
+    0x41 gets week (the full GPS week, era resolved once for the capture, see
+    tsip.geo.resolve_weeks) and utc.  Reports with a time_of_fix get utc from it
+    and the week of the latest plausible 0x41 before them (NaT before the first
+    one); 0x42 also gets WGS-84 latitude, longitude (degrees) and height (m).
+    reference_week is a full week the capture cannot be later than, by default
+    the current one.  Returns a new dict.
+    """
+    import numpy as np
+    from tsip.geo import ecef_to_lla, gps_to_utc, gps_week_at, resolve_weeks, valid_times
+    tables = dict(tables)
+    times = tables.get(0x41)
+    if times is not None:
+        valid = valid_times(times['time_of_week'], times['utc_offset'])
+        weeks = resolve_weeks(times['gps_week'], gps_week_at() if reference_week is None else reference_week, valid)
+        utc = gps_to_utc(np.where(valid, weeks, np.nan), times['time_of_week'], times['utc_offset'])
+        tables[0x41] = with_columns(times, [('week', weeks), ('utc', utc)])
+        times, weeks = times[valid], weeks[valid]
+    for packet_id in TIME_OF_FIX:
+        table = tables.get(packet_id)
+        if table is None:
+            continue
+        columns = []
+        if packet_id == 0x42:
+            columns += zip(('latitude', 'longitude', 'height'), ecef_to_lla(table['x'], table['y'], table['z']))
+        week = np.full(table.size, np.nan)
+        offset = np.zeros(table.size)
+        if times is not None and times.size:
+            latest = np.searchsorted(times['offset'], table['offset']) - 1
+            known = latest >= 0
+            week[known] = weeks[latest[known]]
+            offset[known] = times['utc_offset'][latest[known]]
+            # A fix on the other side of a week boundary from its 0x41
+            drift = table['time_of_fix'][known] - times['time_of_week'][latest[known]]
+            week[known] += (drift < -HALF_WEEK).astype(int) - (drift > HALF_WEEK).astype(int)
+        columns.append(('utc', gps_to_utc(week, table['time_of_fix'], offset)))
+        tables[packet_id] = with_columns(table, columns)
+    return tables
+
+def decode_dataframes(filename, start=0, stop=None, window=WINDOW_BYTES, jobs=1, convert=True, reference_week=None, keep=None, skipped=None):
+    """decode_columns() as pandas DataFrames, one per report type.
+
+    With convert, the columns of convert_columns() are added; the reference
+    week defaults to the capture's modification time.
+    """
+    import pandas as pd
+    from tsip.geo import gps_week_at
+    tables = decode_columns(filename, start, stop, window, jobs, keep=keep, skipped=skipped)
+    if convert:
+        reference_week = gps_week_at(os.path.getmtime(filename)) if reference_week is None else reference_week
+        tables = convert_columns(tables, reference_week)
+    return {packet_id: pd.DataFrame(table) for packet_id, table in tables.items()}
+
+# Version of what decode_columns() returns for the same bytes; part of the cache key
+COLUMNS_VERSION = 1
+
+def load_capture(filename, cache=None, convert=True, reference_week=None, jobs=1):
+    """decode_dataframes() through the on-disk cache (tsip/cache.py), for notebooks.
+
+    The first call decodes the capture and saves its tables; later calls on
+    the same bytes load them.  A capture that has grown since is decoded from
+    its last cached packet on, and the grown capture's entry replaces the old
+    one.  cache is a tsip.cache.CaptureCache, by default in ~/.cache/tsip with
+    a 2 GiB limit.  The columns of convert_columns() are computed on each
+    load, as they depend on the whole capture and the reference week.
+    """
+    import numpy as np
+    import pandas as pd
+    from tsip.cache import CaptureCache
+    from tsip.geo import gps_week_at
+    if cache is None:
+        cache = CaptureCache(version=str(COLUMNS_VERSION))
+    identity = cache.identify(filename)
+    tables = cache.load(identity.key)
+    if tables is None:
+        previous = cache.load(identity.previous) if identity.previous else None
+        if previous:
+            # Re-decode from the start of the last packet decoded; everything after it is new
+            resume = max(int(table['offset'][-1]) for table in previous.values() if table.size)
+            tables = dict(previous)
+            for packet_id, table in decode_columns(filename, resume, jobs=jobs, synced=True).items():
+                table = table[table['offset'] > resume]
+                tables[packet_id] = np.concatenate([tables[packet_id], table]) if packet_id in tables else table
+            tables = dict(sorted(tables.items()))
+        else:
+            tables = decode_columns(filename, jobs=jobs)
+        cache.store(identity.key, tables)
+        if identity.previous:
+            cache.discard(identity.previous)
+    cache.remember(filename, identity)
+    if convert:
+        reference_week = gps_week_at(os.path.getmtime(filename)) if reference_week is None else reference_week
+        tables = convert_columns(tables, reference_week)
+    return {packet_id: pd.DataFrame(table) for packet_id, table in tables.items()}
+
+def write_columns(filename, directory, start=0, stop=None, jobs=1, reference_week=None, keep=None, skipped=None):
+    """Writes one CSV per report type found in the capture, e.g. 0x47_SignalLevels.csv."""
+    os.makedirs(directory, exist_ok=True)
+    for packet_id, frame in decode_dataframes(filename, start, stop, jobs=jobs, reference_week=reference_week, keep=keep, skipped=skipped).items():
+        path = os.path.join(directory, '0x%02X_%s.csv' % (packet_id, REPORTS[packet_id].record.__name__))
+        frame.to_csv(path, index=False)
+        print('%s: %d rows' % (path, len(frame)))
+
+# Reports check_visibility() reads; the rest of the capture is skipped unread
+VISIBILITY_IDS = {0x40, 0x41, 0x42, 0x44, 0x47, 0x49, 0x4A, 0x5B}
+
+def report_visibility(filename, almanac=None, mask=5.0, start=0, stop=None, jobs=1, reference_week=None):
+    """Prints, per PRN, the elevation of what the receiver tracked (0x47) and selected (0x44).
+
+    The almanac comes from the capture's 0x40/0x49/0x5B reports, on top of the
+    store saved at the almanac path (which is then updated) when one is given.
+    """
+    import pandas as pd
+    from tsip.almanac import AlmanacStore, check_visibility
+    from tsip.geo import gps_week_at
+    store = AlmanacStore.load(almanac) if almanac else AlmanacStore()
+    tables = decode_columns(filename, start, stop, jobs=jobs, keep=id_filter(VISIBILITY_IDS))
+    store.update_tables(tables)
+    if almanac:
+        store.save(almanac)
+    reference_week = gps_week_at(os.path.getmtime(filename)) if reference_week is None else reference_week
+    found = check_visibility(convert_columns(tables, reference_week), store, mask)
+    print('%d almanacs, elevation mask %.1f degrees' % (len(store.almanacs), mask))
+    tracked = pd.DataFrame(found['tracked'])
+    selected = pd.DataFrame(found['selected'])
+    missed = pd.DataFrame(found['missed'])
+    print('%4s %8s %7s %8s %8s %7s %9s %7s %7s' % ('PRN', 'tracked', 'signal', 'min elev', 'max elev', 'below', 'selected', 'below', 'missed'))
+    for prn in sorted(set(tracked['prn']) | set(selected['prn']) | set(missed['prn'])):
+        mine = tracked[tracked['prn'] == prn]
+        chosen = selected[selected['prn'] == prn]
+        print('%4d %8d %7.1f %8.1f %8.1f %7d %9d %7d %7d' % (
+            prn, len(mine), mine['signal_level'].mean(), mine['elevation'].min(), mine['elevation'].max(),
+            (mine['elevation'] < mask).sum(), len(chosen), (chosen['elevation'] < mask).sum(),
+            (missed['prn'] == prn).sum()))
+
+# Target size of the pieces a capture is cut into for --jobs
+SHARD_BYTES = 1 << 22
+
+def shard_tasks(filenames, jobs, start=0, stop=None):
+    """(filename, start, stop, synced) for every shard of every capture, in stream order.
+
+    Each capture is cut at frame closes (tsip/frame.py) into SHARD_BYTES pieces,
+    and at least one per worker, so a shard decodes on its own exactly as it
+    would in one pass.  A compressed capture cannot be cut without reading it
+    through, so it is one shard.
+    """
+    tasks = []
+    for filename in filenames:
+        first = start if len(filenames) == 1 else 0
+        last = stop if len(filenames) == 1 else None
+        if compression_of(filename):
+            tasks.append((filename, first, last, first == 0))
+            continue
+        size = os.path.getsize(filename)
+        span = (size if last is None else min(last, size)) - first
+        cuts = shard_boundaries(filename, max(jobs, -(-span // SHARD_BYTES)), first, last)
+        tasks.extend((filename, begin, end, begin == 0 or index > 0)
+                     for index, (begin, end) in enumerate(zip(cuts, cuts[1:])))
+    return tasks
+
+def format_shard(task, keep=None):
+    """Worker: the decoded lines of one shard as a single string, and its skipped counts."""
+    import numpy as np
+    filename, start, stop, synced = task
+    lines = []
+    skipped = np.zeros(256, np.int64)
+    def scan(data, base, synced):
+        found, consumed = format_frames(data, base, synced, keep, skipped)
+        lines.extend(found)
+        return consumed
+    scan_file(filename, start, stop, scan=scan, synced=synced)
+    return ''.join(line + '\n' for line in lines), skipped
+
+def columns_shard(task, keep=None):
+    """Worker: decode_columns() of one shard, and its skipped counts."""
+    import numpy as np
+    filename, start, stop, synced = task
+    skipped = np.zeros(256, np.int64)
+    return decode_columns(filename, start, stop, synced=synced, keep=keep, skipped=skipped), skipped
+
+def scan_parallel(filenames, jobs, start=0, stop=None, keep=None, skipped=None):
+    """Decodes captures on `jobs` processes and writes the lines in stream order.
+
+    Shards are handed out in order and their output is written in the same
+    order as it comes back, so the result matches a single-process run byte for
+    byte.  With several captures each one is preceded by a '# filename' line.
+    """
+    from multiprocessing import Pool
+    tasks = shard_tasks(filenames, jobs, start, stop)
+    with Pool(jobs) as pool:
+        for (filename, begin, _, _), (text, shard_skipped) in zip(tasks, pool.imap(partial(format_shard, keep=keep), tasks)):
+            if len(filenames) > 1 and begin == 0:
+                sys.stdout.write('# %s\n' % filename)
+            sys.stdout.write(text)
+            if skipped is not None:
+                skipped += shard_skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode TSIP report packets from a Datum 9390 capture file.")
+    parser.add_argument("filename", help="Binary capture file (may be .gz, .xz or .zst compressed), or a directory of captures")
+    parser.add_argument("--legacy", action="store_true", help="Use the original byte-by-byte scan, with its exact output (also reports DLE pairs inside payloads)")
+    parser.add_argument("--start-offset", type=lambda x: int(x, 0), default=0, help="First byte of the capture to decode (default: 0)")
+    parser.add_argument("--end-offset", type=lambda x: int(x, 0), default=None, help="Stop decoding at this byte (default: end of file)")
+    parser.add_argument("--columns", metavar="DIR", help="Decode every report type into columns and write one CSV per type to DIR")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Decode on this many processes (default: 1)")
+    parser.add_argument("--ids", type=parse_ids, default=None, help="Only decode these packet IDs, e.g. 0x41,0x54 (uses the index)")
+    parser.add_argument("--only", type=parse_ids, default=None, help="Only decode frames with these packet IDs, e.g. 0x42,0x47; the rest are skipped by ID without being read")
+    parser.add_argument("--exclude", type=parse_ids, default=None, help="Skip frames with these packet IDs")
+    parser.add_argument("--from-tow", type=float, default=None, help="Only packets at or after this GPS time of week (uses the index)")
+    parser.add_argument("--to-tow", type=float, default=None, help="Only packets at or before this GPS time of week (uses the index)")
+    parser.add_argument("--build-index", action="store_true", help="(Re)build the capture's .idx sidecar index and exit")
+    parser.add_argument("--visibility", action="store_true", help="Check the satellites in 0x47 and 0x44 against their almanac elevation, per PRN")
+    parser.add_argument("--almanac", metavar="FILE", default=None, help="Almanac store for --visibility: read first if present, then saved with what the capture adds")
+    parser.add_argument("--elevation-mask", type=float, default=5.0, help="Elevation in degrees below which --visibility counts a satellite as not visible (default: 5)")
+    parser.add_argument("--reference-week", type=int, default=None, help="Full GPS week the capture is not later than, to resolve 10-bit week rollover in --columns (default: from the file's modification time)")
+    args = parser.parse_args()
+    indexed = args.ids or args.from_tow is not None or args.to_tow is not None
+    keep = id_filter(args.only, args.exclude)
+
+    if os.path.isdir(args.filename):
+        import glob
+        filenames = sorted(path for suffix in [''] + list(SUFFIXES.values())
+                           for path in glob.glob(os.path.join(args.filename, '*.bin' + suffix)))
+        if args.legacy or args.columns or args.visibility or indexed or args.build_index:
+            parser.error("--legacy, --columns, --visibility, --build-index and index queries take a single capture file")
+        if not filenames:
+            parser.error(f"no captures in {args.filename}")
+        args.filename = filenames[0]  # used alone when it is the only one
+    else:
+        filenames = [args.filename]
+        if compression_of(args.filename) and (indexed or args.build_index):
+            parser.error("--build-index and index queries need an uncompressed capture")
+    # A small capture is decoded without importing NumPy, which would take longer
+    plain = (len(filenames) == 1 and args.jobs <= 1 and not compression_of(args.filename) and
+             not (args.legacy or args.columns or args.visibility or indexed or args.build_index) and
+             min(os.path.getsize(args.filename), args.end_offset or float('inf')) - args.start_offset <= PLAIN_BYTES)
+    if plain:
+        skipped = [0] * 256
+    else:
+        import numpy as np
+        skipped = np.zeros(256, np.int64)
+
+    if plain:
+        scan_plain(args.filename, args.start_offset, args.end_offset, keep, skipped)
+    elif args.build_index:
+        records = build_index(args.filename)
+        if load_index(args.filename) is None:
+            sys.exit('%s: could not be written' % index_path(args.filename))
+        print('%s: %d packets' % (index_path(args.filename), len(records)))
+    elif indexed:
+        scan_indexed(args.filename, args.ids, args.from_tow, args.to_tow, args.start_offset, args.end_offset, keep)
+    elif args.visibility:
+        report_visibility(args.filename, args.almanac, args.elevation_mask, args.start_offset, args.end_offset, args.jobs, args.reference_week)
+    elif args.columns:
+        write_columns(args.filename, args.columns, args.start_offset, args.end_offset, args.jobs, args.reference_week, keep, skipped)
+    elif args.legacy:
+        if compression_of(args.filename):
+            with open_capture(args.filename) as capture:
+                data = np.frombuffer(capture.read(), np.uint8)[args.start_offset:args.end_offset]
+        else:
+            data = np.memmap(args.filename, dtype=np.uint8, mode='r')[args.start_offset:args.end_offset]
+        scan_legacy(data, args.start_offset)
+    elif args.jobs > 1 or len(filenames) > 1:
+        scan_parallel(filenames, max(args.jobs, 1), args.start_offset, args.end_offset, keep, skipped)
+    else:
+        scan_file(args.filename, args.start_offset, args.end_offset, scan=partial(scan_frames, keep=keep, skipped=skipped))
+    if any(skipped):
+        sys.stderr.write('Skipped frames: %s\n' % skipped_summary(skipped))
+
 if __name__ == "__main__":
-    filename = str(sys.argv[1])  # example until message line argv is working
-rdata = open(filename , 'rb')
-
-data = np.fromfile(rdata, dtype=np.uint8)
-
-
-size = data.size
-#print(size)
-
-for index in range(size-1): 
-    idata = struct.unpack('>H', data[index+0:index+2]) 
-    
-    if idata == (4180,) :
-        #Report Packet 0x54
-        #One Satellite Bias and Bias Rate Report
-
-    #if idata == struct.unpack('>H', data[0+0:0+2]) :    
-        offset=index + 2
-        satmeters= struct.unpack('>f', data[offset+0:offset+4])
-        satmeterssecond = struct.unpack('>f', data[offset+4:offset+8])
-        seconds = struct.unpack('>f', data[offset+8:offset+12])
-        #print('satmeters=%s'%satmeters,',satmeterssecond=%s'%satmeterssecond,',seconds=%s'%seconds)
-        print('0x54,','%x'%index,',Bias,%s'%satmeters,',Bias Rate,%s'%satmeterssecond,',GPS(Seconds),%s'%seconds)
-    if idata == (4165,):
-        #Report Packet 0x45
-        #Receiver Firmware Information Report
-        offset=index + 2
-        print('0x45,','%x '%index,end='')
-        NAVProcMajor = struct.unpack('>c', data[offset+0])
-        NAVProcMinor = struct.unpack('>c', data[offset+1])
-        NAVProcMonth = struct.unpack('>c', data[offset+2])
-        NAVProcDay = struct.unpack('>c', data[offset+3])
-        NAVProcYear = struct.unpack('>c', data[offset+4])
-        SIGProcMajor = struct.unpack('>c', data[offset+5])
-        SIGProcMinor = struct.unpack('>c', data[offset+6])
-        SIGProcMonth = struct.unpack('>c', data[offset+7])
-        SIGProcDay = struct.unpack('>c', data[offset+8])
-        SIGProcYear = struct.unpack('>c', data[offset+9])   
-        print(',NAVProc',ord(NAVProcMajor[0]),'.',ord(NAVProcMinor[0]),'Date',ord(NAVProcMonth[0]),'/',ord(NAVProcDay[0]),'/',ord(NAVProcYear[0]),',SIG Proc',ord(SIGProcMajor[0]),'.',ord(SIGProcMinor[0]),'Date',ord(SIGProcMonth[0]),'/',ord(SIGProcDay[0]),'/',ord(SIGProcYear[0])) 
-    
-    
-    if idata == (4166,):
-        #Report Packet 0x46
-        #Health of Receiver Report
-        offset=index + 2
-        statuscode= struct.unpack('>c', data[offset+0])
-        errorcode = struct.unpack('>c', data[offset+1])
-        print('0x46,','%x ,'%index,end='')
-        if ord(statuscode[0])==0x00:
-            print('statuscode:',hex(ord(statuscode[0])),'Doing position fixes',end='')
-        if ord(statuscode[0])==0x01:
-            print('statuscode:',hex(ord(statuscode[0])),'Do not have GPS time yet',end='')
-        if ord(statuscode[0])==0x02:
-            print('statuscode:',hex(ord(statuscode[0])),'Reserved:set to zero',end='')
-        if ord(statuscode[0])==0x03:
-            print('statuscode:',hex(ord(statuscode[0])),'PDOP is too high',end='')
-        if ord(statuscode[0])==0x08:
-            print('statuscode:',hex(ord(statuscode[0])),'No usable satellites',end='')
-        if ord(statuscode[0])==0x09:
-            print('statuscode:',hex(ord(statuscode[0])),'Only 1 usable satellite',end='')
-        if ord(statuscode[0])==0x10:
-            print('statuscode:',hex(ord(statuscode[0])),'Only 2 usable satellites',end='')    
-        if ord(statuscode[0])==0x11:
-            print('statuscode:',hex(ord(statuscode[0])),'Only 3 usable satellites',end='')
-        if ord(statuscode[0])==0x12:
-            print('statuscode:',hex(ord(statuscode[0])),'The chosen satellite is unusable',end='')    
-        print(' errorcode:',hex(ord(errorcode[0])))    
-            
-        #    %s'%statuscode,',%b'%errorcode)
-    if idata == (4171,):
-        #Report Packet 0x4B
-        #Machine / Code ID and Additional Status Report
-        #Byte
-        # 0 Machine ID     BYTE varies Machine ID for receiver. Values are listed in the product-specific appendices.
-        # 1 Status Flags 1 Byte 1 Bit Encoding, Status 1 Flag
-        # 2 Status Flags 2 Byte 2 Bit Encoding, Status 2 Flag
-        offset=index + 2
-        machineID= struct.unpack('>c', data[offset+0])
-        statusflag1 = struct.unpack('>c', data[offset+1])
-        statusflag2 = struct.unpack('>c', data[offset+2])
-        print('0x4B,','%x'%index,', Machine ID:',hex(ord(machineID[0])),',statusflag1:',hex(ord(statusflag1[0])),',statusflag2:',hex(ord(statusflag2[0])))
-    if idata == (4164,):
-        #Report Packet 0x44
-        #Non-Overdetermined Satellite Selection Report
-        #Table 3-10
-        # Byte #  Item Type   Value/Units  Meaning
-        # 0   Mode     BYTE   flag Non-overdetermined mode:
-        # 1-4 4SV#s    BYTE
-        # 5-8 PDOP     SINGLE PDOP Precision Dilution of Precision
-        # 9-12HDOP     SINGLE HDOP Horizontal Dilution of Precision
-        # 13-16VDOP    SINGLE VDOP Vertical Dilution of Precision
-        # 17-20TDOP    SINGLE TDOP Time Dilution of Precision
-        
-        offset=index + 2
-        mode= struct.unpack('>c', data[offset+0])
-        SV1 = struct.unpack('>c', data[offset+1])
-        SV2 = struct.unpack('>c', data[offset+2])
-        SV3 = struct.unpack('>c', data[offset+3])
-        SV4 = struct.unpack('>c', data[offset+4])
-        PDOP = struct.unpack('>f', data[offset+4:offset+8])
-        HDOP = struct.unpack('>f', data[offset+8:offset+12])
-        VDOP = struct.unpack('>f', data[offset+12:offset+16])
-        TDOP = struct.unpack('>f', data[offset+17:offset+21])
-        statusflag2 = struct.unpack('>c', data[offset+1])
-        print('0x44,','%x ,'%index, end='')
-        if ord(mode[0])==0x01:
-              print(' Mode',hex(ord(mode[0])),',Auto 1-satellite, 0D', end='')
-        if ord(mode[0])==0x03:
-              print(' Mode',hex(ord(mode[0])),',Auto 3-satellite, 2D', end='')
-        if ord(mode[0])==0x04:
-              print(' Mode',hex(ord(mode[0])),',Auto 4-satellite, 3D', end='')
-        if ord(mode[0])==0x11:
-              print(' Mode',hex(ord(mode[0])),',Manual 1-satellite, 0D', end='')
-        if ord(mode[0])==0x13:
-              print(' Mode',hex(ord(mode[0])),',Manual 3-satellite, 2D', end='')
-        if ord(mode[0])==0x14:
-              print(' Mode',hex(ord(mode[0])),',Manual 4-satellite, 3D', end='')
-                
-        print(',SV1:',ord(SV1[0]),',SV2:',ord(SV2[0]),',SV3:',ord(SV3[0]),',SV4:',ord(SV4[0]),end='') 
-        print(',PDOP:','%s'%PDOP,',HDOP:%s'%HDOP,',VDOP:%s'%VDOP,',TDOP:%s'%TDOP)
-        #print('0x44,','%x'%index,'%s'%mode,',%s'%SV1,',%s'%SV2,',%s'%SV3,',%s'%SV4)
-    if idata == (4161,):
-        #Table 3-6
-        #GPS Time
-        #Byte #ItemTypeValue/UnitsMeaning
-        #0-3TimeSINGLEsecondsGPS time of week
-        #4-5WeekINTEGERweeksGPS week number
-        #6-9OffsetSINGLEsecondsUTC/GPS time offset
-        offset=index + 2
-        seconds = struct.unpack('>f', data[offset+0:offset+4])
-        week = struct.unpack('>H', data[offset+4:offset+6])
-        #GPS Week mod1024 offset
-        week=week[0] % 1024
-        offset = struct.unpack('>f', data[offset+7:offset+11])
-        print('0x41,','%x'%index,',','Seconds,%s'%seconds,',GPSWeek,%d'%week,',Offset_Sec:,%s'%offset)    
-    if idata == (4187,): 
-        #Report Packet 0x5B
-        #Satellite Ephemeris Status Report
-        offset=index + 2
-        SVPRN = struct.unpack('>c', data[offset+0])
-        CollectionTime = struct.unpack('>f', data[offset+1:offset+5])
-        Health = struct.unpack('>c', data[offset+5])
-        IODE = struct.unpack('>c', data[offset+6])
-        toe = struct.unpack('>f', data[offset+7:offset+11])
-        FITFLAG = struct.unpack('>c', data[offset+11])
-        URA = struct.unpack('>f', data[offset+12:offset+16])
-        print('0x5B,','%x'%index,', SVPRN:',ord(SVPRN[0]),'CollectionTime:%s'%CollectionTime,',health:',hex(ord(Health[0])),'IODE:',hex(ord(IODE[0])),'toe:%s'%toe,'FITFLAG:',hex(ord(FITFLAG[0])),'URA:%s'%URA)
-        
-    if idata == (4208,):
-        #Report 0x70 does not match Reference C doc
-        offset=index + 2
-        whatever = struct.unpack('>q', data[offset+0:offset+8])
-        whatever1 = struct.unpack('>h', data[offset+8:offset+10])
-        print('0x70, %x'%index,',unknown0x70',hex(whatever[0]),hex(whatever1[0]))
+    main()